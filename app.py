@@ -1,8 +1,10 @@
 import os
 import streamlit as st
-from src.processing_pipeline import smart_file_processing
 from src.vector_db import MilvusManager
 from src.config import DATA_DIR
+from src import telemetry
+
+telemetry.configure_logging()
 
 # --- Streamlit App Configuration ---
 st.set_page_config(
@@ -20,7 +22,9 @@ st.markdown("Upload a document (`.pdf`, `.docx`, `.pptx`), and I'll answer your
 def get_milvus_manager():
     """Initializes and returns the MilvusManager instance."""
     try:
-        return MilvusManager()
+        manager = MilvusManager()
+        manager.connect()  # Surface connection errors now; the encoder still loads on the first question
+        return manager
     except Exception as e:
         st.error(f"Failed to connect to Milvus. Please ensure Milvus is running. Error: {e}")
         return None
@@ -54,6 +58,8 @@ with st.sidebar:
             
             with st.spinner(f"Processing '{uploaded_file.name}'... This may take a moment."):
                 try:
+                    from src.processing_pipeline import smart_file_processing
+
                     # Step 1: Process the file and save JSON output
                     smart_file_processing(file_path)
                     st.success("✅ Document parsing and chunking complete.")
@@ -65,6 +71,21 @@ with st.sidebar:
                 except Exception as e:
                     st.error(f"An error occurred during processing: {e}")
 
+    # --- Retrieval filters (each document is searched in its own partition) ---
+    st.header("Filters")
+    sources = st.multiselect("Documents", milvus_manager.list_sources() if milvus_manager else [],
+                             help="Only search these documents (all if none selected).")
+    first_page, last_page = st.columns(2)
+    page_min = first_page.number_input("From page", min_value=0, value=0, step=1, help="0 = first page")
+    page_max = last_page.number_input("To page", min_value=0, value=0, step=1, help="0 = last page")
+    content_type = st.radio("Content", ["Text and tables", "Text", "Tables"], horizontal=True)
+    filters = {
+        "sources": sources,
+        "page_min": int(page_min) or None,
+        "page_max": int(page_max) or None,
+        "types": {"Text": "text", "Tables": "table"}.get(content_type),
+    }
+
 # --- Main Area for Q&A ---
 st.header("2. Ask a Question")
 
@@ -80,25 +101,25 @@ else:
         if not query:
             st.warning("Please enter a question.")
         else:
-            with st.spinner("Searching for answers..."):
-                try:
-                    answer, chunks = milvus_manager.rag_answer(query)
-                    
-                    st.subheader("💡 Answer")
-                    st.markdown(answer)
-                    
-                    with st.expander("🔍 View Retrieved Chunks"):
-                        for i, chunk in enumerate(chunks, 1):
-                            st.markdown(f"---")
-                            st.markdown(f"**Chunk {i}:**")
-                            st.markdown(f"**Source:** {chunk.get('source', 'N/A')} (Page {chunk.get('page_no', 'N/A')})")
-                            st.markdown(f"**Type:** {chunk.get('type', 'N/A')}")
-                            st.markdown(f"**Similarity Score:** {chunk.get('similarity_score', 0):.4f}")
-                            st.text_area(
-                                label=f"Content of Chunk {i}",
-                                value=chunk.get('content', 'No content available.'),
-                                height=200,
-                                key=f"chunk_{i}"
-                            )
-                except Exception as e:
-                    st.error(f"An error occurred while getting the answer: {e}")
\ No newline at end of file
+            try:
+                with st.spinner("Searching for answers..."):
+                    tokens, chunks = milvus_manager.rag_answer_stream(query, filters=filters)
+
+                st.subheader("💡 Answer")
+                st.write_stream(tokens)
+
+                with st.expander("🔍 View Retrieved Chunks"):
+                    for i, chunk in enumerate(chunks, 1):
+                        st.markdown(f"---")
+                        st.markdown(f"**Chunk {i}:**")
+                        st.markdown(f"**Source:** {chunk.get('source', 'N/A')} (Page {chunk.get('page_no', 'N/A')})")
+                        st.markdown(f"**Type:** {chunk.get('type', 'N/A')}")
+                        st.markdown(f"**Similarity Score:** {chunk.get('similarity_score', 0):.4f}")
+                        st.text_area(
+                            label=f"Content of Chunk {i}",
+                            value=chunk.get('content', 'No content available.'),
+                            height=200,
+                            key=f"chunk_{i}"
+                        )
+            except Exception as e:
+                st.error(f"An error occurred while getting the answer: {e}")
\ No newline at end of file
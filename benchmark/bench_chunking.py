@@ -0,0 +1,77 @@
+"""Compares the single-pass chunker in src/text_utils.py with the previous implementation.
+
+Run from the repository root:
+    python -m benchmark.bench_chunking [text dumps...] [--repeat N]
+
+Inputs may be plain .txt files or the pipeline's text_output.json files; by default the
+committed output/ and notebook/ dumps are used.
+"""
+import json
+import time
+import argparse
+import tiktoken
+
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP
+from src.text_utils import process_text_utf8, chunking_workflow, chunking_workflow_batch
+
+DEFAULT_INPUTS = ["output/text_output.json", "notebook/text_output.json"]
+
+def legacy_chunking_workflow(text, max_tokens, overlap):
+    """The chunker as it was before the single-pass rewrite (reloads the tokenizer, encodes 3x)."""
+    def count_tokens(text):
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+    clean_text = process_text_utf8(text)
+    if not clean_text:
+        return []
+    token_count = count_tokens(clean_text)
+    if token_count <= max_tokens:
+        return [{"text": clean_text, "metadata": {}, "token_count": token_count}]
+
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    token_ids = tokenizer.encode(clean_text)
+    chunks, start = [], 0
+    while start < len(token_ids):
+        chunks.append(tokenizer.decode(token_ids[start:min(start + max_tokens, len(token_ids))]))
+        start += max_tokens - overlap
+    return [{"text": chunk, "metadata": {}, "token_count": count_tokens(chunk)} for chunk in chunks]
+
+def load_texts(paths):
+    """Loads one document text per input file."""
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                texts.append(" ".join(chunk["content"] for chunk in json.load(f)["text_chunks"]))
+            else:
+                texts.append(f.read())
+    return texts
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text chunking.")
+    parser.add_argument("inputs", nargs="*", default=DEFAULT_INPUTS, help="Text dumps (.txt or text_output.json).")
+    parser.add_argument("--repeat", type=int, default=50, help="Concatenate each dump N times to simulate large documents.")
+    args = parser.parse_args()
+
+    texts = [" ".join([text] * args.repeat) for text in load_texts(args.inputs)]
+    total_chars = sum(len(text) for text in texts)
+    print(f"📚 {len(texts)} documents, {total_chars / 1e6:.1f}M characters, chunk={CHUNK_SIZE} overlap={CHUNK_OVERLAP}")
+
+    legacy, legacy_s = timed(lambda: [legacy_chunking_workflow(t, CHUNK_SIZE, CHUNK_OVERLAP) for t in texts])
+    single, single_s = timed(lambda: [chunking_workflow(t, CHUNK_SIZE, CHUNK_OVERLAP) for t in texts])
+    batch, batch_s = timed(lambda: chunking_workflow_batch(texts, CHUNK_SIZE, CHUNK_OVERLAP))
+
+    n_chunks = sum(len(chunks) for chunks in single)
+    assert [len(c) for c in legacy] == [len(c) for c in single] == [len(c) for c in batch]
+    print(f"  legacy  : {legacy_s:7.3f}s")
+    print(f"  single  : {single_s:7.3f}s  ({legacy_s / single_s:.1f}x)")
+    print(f"  batch   : {batch_s:7.3f}s  ({legacy_s / batch_s:.1f}x)")
+    print(f"  {n_chunks} chunks, {n_chunks / batch_s:,.0f} chunks/s (batch)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Parity and throughput of the CPU encoder backends against the float32 reference model.
+
+For every backend the fixture corpus (paragraphs of benchmark/fixtures/pixtral_notes.md plus
+the committed text dumps) and the questions of benchmark/questions.json are encoded, and
+the run reports:
+  - cosine similarity between the backend's and the reference vectors (mean, p1, min),
+  - top-k agreement: the share of the reference's top-k chunks per question it also returns,
+  - recall@k of the chunk holding each answer's evidence, for the backend and the reference,
+  - throughput in texts/s, and the speedup over the reference.
+The reference is also timed with plain fixed-size batches to show what length bucketing saves.
+
+Run from the repository root:
+    python -m benchmark.bench_encoder [--backends int8 onnx] [--repeat 20] [--top-k 5] [--min-cosine 0.98]
+Exits with status 1 if a backend's mean cosine similarity is below --min-cosine.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from src.config import EMBED_BATCH_SIZE
+from src.encoders import BACKENDS, load_encoder, encoder_name
+from benchmark.run_benchmark import QUESTIONS_PATH, NOTES_PATH, BENCHMARK_DIR, _is_relevant
+from benchmark.bench_chunking import DEFAULT_INPUTS
+
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "encoder_parity.json")
+
+def load_corpus():
+    """Returns the fixture chunks: note paragraphs plus the committed text dump chunks."""
+    with open(NOTES_PATH, encoding="utf-8") as f:
+        chunks = [p.strip() for p in f.read().split("\n\n") if p.strip()]
+    for path in DEFAULT_INPUTS:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                chunks += [chunk["content"] for chunk in json.load(f)["text_chunks"] if chunk["content"].strip()]
+    return chunks
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _top_k(query_vecs, chunk_vecs, k):
+    return np.argsort(-(_normalize(query_vecs) @ _normalize(chunk_vecs).T), axis=1)[:, :k]
+
+def timed_encode(encode, texts, repeat):
+    """Returns (vectors, texts per second) over `repeat` passes."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        vectors = encode(texts)
+    return vectors, round(len(texts) * repeat / (time.perf_counter() - start), 1)
+
+def evidence_recall(ranks, chunks, questions):
+    found = [any(_is_relevant(chunks[i], q["evidence"]) for i in row) for row, q in zip(ranks, questions)]
+    return round(sum(found) / len(found), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoder backend parity and throughput.")
+    parser.add_argument("--backends", nargs="+", choices=[b for b in BACKENDS if b != "torch"], default=["int8", "onnx"])
+    parser.add_argument("--repeat", type=int, default=20, help="Timed passes over the corpus.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Fail if a backend's mean cosine falls below this.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = json.load(f)
+    chunks = load_corpus()
+    print(f"📚 {len(chunks)} chunks, {len(questions)} questions, {args.repeat} timed passes")
+
+    reference = load_encoder("torch")
+    lengths = reference.token_lengths(chunks)
+    _, fixed_rate = timed_encode(lambda texts: reference.model.encode(texts, batch_size=EMBED_BATCH_SIZE),
+                                 chunks, args.repeat)
+    ref_chunks, ref_rate = timed_encode(reference.encode, chunks, args.repeat)
+    ref_ranks = _top_k(reference.encode([q["question"] for q in questions]), ref_chunks, args.top_k)
+    results = {
+        "corpus": {"chunks": len(chunks), "questions": len(questions), "mean_tokens": round(float(np.mean(lengths)), 1),
+                   "max_tokens": int(max(lengths))},
+        "reference": {"encoder": encoder_name("torch"), "texts_per_second": ref_rate,
+                      "fixed_batches_texts_per_second": fixed_rate,
+                      f"recall@{args.top_k}": evidence_recall(ref_ranks, chunks, questions)},
+        "backends": {},
+    }
+    print(f"  torch      : {ref_rate:8.1f} texts/s ({fixed_rate:.1f} with fixed batches of {EMBED_BATCH_SIZE})")
+
+    failed = False
+    for backend in args.backends:
+        try:
+            encoder = load_encoder(backend)
+        except Exception as e:
+            print(f"  {backend:<10} : skipped ({type(e).__name__}: {e})")
+            results["backends"][backend] = {"skipped": f"{type(e).__name__}: {e}"}
+            continue
+        vectors, rate = timed_encode(encoder.encode, chunks, args.repeat)
+        cosine = (_normalize(vectors) * _normalize(ref_chunks)).sum(axis=1)
+        ranks = _top_k(encoder.encode([q["question"] for q in questions]), vectors, args.top_k)
+        agreement = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(ranks, ref_ranks)])
+        stats = {
+            "encoder": encoder_name(backend), "texts_per_second": rate, "speedup": round(rate / ref_rate, 2),
+            "cosine": {"mean": round(float(cosine.mean()), 5), "p1": round(float(np.percentile(cosine, 1)), 5),
+                       "min": round(float(cosine.min()), 5)},
+            f"top{args.top_k}_agreement": round(float(agreement), 4),
+            f"recall@{args.top_k}": evidence_recall(ranks, chunks, questions),
+        }
+        results["backends"][backend] = stats
+        failed |= stats["cosine"]["mean"] < args.min_cosine
+        print(f"  {backend:<10} : {rate:8.1f} texts/s ({stats['speedup']:.2f}x), cosine mean {stats['cosine']['mean']:.4f} "
+              f"min {stats['cosine']['min']:.4f}, top-{args.top_k} agreement {agreement:.3f}, "
+              f"recall@{args.top_k} {stats[f'recall@{args.top_k}']:.3f} vs {results['reference'][f'recall@{args.top_k}']:.3f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"💾 Results written to {args.output}")
+    if failed:
+        print(f"❌ A backend's mean cosine similarity is below {args.min_cosine}.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
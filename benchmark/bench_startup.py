@@ -0,0 +1,93 @@
+"""Measures CLI startup: an `-X importtime` breakdown and wall time to the first answer token.
+
+Runs `main.py --query` in a subprocess against the fake LLM server, so no API key is needed.
+With `--backend local` no Milvus server is needed either. Exits non-zero if a query-only
+process imported the document parsing stack.
+
+Run from the repository root:
+    python -m benchmark.bench_startup [--backend local] [--runs N] [--top N] [--query "..."]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from collections import defaultdict
+
+from src.llm import FakeGenerator
+from src.fake_llm_server import start_fake_llm_server
+
+PARSING_MODULES = ("fitz", "docx", "pptx", "gmft", "src.document_parser", "src.processing_pipeline")
+ANSWER_MARKER = "💡 Answer: "
+
+def parse_importtime(log):
+    """Returns {top-level package: cumulative microseconds} and the set of imported module names."""
+    totals, modules = defaultdict(int), set()
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        modules.add(module)
+        if name[1:2] != " ":  # Top-level import (nested imports are indented)
+            totals[module.split(".")[0]] += int(cumulative)
+    return totals, modules
+
+def run_query_once(query, backend, env):
+    """Runs one query process; returns (seconds to first token, total seconds, importtime log)."""
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-X", "importtime", "main.py", "--query", query, "--backend", backend],
+            stdout=subprocess.PIPE, stderr=stderr, env=env, text=True, encoding="utf-8", bufsize=1)
+        first_token, output = None, ""
+        while True:
+            char = proc.stdout.read(1)
+            if not char:
+                break
+            output += char
+            if first_token is None and output.endswith(ANSWER_MARKER):
+                proc.stdout.read(1)
+                first_token = time.perf_counter() - start
+        proc.wait()
+        total = time.perf_counter() - start
+        stderr.seek(0)
+        log = stderr.read()
+    if proc.returncode != 0:
+        raise RuntimeError(f"main.py exited with {proc.returncode}:\n{output[-2000:]}")
+    return first_token, total, log
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup and time to first answer.")
+    parser.add_argument("--query", default="What is Pixtral 12B?")
+    parser.add_argument("--backend", choices=["milvus", "local"], default="local")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Number of top-level imports to list.")
+    args = parser.parse_args()
+
+    server, url = start_fake_llm_server(generator=FakeGenerator())
+    env = dict(os.environ, MISTRAL_SERVER_URL=url, PYTHONIOENCODING="utf-8")
+    env.setdefault("MISTRAL_API_KEY", "fake")
+    try:
+        runs = [run_query_once(args.query, args.backend, env) for _ in range(args.runs)]
+    finally:
+        server.shutdown()
+
+    totals, modules = parse_importtime(runs[-1][2])
+    print(f"⏱ '{args.query}' on the {args.backend} backend, {args.runs} runs")
+    print(f"  first token : {statistics.median(r[0] for r in runs if r[0] is not None) * 1000:8.1f} ms (median)")
+    print(f"  total       : {statistics.median(r[1] for r in runs) * 1000:8.1f} ms (median)")
+    print(f"  imports     : {sum(totals.values()) / 1000:8.1f} ms across {len(modules)} modules")
+    for name, micros in sorted(totals.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"    {name:<32} {micros / 1000:8.1f} ms")
+
+    leaked = sorted(m for m in modules if m in PARSING_MODULES)
+    if leaked:
+        print(f"❌ Query-only process imported the parsing stack: {', '.join(leaked)}")
+        sys.exit(1)
+    print("✅ Parsing stack was not imported.")
+
+if __name__ == "__main__":
+    main()
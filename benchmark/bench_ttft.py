@@ -0,0 +1,61 @@
+"""Measures time-to-first-token of streaming vs. blocking generation against the fake LLM server.
+
+Run from the repository root (no network or API key needed):
+    python -m benchmark.bench_ttft [--runs N] [--first-token-delay S] [--token-delay S]
+"""
+import os
+import time
+import argparse
+import statistics
+
+from src.llm import FakeGenerator, MistralGenerator
+from src.fake_llm_server import start_fake_llm_server
+
+PROMPT = (
+    "You are an expert AI assistant. --- CONTEXT ---\\n"
+    "Pixtral 12B is a 12-billion-parameter multimodal language model trained to understand "
+    "both natural images and documents, released under the Apache 2.0 license."
+    "\\n\\n--- END CONTEXT ---\\n\\nQuestion: What is Pixtral 12B?\\nAnswer:"
+)
+
+def measure(generator, runs):
+    """Returns (time to first token, total time) samples for streaming and blocking calls."""
+    stream_ttft, stream_total, blocking_total = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        first = None
+        for _token in generator.stream(PROMPT):
+            if first is None:
+                first = time.perf_counter() - start
+        stream_ttft.append(first)
+        stream_total.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        generator.complete(PROMPT)
+        blocking_total.append(time.perf_counter() - start)
+    return stream_ttft, stream_total, blocking_total
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-token.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server, url = start_fake_llm_server(generator=FakeGenerator(
+        first_token_delay=args.first_token_delay, token_delay=args.token_delay))
+    os.environ.setdefault("MISTRAL_API_KEY", "fake")
+    try:
+        generator = MistralGenerator(server_url=url)
+        generator.complete(PROMPT)  # Warm up the pooled client
+        ttft, total, blocking = measure(generator, args.runs)
+    finally:
+        server.shutdown()
+
+    print(f"🤖 Fake server at {url}, {args.runs} runs")
+    print(f"  streaming TTFT     : {statistics.median(ttft) * 1000:8.1f} ms (median)")
+    print(f"  streaming total    : {statistics.median(total) * 1000:8.1f} ms (median)")
+    print(f"  blocking answer    : {statistics.median(blocking) * 1000:8.1f} ms (median)")
+
+if __name__ == "__main__":
+    main()
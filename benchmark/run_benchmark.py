@@ -0,0 +1,328 @@
+"""Retrieval-quality, latency and ingestion-throughput benchmark built on benchmark/questions.json.
+
+Runs fully offline: documents are ingested into a throwaway embedded vector store, answers
+come from the fake LLM, and every cache, manifest and store lives in a temporary workspace.
+The default corpus is a PDF generated from benchmark/fixtures/pixtral_notes.md (text pages,
+a ruled table page and a scanned page), the sample PDF in notebook/ and --distractors
+hard-negative PDFs built from the same notes; pass --pdf to benchmark real documents such
+as the Pixtral paper. Documents are ingested through the production sync pipeline.
+
+Run from the repository root:
+    python -m benchmark.run_benchmark [--pdf PATH ...] [--encoder auto|torch|int8|onnx|hashing] [--top-k 5]
+                                      [--chunk-size N] [--ocr adaptive|page] [--distractors 40] [--repeats 3]
+                                      [--output FILE] [--compare OLD_RESULTS]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import fitz
+import numpy as np
+
+from src.config import EMBEDDING_DIM, CHUNK_SIZE, CHUNK_OVERLAP, DPI, OCR_ADAPTIVE
+from src.llm import FakeGenerator
+from src import telemetry
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_PATH = os.path.join(BENCHMARK_DIR, "questions.json")
+NOTES_PATH = os.path.join(BENCHMARK_DIR, "fixtures", "pixtral_notes.md")
+SAMPLE_PDF = os.path.join(BENCHMARK_DIR, os.pardir, "notebook", "ocr_output.pdf")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+CHARTQA_TABLE = [["Model", "ChartQA", "MathVista", "MM-MT-Bench"],
+                 ["Pixtral 12B", "81.8", "58.0", "6.05"],
+                 ["Qwen-2-VL 7B", "41.2", "53.7", "5.45"],
+                 ["LLaMA-3.2 11B", "14.8", "47.9", "4.79"]]
+
+class HashingEncoder:
+    """Deterministic bag-of-words encoder for runs without the sentence-transformer weights."""
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.strip(".,;:()\"'").encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+def build_fixture_pdf(path, notes_path=NOTES_PATH, paragraphs_per_page=2):
+    """Writes the Pixtral fixture PDF: text pages, one ruled table page and one image-only page."""
+    paragraphs = [p.strip() for p in open(notes_path, encoding="utf-8").read().split("\n\n") if p.strip()]
+    doc = fitz.open()
+    for start in range(0, len(paragraphs), paragraphs_per_page):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(56, 56, 540, 790), "\n\n".join(paragraphs[start:start + paragraphs_per_page]),
+                            fontsize=11)
+
+    page = doc.new_page()
+    page.insert_text((56, 60), "Table 1: Exact-match results on multimodal benchmarks.", fontsize=11)
+    x0, y0, col_width, row_height = 56, 80, 120, 24
+    for r, row in enumerate(CHARTQA_TABLE):
+        for c, cell in enumerate(row):
+            page.insert_text((x0 + c * col_width + 6, y0 + r * row_height + 16), cell, fontsize=10)
+    for r in range(len(CHARTQA_TABLE) + 1):
+        page.draw_line((x0, y0 + r * row_height), (x0 + col_width * len(CHARTQA_TABLE[0]), y0 + r * row_height))
+    for c in range(len(CHARTQA_TABLE[0]) + 1):
+        page.draw_line((x0 + c * col_width, y0), (x0 + c * col_width, y0 + row_height * len(CHARTQA_TABLE)))
+
+    # A scanned copy of the first page: an image with no text layer, so it goes through OCR.
+    pixmap = doc[0].get_pixmap(dpi=DPI)
+    scanned = doc.new_page()
+    scanned.insert_image(scanned.rect, pixmap=pixmap)
+    doc.save(path)
+    doc.close()
+    return path
+
+def build_distractor_pdfs(directory, questions, count, notes_path=NOTES_PATH, sentences_per_page=8):
+    """Writes `count` hard-negative PDFs: the fixture's sentences that contain no evidence phrase, shuffled.
+
+    They share the fixture's vocabulary but never answer a question, so retrieval has to rank
+    the one relevant chunk above many on-topic ones.
+    """
+    text = " ".join(open(notes_path, encoding="utf-8").read().split())
+    evidence = [phrase for item in questions for phrase in item["evidence"]]
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if not any(_is_relevant(s, [phrase]) for phrase in evidence)]
+    paths = []
+    for n in range(count):
+        random.Random(n).shuffle(sentences)
+        doc = fitz.open()
+        for start in range(0, len(sentences), sentences_per_page):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(56, 56, 540, 790), " ".join(sentences[start:start + sentences_per_page]),
+                                fontsize=11)
+        paths.append(os.path.join(directory, f"distractor_{n:03d}.pdf"))
+        doc.save(paths[-1])
+        doc.close()
+    return paths
+
+def _rate(items, seconds):
+    return round(items / seconds, 2) if seconds else None
+
+STAGES = [  # (result name, telemetry stage, unit)
+    ("ocr", "ocr", "pages"), ("tables", "tables", "tables"), ("chunking", "chunking", "chunks"),
+    ("embedding", "encode", "chunks"), ("insert", "insert", "rows")]
+
+def configure_pipeline(chunk_size, chunk_overlap, adaptive_ocr):
+    """Applies the benchmark's settings to src.config; must run before the pipeline modules are imported."""
+    from src import config
+    if "src.processing_pipeline" in sys.modules:
+        raise RuntimeError("configure_pipeline() must run before src.processing_pipeline is imported")
+    config.CHUNK_SIZE, config.CHUNK_OVERLAP, config.OCR_ADAPTIVE = chunk_size, chunk_overlap, adaptive_ocr
+
+def measure_ingestion(paths, manager):
+    """Syncs `paths` into `manager`'s collections and returns per-stage throughput.
+
+    Documents go through `process_file` and `sync_document` as `main.py --sync` runs them
+    (table pre-screen, extraction cache, page-by-page streaming, background writes and
+    per-document partitions); stage times are read from the telemetry spans they record.
+    """
+    from src.manifest import DocumentManifest, file_sha256, source_name
+    from src.processing_pipeline import process_file
+
+    chunks = {"text": 0, "table": 0}
+
+    def counted(elements):
+        for element in elements:
+            chunks[element["type"]] += 1
+            yield element
+
+    manifest = DocumentManifest()
+    before = telemetry.snapshot()
+    start = time.perf_counter()
+    for path in paths:
+        source = source_name(path)
+        elements, _ = process_file(path, workers=1, keep_ocr=False, source=source)
+        manager.sync_document(source, counted(elements), manifest, content_hash=file_sha256(path), path=path)
+    manager.flush()
+    seconds = time.perf_counter() - start
+    after = telemetry.snapshot()
+
+    def stage(name, key):
+        return after["stages"].get(name, {}).get(key, 0) - before["stages"].get(name, {}).get(key, 0)
+
+    def counter(name):
+        return after["counters"].get(name, 0) - before["counters"].get(name, 0)
+
+    items = {"ocr": stage("ocr", "count"), "tables": counter("tables_detected"), "chunking": chunks["text"],
+             "embedding": counter("rows_written"), "insert": counter("rows_written")}
+    stages = {}
+    for name, span, unit in STAGES:
+        span_seconds = stage(span, "sum")
+        stages[name] = {"seconds": round(span_seconds, 4), "items": items[name], "unit": unit,
+                        "per_second": _rate(items[name], span_seconds)}
+    stages["tables"]["pages_per_second"] = _rate(stage("tables", "count"), stages["tables"]["seconds"])
+    stages["total"] = {"seconds": round(seconds, 4), "items": len(paths), "unit": "docs",
+                       "per_second": _rate(len(paths), seconds), "chunks": chunks}
+    return stages
+
+def _is_relevant(content, evidence):
+    text = " ".join(content.lower().split())
+    return all(" ".join(phrase.lower().split()) in text for phrase in evidence)
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000
+    return {"p50": round(float(np.percentile(ms, 50)), 3), "p90": round(float(np.percentile(ms, 90)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3), "mean": round(float(ms.mean()), 3), "samples": len(ms)}
+
+def measure_retrieval(manager, questions, top_k, repeats):
+    """Returns recall@k / MRR of the first chunk containing each answer, latency percentiles and context size."""
+    manager.retrieve(questions[0]["question"], top_k=top_k)  # Warm up
+    ranks, retrieve_seconds, answer_seconds = {}, [], []
+    counters_before = telemetry.snapshot()["counters"]
+    for repeat in range(repeats):
+        for item in questions:
+            start = time.perf_counter()
+            hits = manager.retrieve(item["question"], top_k=top_k)
+            retrieve_seconds.append(time.perf_counter() - start)
+            if repeat == 0:
+                ranks[item["id"]] = next((rank for rank, hit in enumerate(hits, 1)
+                                          if _is_relevant(hit.entity.get("content", ""), item["evidence"])), None)
+            start = time.perf_counter()
+            manager.rag_answer(item["question"])
+            answer_seconds.append(time.perf_counter() - start)
+
+    def quality(items):
+        found = [ranks[item["id"]] for item in items]
+        metrics = {f"recall@{k}": round(sum(1 for r in found if r and r <= k) / len(found), 4)
+                   for k in sorted({1, 3, top_k})}
+        metrics["mrr"] = round(sum(1 / r for r in found if r) / len(found), 4)
+        return metrics
+
+    counters = telemetry.snapshot()["counters"]
+    by_difficulty = {}
+    for item in questions:
+        by_difficulty.setdefault(item["difficulty"], []).append(item)
+    return {
+        "quality": quality(questions),
+        "by_difficulty": {level: quality(items) for level, items in sorted(by_difficulty.items())},
+        "ranks": ranks,
+        "latency_ms": {"retrieve": _percentiles(retrieve_seconds), "rag_answer": _percentiles(answer_seconds)},
+        "context_tokens": {name: round((counters.get(name, 0) - counters_before.get(name, 0)) / len(answer_seconds), 1)
+                           for name in ("context_tokens", "context_tokens_saved")},
+    }
+
+def make_encoder(kind):
+    """Returns (encoder, description); `kind` is auto, hashing, or an encoder backend (torch, int8, onnx)."""
+    if kind == "hashing":
+        return HashingEncoder(), "hashing"
+    from src.encoders import load_encoder, encoder_name
+    backend = "torch" if kind == "auto" else kind
+    try:
+        return load_encoder(backend), encoder_name(backend)
+    except Exception as e:
+        if kind != "auto":
+            raise
+        print(f"⚠️ Sentence transformer unavailable ({type(e).__name__}); using the hashing encoder.")
+        return HashingEncoder(), "hashing"
+
+def compare(old, new):
+    """Prints the change of headline metrics between two result files."""
+    def flatten(results):
+        flat = {f"retrieval.{k}": v for k, v in results["retrieval"]["quality"].items()}
+        for name, stats in results["retrieval"]["latency_ms"].items():
+            flat.update({f"latency.{name}.{p}": stats.get(p) for p in ("p50", "p90", "p99")})
+        flat.update({f"ingest.{name}.per_second": stage["per_second"] for name, stage in results["ingestion"].items()})
+        flat.update({f"prompt.{name}_per_query": v for name, v in results["retrieval"].get("context_tokens", {}).items()})
+        return flat
+
+    before, after = flatten(old), flatten(new)
+    print("\n📐 Change vs. previous results:")
+    for key in sorted(after):
+        a, b = before.get(key), after[key]
+        if a is None or b is None:
+            print(f"  {key:<34} {a!s:>10} -> {b!s:>10}")
+        else:
+            print(f"  {key:<34} {a:>10} -> {b:>10} ({(b - a) / a * 100 if a else 0:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval and ingestion benchmark.")
+    parser.add_argument("--pdf", action="append", help="PDF to ingest (repeatable); defaults to the bundled fixtures.")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--encoder", choices=["auto", "torch", "int8", "onnx", "hashing"], default="auto")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Tokens per text chunk.")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--ocr", choices=["adaptive", "page"], default="adaptive" if OCR_ADAPTIVE else "page",
+                        help="Region-level adaptive OCR or whole pages at DPI.")
+    parser.add_argument("--distractors", type=int, default=40,
+                        help="Hard-negative documents added to the default corpus.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the question set.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", metavar="OLD_RESULTS", help="Results JSON of an earlier run to diff against.")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = json.load(f)
+    output = os.path.abspath(args.output)
+    previous = os.path.abspath(args.compare) if args.compare else None
+    workspace = tempfile.mkdtemp(prefix="rag-bench-")
+    distractors = 0 if args.pdf else args.distractors
+    pdfs = [os.path.abspath(p) for p in args.pdf] if args.pdf else \
+        [build_fixture_pdf(os.path.join(workspace, "pixtral_fixture.pdf")), os.path.abspath(SAMPLE_PDF),
+         *build_distractor_pdfs(workspace, questions, distractors)]
+
+    cwd = os.getcwd()
+    os.chdir(workspace)  # Relative cache, store and manifest paths now point into the workspace
+    try:
+        configure_pipeline(args.chunk_size, args.chunk_overlap, args.ocr == "adaptive")
+        from src.vector_db import MilvusManager
+
+        encoder, encoder_name = make_encoder(args.encoder)
+        manager = MilvusManager(generator=FakeGenerator(), backend="local", encoder=encoder)
+        manager.answer_cache = None  # Time the full pipeline on every pass
+        print(f"📥 Ingesting {len(pdfs)} documents...")
+        ingestion = measure_ingestion(pdfs, manager)
+        print(f"🔎 Running {len(questions)} questions x {args.repeats} passes...")
+        retrieval = measure_retrieval(manager, questions, args.top_k, args.repeats)
+        manager.store.flush()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    results = {
+        "meta": {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "encoder": encoder_name,
+                 "top_k": args.top_k, "repeats": args.repeats, "questions": len(questions),
+                 "documents": [os.path.basename(p) for p in pdfs[:len(pdfs) - distractors]],
+                 "distractors": distractors, "chunk_size": args.chunk_size,
+                 "chunk_overlap": args.chunk_overlap, "ocr": args.ocr, "python": platform.python_version(), "platform": platform.platform()},
+        "ingestion": ingestion,
+        "retrieval": retrieval,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    print("\n" + "=" * 50)
+    print("📊 Retrieval: " + ", ".join(f"{k} {v:.3f}" for k, v in retrieval["quality"].items()))
+    for name, stats in retrieval["latency_ms"].items():
+        print(f"  {name:<11}: p50 {stats['p50']:.2f} ms, p90 {stats['p90']:.2f} ms, p99 {stats['p99']:.2f} ms")
+    context = retrieval["context_tokens"]
+    print(f"  {'context':<11}: {context['context_tokens']:.0f} prompt tokens/query ({context['context_tokens_saved']:.0f} saved by packing)")
+    print("🏭 Ingestion:")
+    for name, stage in ingestion.items():
+        rate = f"{stage['per_second']} {stage['unit']}/s" if stage["per_second"] is not None else "n/a"
+        print(f"  {name:<10}: {stage['items']:>5} {stage['unit']:<7} {rate}")
+    print(f"💾 Results written to {output}")
+    print("=" * 50)
+
+    if previous:
+        with open(previous, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,67 @@
 import os
 import argparse
-from src.processing_pipeline import smart_file_processing
-from src.vector_db import MilvusManager
-from src.config import DATA_DIR
+import logging
+import contextlib
+from src.config import DATA_DIR, PDF_WORKERS, VECTOR_BACKEND, SERVER_HOST, SERVER_PORT, LOG_LEVEL
+from src import telemetry
 
 
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
+logger = logging.getLogger(__name__)
 
-def run_processing(file_name):
+def run_processing(file_name, workers=PDF_WORKERS, backend=VECTOR_BACKEND):
     """Runs the document processing and ingestion pipeline."""
+    from src.processing_pipeline import smart_file_processing
+    from src.vector_db import MilvusManager
+
     input_file_path = os.path.join(DATA_DIR, file_name)
     
     # Step 1: Process the file and save JSON output
-    smart_file_processing(input_file_path)
+    smart_file_processing(input_file_path, workers=workers)
     
     # Step 2: Initialize Milvus and ingest the data
-    milvus_manager = MilvusManager()
+    milvus_manager = MilvusManager(backend=backend)
     milvus_manager.ingest_data()
 
-def run_query(query):
-    """Asks a question to the RAG system."""
+def run_resume(backend=VECTOR_BACKEND):
+    """Resumes ingesting the existing processed output after an interrupted run."""
+    from src.vector_db import MilvusManager
+
+    milvus_manager = MilvusManager(backend=backend)
+    milvus_manager.ingest_data(resume=True)
+
+def run_sync(directory, workers=PDF_WORKERS, backend=VECTOR_BACKEND):
+    """Reconciles the vector store with every document in a directory."""
+    from src.sync import sync_directory
+    from src.vector_db import MilvusManager
+
+    milvus_manager = MilvusManager(backend=backend)
+    sync_directory(directory, milvus_manager, workers=workers)
+
+def run_batch(inputs, backend=VECTOR_BACKEND):
+    """Ingests every document in a directory or glob with the pipelined batch ingestor."""
+    from src.batch_ingest import BatchIngestor
+    from src.vector_db import MilvusManager
+
+    BatchIngestor(MilvusManager(backend=backend)).run(inputs)
+
+def run_query(query, backend=VECTOR_BACKEND, filters=None):
+    """Asks a question to the RAG system, optionally restricting retrieval with `filters`."""
     if not query:
-        print("❌ Please provide a query with the --query flag.")
+        logger.error("❌ Please provide a query with the --query flag.")
         return
 
-    milvus_manager = MilvusManager()
-    answer, chunks = milvus_manager.rag_answer(query)
+    from src.vector_db import MilvusManager
+
+    milvus_manager = MilvusManager(backend=backend)
+    tokens, chunks = milvus_manager.rag_answer_stream(query, filters=filters)
 
     print("\\n" + "-"*50)
     print(f"❓ Query: {query}")
-    print(f"💡 Answer: {answer}")
+    print("💡 Answer: ", end="", flush=True)
+    for token in tokens:
+        print(token, end="", flush=True)
+    print()
     print("\\n🔍 Retrieved Chunks:")
     for i, chunk in enumerate(chunks, 1):
         print(f"\\nChunk {i}:")
@@ -39,16 +71,75 @@ def run_query(query):
         print(f"  Content: {chunk['content'][:200]}...")
     print("-"*50)
 
+def page_range(value):
+    """Parses "5" or "3-7" (either end may be left open, e.g. "3-") into (page_min, page_max)."""
+    first, dash, last = value.partition("-")
+    try:
+        page_min = int(first) if first else None
+        page_max = (int(last) if last else None) if dash else page_min
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid page range: {value!r}")
+    return page_min, page_max
+
+def run_tune_index(backend=VECTOR_BACKEND):
+    """Rebuilds outgrown vector indexes and re-tunes their search parameters."""
+    from src.vector_db import MilvusManager
+
+    MilvusManager(backend=backend).tune_indexes()
+
+def run_serve(host, port, socket_path=None, backend=VECTOR_BACKEND):
+    """Serves retrieval and answers from one warm process, micro-batching concurrent queries."""
+    from src.server import run_server
+    from src.vector_db import MilvusManager
+
+    run_server(MilvusManager(backend=backend), host=host, port=port, socket_path=socket_path)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Document Processing and RAG Pipeline.")
     parser.add_argument("--process", type=str, help="Name of the file in the 'data' folder to process and ingest.")
     parser.add_argument("--query", type=str, help="A question to ask the RAG system.")
+    parser.add_argument("--batch", type=str, metavar="DIR_OR_GLOB", help="Ingest many documents with overlapping parse/embed/insert stages.")
+    parser.add_argument("--sync", type=str, metavar="DIR", help="Ingest new/changed documents in DIR and delete removed ones.")
+    parser.add_argument("--resume", action="store_true", help="Resume ingesting the existing output from the last checkpoint.")
+    parser.add_argument("--serve", action="store_true", help="Run a long-lived retrieval/answer server.")
+    parser.add_argument("--host", default=SERVER_HOST, help="Host for --serve.")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Port for --serve.")
+    parser.add_argument("--socket", type=str, metavar="PATH", help="Serve on a Unix socket instead of TCP.")
+    parser.add_argument("--tune-index", action="store_true", help="Re-select vector indexes for the current collection sizes and re-tune nprobe/ef.")
+    parser.add_argument("--backend", choices=["milvus", "local"], default=VECTOR_BACKEND, help="Vector store: a Milvus server or the embedded local store.")
+    parser.add_argument("--workers", type=int, default=PDF_WORKERS, help="Number of processes used to extract PDF pages in parallel.")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"], type=str.upper, help="DEBUG also logs every timed stage.")
+    parser.add_argument("--telemetry", type=str, metavar="FILE", help="Append one JSON line per timed stage to FILE.")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="Expose Prometheus metrics on PORT while running.")
+    parser.add_argument("--profile", type=str, metavar="FILE", help="Write sampled call stacks (collapsed, flame-graph ready) to FILE.")
+    parser.add_argument("--source", action="append", metavar="NAME", help="Only retrieve from this document (repeatable).")
+    parser.add_argument("--pages", type=page_range, metavar="N|FROM-TO", help="Only retrieve from these pages, e.g. 3-7.")
+    parser.add_argument("--type", choices=["text", "table"], help="Only retrieve text chunks or only tables.")
 
     args = parser.parse_args()
+    telemetry.configure_logging(args.log_level)
+    if args.telemetry:
+        telemetry.configure(args.telemetry)
+    if args.metrics_port:
+        telemetry.start_metrics_server(args.metrics_port)
 
-    if args.process:
-        run_processing(args.process)
-    elif args.query:
-        run_query(args.query)
-    else:
-        print("Please specify an action: --process <filename> or --query \"<your question>\"")
\ No newline at end of file
+    with telemetry.SamplingProfiler(args.profile) if args.profile else contextlib.nullcontext():
+        if args.process:
+            run_processing(args.process, workers=args.workers, backend=args.backend)
+        elif args.batch:
+            run_batch(args.batch, backend=args.backend)
+        elif args.sync:
+            run_sync(args.sync, workers=args.workers, backend=args.backend)
+        elif args.resume:
+            run_resume(backend=args.backend)
+        elif args.tune_index:
+            run_tune_index(backend=args.backend)
+        elif args.serve:
+            run_serve(args.host, args.port, socket_path=args.socket, backend=args.backend)
+        elif args.query:
+            page_min, page_max = args.pages or (None, None)
+            filters = {"sources": args.source, "page_min": page_min, "page_max": page_max, "types": args.type}
+            run_query(args.query, backend=args.backend, filters=filters)
+        else:
+            print("Please specify an action: --process <filename> or --query \"<your question>\"")
+    telemetry.log_summary(logging.DEBUG if args.query or args.serve else logging.INFO)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from src.config import ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_SIZE, ANSWER_CACHE_SIMILARITY
+
+def normalize_query(query):
+    """Lowercases a query and collapses whitespace and trailing punctuation."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+class AnswerCache:
+    """In-memory LRU cache of generated answers with exact and near-duplicate query matching.
+
+    Entries are keyed by the normalized query *and* the IDs of the retrieved context chunks,
+    so an answer is only reused when retrieval returns exactly the same context. Chunk IDs are
+    hashes of the document and chunk content (see `chunk_primary_key`), so re-ingesting an
+    unchanged document keeps its answers; an answer stops matching once a retrieved chunk's
+    content changes or it is deleted, because retrieval then returns a different ID set.
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_size=ANSWER_CACHE_MAX_SIZE, similarity=ANSWER_CACHE_SIMILARITY):
+        self.ttl, self.max_size, self.similarity = ttl, max_size, similarity
+        self.exact_hits, self.semantic_hits, self.misses, self.evictions = 0, 0, 0, 0
+        self._entries = OrderedDict()  # (normalized query, context ids) -> (answer, unit query vector, expiry)
+        self._by_context = {}  # context ids -> set of entry keys, for near-duplicate lookups
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_context.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys: del self._by_context[key[1]]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry and entry[2] < now:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, query, query_vec, context_ids):
+        """Returns a cached answer for this query and context, or None."""
+        context_ids = tuple(context_ids)
+        key, now = (normalize_query(query), context_ids), time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+
+            candidates = [k for k in self._by_context.get(context_ids, ()) if self._live(k, now)]
+            if candidates:
+                scores = np.stack([self._entries[k][1] for k in candidates]) @ self._unit(query_vec)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    self._entries.move_to_end(candidates[best])
+                    self.semantic_hits += 1
+                    return self._entries[candidates[best]][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, query, query_vec, context_ids, answer):
+        """Stores an answer for this query and context, evicting the least recently used entry if full."""
+        context_ids = tuple(context_ids)
+        key = (normalize_query(query), context_ids)
+        with self._lock:
+            self._entries[key] = (answer, self._unit(query_vec), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self._by_context.setdefault(context_ids, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+
+    def stats(self):
+        """Returns hit/miss counters."""
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits, "semantic_hits": self.semantic_hits, "misses": self.misses,
+            "evictions": self.evictions, "size": len(self._entries), "hit_rate": hits / lookups if lookups else 0.0,
+        }
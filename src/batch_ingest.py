@@ -0,0 +1,178 @@
+import os
+import glob
+import time
+import shutil
+import logging
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from src.config import (
+    SUPPORTED_EXTENSIONS, BATCH_OUTPUT_DIR, BATCH_PARSE_WORKERS, BATCH_PARSE_QUEUE_SIZE, BATCH_INSERT_QUEUE_SIZE
+)
+from src.manifest import DocumentManifest, file_sha256, source_name
+from src.processing_pipeline import process_file, save_processed_output, output_paths
+from src.sync import find_documents
+from src.vector_db import BackgroundWriter
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+def resolve_inputs(inputs):
+    """Expands a directory or glob pattern into the supported documents it matches."""
+    if os.path.isdir(inputs):
+        return find_documents(inputs)
+    return sorted(p for p in glob.glob(inputs, recursive=True) if p.lower().endswith(SUPPORTED_EXTENSIONS))
+
+def input_root(inputs):
+    """The directory documents matched by `inputs` are named relative to: the directory itself,
+    or a glob's leading part without wildcards."""
+    if os.path.isdir(inputs):
+        return inputs
+    parts = []
+    for part in inputs.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return "/".join(parts) or "."
+
+def document_output_dir(path, root=BATCH_OUTPUT_DIR):
+    """Returns an output directory unique to `path`, so concurrent documents never share files."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(root, f"{stem}-{hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]}")
+
+def parse_document(path, output_dir, correlation_id=None, source=None):
+    """Process-pool task: parses one document into JSONL files in its own output directory.
+
+    Elements are written page by page as they are parsed. The worker's metrics are
+    returned under "telemetry" for the parent to merge.
+    """
+    start = time.perf_counter()
+    with telemetry.correlation(correlation_id):
+        result = process_file(path, workers=1, source=source)
+        if result is None:
+            return None
+        elements, ocr_doc = result
+        try:
+            count = save_processed_output(elements, ocr_doc, output_dir=output_dir, output_format="jsonl")
+            pages = len(ocr_doc) if ocr_doc else 0
+        finally:
+            if ocr_doc: ocr_doc.close()
+    paths = output_paths(output_dir)
+    return {
+        "output_dir": output_dir, "text_path": paths["text_jsonl"], "tables_path": paths["tables_jsonl"],
+        "elements": count, "ocr_pages": pages, "seconds": time.perf_counter() - start,
+        "telemetry": telemetry.snapshot(reset=True),
+    }
+
+class BatchIngestor:
+    """Ingests many documents with parse -> embed -> insert running as overlapping stages.
+
+    Parsing (OCR, table detection, chunking) runs on a process pool; parsed documents wait
+    in a bounded queue for the embedding stage, which uses the manager's single warm encoder
+    in the calling thread; embedded batches wait in a bounded queue for one insert thread.
+    """
+
+    def __init__(self, milvus_manager, parse_workers=BATCH_PARSE_WORKERS,
+                 parse_queue_size=BATCH_PARSE_QUEUE_SIZE, insert_queue_size=BATCH_INSERT_QUEUE_SIZE):
+        self.manager = milvus_manager
+        self.parse_workers = parse_workers
+        self.parse_queue_size = parse_queue_size
+        self.insert_queue_size = insert_queue_size
+
+    def run(self, inputs):
+        """Ingests every document matched by `inputs` (a directory or glob) and returns run statistics."""
+        paths = resolve_inputs(inputs)
+        root = input_root(inputs)
+        self.manager.connect()  # May drop manifest entries of recreated collections; load the manifest after it.
+        manifest = DocumentManifest()
+        stats = {"documents": len(paths), "ingested": 0, "skipped": 0, "failed": 0, "parse_seconds": 0.0,
+                 "embed_seconds": 0.0, "chunks": 0, "max_parsed_waiting": 0}
+        logger.info("📚 Batch ingesting %d documents with %d parse workers", len(paths), self.parse_workers)
+
+        todo = []
+        for path in paths:
+            content_hash, source = file_sha256(path), source_name(path, root)
+            if manifest.content_hash(source) == content_hash:
+                stats["skipped"] += 1
+            else:
+                todo.append((path, source, content_hash))
+
+        writer = BackgroundWriter(depth=self.insert_queue_size)
+        start = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+                queued = iter(todo)
+                in_flight = {}
+
+                def refill():
+                    # Parsing may run ahead of embedding by at most parse_queue_size documents.
+                    while len(in_flight) < self.parse_workers + self.parse_queue_size:
+                        item = next(queued, None)
+                        if item is None: return
+                        path, source, content_hash = item
+                        correlation_id = f"doc-{hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]}"
+                        future = pool.submit(parse_document, path, document_output_dir(path), correlation_id, source)
+                        in_flight[future] = (path, source, content_hash, correlation_id)
+
+                refill()
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        # Parsed documents waiting for the embedding stage, this one included
+                        waiting = sum(1 for queued_future in in_flight if queued_future.done())
+                        stats["max_parsed_waiting"] = max(stats["max_parsed_waiting"], waiting)
+                        path, source, content_hash, correlation_id = in_flight.pop(future)
+                        refill()
+                        with telemetry.correlation(correlation_id):
+                            self._embed_document(future, path, source, content_hash, manifest, writer, stats)
+                        self._report_progress(stats, writer, len(in_flight), time.perf_counter() - start)
+        finally:
+            writer.close()
+
+        self.manager.flush()
+        stats.update({"seconds": time.perf_counter() - start, "rows_inserted": writer.rows_written,
+                      "insert_seconds": writer.busy_seconds, "max_insert_queued": writer.max_queued})
+        self._report_summary(stats)
+        return stats
+
+    def _embed_document(self, future, path, source, content_hash, manifest, writer, stats):
+        """Embedding stage for one parsed document; its writes are queued on `writer`."""
+        try:
+            parsed = future.result()
+        except Exception as e:
+            logger.error("❌ Failed to parse '%s': %s", path, e)
+            stats["failed"] += 1
+            return
+        if parsed is None:
+            stats["failed"] += 1
+            return
+
+        telemetry.merge(parsed.get("telemetry"))
+        stats["parse_seconds"] += parsed["seconds"]
+        embed_start = time.perf_counter()
+        stats["chunks"] += self.manager.ingest_output(
+            source, parsed["text_path"], parsed["tables_path"], manifest, writer,
+            content_hash=content_hash, path=path)
+        stats["embed_seconds"] += time.perf_counter() - embed_start
+        stats["ingested"] += 1
+        # The JSONL outputs have been read in full; only the queued rows remain, in memory.
+        shutil.rmtree(parsed["output_dir"], ignore_errors=True)
+
+    def _report_progress(self, stats, writer, parsing, elapsed):
+        done = stats["ingested"] + stats["failed"]
+        remaining = stats["documents"] - stats["skipped"]
+        logger.info("📈 [%d/%d] %.2f docs/s, %.1f chunks/s | parsing %d, insert queue %d/%d", done, remaining,
+                    done / elapsed, stats["chunks"] / elapsed, parsing, writer.queued(), self.insert_queue_size)
+
+    def _report_summary(self, stats):
+        def rate(count, seconds):
+            return count / seconds if seconds else 0.0
+
+        logger.info("📊 Batch ingestion: %d ingested, %d unchanged, %d failed in %.1fs",
+                    stats["ingested"], stats["skipped"], stats["failed"], stats["seconds"])
+        logger.info("  - parse : %.2f docs/s per worker (%d workers), up to %d parsed docs waiting",
+                    rate(stats["ingested"], stats["parse_seconds"]), self.parse_workers, stats["max_parsed_waiting"])
+        logger.info("  - embed : %d chunks, %.1f chunks/s", stats["chunks"], rate(stats["chunks"], stats["embed_seconds"]))
+        logger.info("  - insert: %d rows, %.1f rows/s, queue peak %d/%d", stats["rows_inserted"],
+                    rate(stats["rows_inserted"], stats["insert_seconds"]), stats["max_insert_queued"], self.insert_queue_size)
+        logger.info("  - overall: %.2f docs/s", rate(stats["ingested"], stats["seconds"]))
@@ -6,23 +6,138 @@ TESSERACT_PATH = os.path.join(os.getcwd(), ".venv", "Tesseract-OCR", "tesseract.
 os.environ["TESSERACT_PATH"] = TESSERACT_PATH
 
 # Document Processing Configuration
-DPI = 250  # Image resolution for OCR processing.
+DPI = 250  # Image resolution for whole-page OCR (OCR_ADAPTIVE = False).
 MIN_PAGE_CHARS = 10 # Minimum characters on a page to be considered searchable.
+PDF_WORKERS = 1  # Number of processes used to extract PDF pages in parallel (1 = serial).
+
+# Adaptive OCR Configuration (only text-bearing regions are OCR'd, each at a DPI fitted to its glyph size)
+OCR_ADAPTIVE = True  # False OCRs whole pages at DPI.
+OCR_MIXED_PAGES = True  # Also OCR large images, away from text-layer words, on pages that have a text layer.
+OCR_DETECT_DPI = 72  # Resolution of the grayscale rendering used to find text regions.
+OCR_INK_THRESHOLD = 160  # Gray levels below this count as ink.
+OCR_TARGET_LINE_PX = 32  # Height, in pixels, a region's median text line is rendered at for OCR.
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 400
+OCR_REGION_GAP_PT = 12  # Blank space (in points) that separates two regions.
+OCR_REGION_PADDING_PT = 4  # Margin added around each region before OCR.
+OCR_MIN_REGION_PT = 6  # Regions smaller than this in both directions are specks.
+OCR_MAX_INK_DENSITY = 0.6  # Regions with more ink than this are pictures, not text.
+OCR_MAX_REGIONS = 8  # Closest regions are merged beyond this, as every OCR call has a start-up cost.
+OCR_MIN_IMAGE_FRACTION = 0.02  # On pages with a text layer, smaller images are not searched for text.
+OCR_WORKERS = min(4, os.cpu_count() or 1)  # Processes recognizing the regions of a page concurrently.
+
+# Table Pre-screen Configuration (pages failing both checks skip gmft table detection)
+TABLE_PRESCREEN_ENABLED = True
+TABLE_MIN_RULING_LINES = 6  # Horizontal/vertical lines (rectangles count as 4) that suggest a table.
+TABLE_MIN_GRID_ROWS = 3  # Text rows with several separated cells that suggest a table.
+TABLE_MIN_GRID_COLUMNS = 3  # Cells a text row needs to count as a grid row.
+TABLE_MIN_CELL_GAP = 12  # Horizontal gap (in points) between words that separates two cells.
+
+# Extraction Cache Configuration
+EXTRACTION_CACHE_ENABLED = True  # Reuse OCR/table results for pages that were already processed.
+EXTRACTION_CACHE_DIR = os.path.join(".cache", "extraction")
+EXTRACTION_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used pages are evicted above this size.
+EXTRACTION_CACHE_LOW_WATER = 0.9  # Eviction frees space down to this fraction of the cap, so it runs rarely.
+EXTRACTION_CACHE_VERSION = 3  # Bump when the page extraction output format changes.
 
 # Chunking Configuration
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 100
+TABLE_CHUNK_TOKENS = 512  # Tables larger than this are split into row groups that each repeat the header.
+TABLE_REASSEMBLE_MAX_TOKENS = 2048  # A retrieved row group is replaced by its full table in prompts up to this size.
+
+# Context Packing Configuration (retrieved hits are merged, deduplicated and trimmed before prompting)
+CONTEXT_PACKING_ENABLED = True
+CONTEXT_MAX_TOKENS = 2048  # Token budget of the prompt context, counted with the chunking tokenizer.
+CONTEXT_TABLE_MAX_TOKENS = 512  # Larger tables are cut to the rows and columns that share terms with the question.
+CONTEXT_MIN_OVERLAP_CHARS = 32  # Shortest shared text that merges two chunks (and shortest sentence deduplicated).
+CONTEXT_MIN_BLOCK_TOKENS = 64  # A block that does not fit is truncated only if at least this much budget remains.
+
+# Vector Store Configuration
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "milvus")  # "milvus" (server) or "local" (embedded store in LOCAL_STORE_DIR, no server needed).
+LOCAL_STORE_DIR = os.path.join(".cache", "vector_store")
+LOCAL_STORE_DTYPE = "float32"  # "float16" halves the embedded store's vector files.
+LOCAL_IVF_MIN_ROWS = 20_000  # Below this the embedded store searches exactly instead of using IVF lists.
+LOCAL_IVF_MAX_NLIST = 4096  # Upper bound on the embedded store's IVF lists, whatever the index asks for.
+LOCAL_IVF_MAX_TRAIN_ROWS = 262_144  # Rows sampled to train the IVF centroids (at most 39 per list).
+
+# Vector Index Configuration (index type and search parameters are chosen from the collection size)
+INDEX_TARGET_RECALL = 0.95  # Recall@k, relative to an exhaustive search, that tuned nprobe/ef must reach.
+INDEX_LATENCY_BUDGET_MS = 20.0  # p95 single-query search latency that tuned nprobe/ef must stay within.
+INDEX_MEMORY_BUDGET_GB = 4.0  # Index types estimated to need more are skipped in favour of quantized ones.
+INDEX_FLAT_MAX_ROWS = 50_000  # Collections up to this size are searched exactly (FLAT).
+INDEX_HNSW_MAX_ROWS = 2_000_000  # Above this, HNSW is not considered (graph build time).
+INDEX_TUNING_QUERIES = 64  # Stored vectors sampled as held-out queries when tuning.
+INDEX_TUNING_PATH = os.path.join(".cache", "index_tuning.json")
+INDEX_SERVING_MARKER = os.path.join(".cache", "serving.pid")  # Present while a query server runs; indexes are not rebuilt then.
+
+# Partitioning and Filter Configuration (each source document gets its own partition)
+PARTITION_BY_SOURCE = True  # Searches filtered by source only scan those partitions; deleting a document drops its partition.
+MAX_PARTITIONS = 1000  # Per collection (Milvus allows 1024 by default); further documents share the default partition.
+SCALAR_INDEX_FIELDS = ("source", "page_no", "type")  # Fields given an INVERTED index for filtered search.
 
 # Milvus Configuration
 MILVUS_HOST = "localhost"
 MILVUS_PORT = "19530"
 TEXT_COLLECTION_NAME = "textcollections"
 TABLE_COLLECTION_NAME = "tablecollections"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 EMBEDDING_DIM = 384 # Based on the 'all-MiniLM-L6-v2' model.
+EMBED_BATCH_SIZE = 64  # Chunks per forward pass of an injected encoder (the built-in backends batch by ENCODER_BATCH_TOKENS).
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")  # "torch" (float32 reference), "int8" (quantized PyTorch) or "onnx" (ONNX Runtime).
+ENCODER_ONNX_FILE = "onnx/model_quint8_avx2.onnx"  # Export in the model repository used by the "onnx" backend ("" = float32 export).
+ENCODER_THREADS = 0  # CPU threads for encoder inference (0 = all cores).
+ENCODER_BATCH_TOKENS = 8192  # Padded tokens per forward pass; inputs are batched by token length.
+INSERT_BATCH_SIZE = 1024  # Rows encoded and sent to Milvus per insert call.
+
+# Batch Ingestion Configuration
+BATCH_PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Processes parsing documents concurrently.
+BATCH_PARSE_QUEUE_SIZE = 4  # Parsed documents allowed to wait for the embedding stage.
+BATCH_INSERT_QUEUE_SIZE = 4  # Embedded batches allowed to wait for the insert thread.
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_ENABLED = True  # Reuse embeddings of chunks and queries that were encoded before.
+EMBEDDING_CACHE_DIR = os.path.join(".cache", "embeddings")
+EMBEDDING_CACHE_CAPACITY = 500_000  # Maximum cached vectors; least recently used ones are overwritten.
+EMBEDDING_CACHE_DTYPE = "float32"  # Storage precision of cached vectors; "float16" halves the file but rounds cache hits.
+
+# LLM Configuration
+LLM_MODEL = "mistral-small-latest"
+LLM_TEMPERATURE = 0.1
+
+# Answer Cache Configuration
+ANSWER_CACHE_ENABLED = True  # Reuse LLM answers for repeated questions over the same retrieved context.
+ANSWER_CACHE_TTL = 3600  # Seconds before a cached answer expires.
+ANSWER_CACHE_MAX_SIZE = 1024  # Maximum cached answers; least recently used ones are evicted.
+ANSWER_CACHE_SIMILARITY = 0.95  # Cosine similarity above which a rephrased question reuses an answer.
+
+# Query Server Configuration
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_BATCH_WINDOW = 0.005  # Seconds an idle server waits to gather concurrent queries into one batch.
+SERVER_MAX_BATCH = 64  # Queries encoded and searched together at most.
+SERVER_MAX_CONCURRENCY = 64  # Requests processed at once; further requests wait.
+SERVER_MAX_PENDING = 1024  # Requests processed or waiting; beyond this the server answers 503.
+SERVER_GENERATION_WORKERS = 8  # Threads running concurrent LLM calls.
+
+# Telemetry Configuration
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+TELEMETRY_JSONL = os.environ.get("TELEMETRY_JSONL", "")  # One JSON line per timed stage is appended here ("" disables).
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples when the sampling profiler is on.
 
 # File Paths
 DATA_DIR = "data"
 OUTPUT_DIR = "output"
 OCR_OUTPUT_PDF = os.path.join(OUTPUT_DIR, "ocr_output.pdf")
 TEXT_OUTPUT_JSON = os.path.join(OUTPUT_DIR, "text_output.json")
-TABLES_OUTPUT_JSON = os.path.join(OUTPUT_DIR, "tables_output.json")
\ No newline at end of file
+TABLES_OUTPUT_JSON = os.path.join(OUTPUT_DIR, "tables_output.json")
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")  # Ingested documents and their chunk IDs.
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".pptx")
+BATCH_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "batch")  # Per-document outputs of batch ingestion.
+
+# Intermediate Output Format
+OUTPUT_FORMAT = "jsonl"  # "jsonl" (streamed, one element per line) or "json" (single document).
+OUTPUT_COMPRESSION = ""  # "", ".gz" or ".zst" (requires the 'zstandard' package) for JSONL outputs.
+TEXT_OUTPUT_JSONL = os.path.join(OUTPUT_DIR, "text_output.jsonl" + OUTPUT_COMPRESSION)
+TABLES_OUTPUT_JSONL = os.path.join(OUTPUT_DIR, "tables_output.jsonl" + OUTPUT_COMPRESSION)
+INGEST_CHECKPOINT = os.path.join(OUTPUT_DIR, "ingest_checkpoint.json")
\ No newline at end of file
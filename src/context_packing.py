@@ -0,0 +1,201 @@
+"""Token-budgeted packing of retrieved hits into the answer prompt's context.
+
+Neighbouring text chunks share CHUNK_OVERLAP tokens and tables can be large, so before
+prompting the context blocks are:
+  1. merged when two text blocks of the same source overlap or one contains the other,
+  2. stripped of sentences that a higher-ranked block already contains,
+  3. for tables over CONTEXT_TABLE_MAX_TOKENS, cut to the rows and columns sharing terms with the question,
+  4. added in rank order up to CONTEXT_MAX_TOKENS; the first block that does not fit is
+     truncated (text at a sentence boundary, tables by rows) if enough budget remains.
+Tokens are counted with the chunking tokenizer.
+"""
+import re
+
+from src.config import CONTEXT_MAX_TOKENS, CONTEXT_TABLE_MAX_TOKENS, CONTEXT_MIN_OVERLAP_CHARS, CONTEXT_MIN_BLOCK_TOKENS
+from src.table_utils import render_table
+from src.text_utils import count_tokens, get_tokenizer
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "the a an and or of to in on for with by from at as is are was were be been what which who whom how why when "
+    "where does do did this that these those it its their there than then into about over under between".split()
+)
+
+def query_terms(query):
+    """Lower-cased content words of `query`."""
+    return {word for word in _WORD.findall(query.lower()) if len(word) > 1 and word not in STOPWORDS}
+
+def _omitted_note(count):
+    return f"({count} more rows omitted)"
+
+def render_block(block):
+    """Returns a context block as prompt text."""
+    if "table" not in block:
+        return block["text"]
+    text = render_table(block["table"])
+    omitted = block.get("omitted_rows", 0)
+    return f"{text}\n{_omitted_note(omitted)}" if omitted else text
+
+def _overlap(a, b, min_chars):
+    """Length of the longest suffix of `a` that is also a prefix of `b`; 0 if shorter than `min_chars`."""
+    anchor = b[:min_chars]
+    if len(anchor) < min_chars:
+        return 0
+    start = a.find(anchor)
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(anchor, start + 1)
+    return 0
+
+def merge_text(a, b, min_chars=CONTEXT_MIN_OVERLAP_CHARS):
+    """Joins two chunks cut from the same text, in either order; None if they do not overlap."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    if overlap := _overlap(a, b, min_chars):
+        return a + b[overlap:]
+    if overlap := _overlap(b, a, min_chars):
+        return b + a[overlap:]
+    return None
+
+def merge_overlapping(blocks, min_chars=CONTEXT_MIN_OVERLAP_CHARS):
+    """Merges overlapping text blocks of the same source into the higher-ranked one, until none overlap."""
+    merged = [dict(block) for block in blocks]
+    changed = True
+    while changed:
+        changed, kept = False, []
+        for block in merged:
+            target = None
+            if "text" in block:
+                for other in kept:
+                    if "text" in other and other["source"] == block["source"]:
+                        joined = merge_text(other["text"], block["text"], min_chars)
+                        if joined is not None:
+                            target, other["text"] = other, joined
+                            other["page_no"] = min(other["page_no"], block["page_no"])
+                            break
+            if target is None:
+                kept.append(block)
+            else:
+                changed = True
+        merged = kept
+    return merged
+
+def drop_repeated_sentences(blocks, min_chars=CONTEXT_MIN_OVERLAP_CHARS):
+    """Removes sentences (of at least `min_chars`) from text blocks when an earlier block has them."""
+    seen, kept = set(), []
+    for block in blocks:
+        if "text" in block:
+            sentences = []
+            for sentence in _SENTENCE_END.split(block["text"]):
+                key = " ".join(sentence.lower().split())
+                if len(key) >= min_chars and key in seen:
+                    continue
+                seen.add(key)
+                sentences.append(sentence)
+            block = dict(block, text=" ".join(sentences).strip())
+            if not block["text"]:
+                continue
+        kept.append(block)
+    return kept
+
+def compact_table_for_query(table, terms, max_tokens=CONTEXT_TABLE_MAX_TOKENS, omitted=0):
+    """Cuts a compact table to at most about `max_tokens` tokens, keeping what is relevant to `terms`.
+
+    Rows sharing a term with the query are kept (all rows if none does); columns named in the
+    query are kept along with the first (label) column (all columns if none is named); columns
+    empty in every kept row are dropped. Rows, the first one included, are only kept while the
+    budget allows, so the result may have none. `omitted` rows were already left out of `table`.
+    The "more rows omitted" note is counted against the budget whenever rows are left out.
+    Returns (table, number of relevant rows left out including `omitted`).
+    """
+    if count_tokens(render_block({"table": table, "omitted_rows": omitted})) <= max_tokens:
+        return table, omitted
+
+    def relevant(value):
+        return bool(terms & set(_WORD.findall(str(value).lower())))
+
+    rows = [row for row in table["rows"] if any(relevant(value) for value in row)] or table["rows"]
+    named = [i for i, column in enumerate(table["columns"]) if i and relevant(column)]
+    columns = [0, *named] if named else list(range(len(table["columns"])))
+    columns = [i for i in columns if i == 0 or any(i < len(row) and row[i] != "" for row in rows)]
+
+    def pick(row):
+        return [row[i] if i < len(row) else "" for i in columns]
+
+    header = [table["columns"][i] for i in columns]
+
+    def fill(budget):
+        used, kept = count_tokens(" | ".join(header)), []
+        for row in rows:
+            row = pick(row)
+            row_tokens = count_tokens(" | ".join(str(value) for value in row)) + 1
+            if used + row_tokens > budget:
+                break
+            kept.append(row)
+            used += row_tokens
+        return kept
+
+    kept = fill(max_tokens)
+    if omitted or len(kept) < len(rows):
+        # Rows are left out, so make room for the note; its count can only be this large.
+        kept = fill(max_tokens - count_tokens(_omitted_note(len(rows) + omitted)) - 1)
+    return {"columns": header, "rows": kept}, len(rows) - len(kept) + omitted
+
+def truncate_text(text, max_tokens):
+    """Cuts `text` to `max_tokens` tokens, at the last sentence end if that keeps at least half of it."""
+    tokenizer = get_tokenizer()
+    token_ids = tokenizer.encode(text)
+    if len(token_ids) <= max_tokens:
+        return text
+    cut = tokenizer.decode(token_ids[:max_tokens])
+    end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    return cut[:end + 1] if end >= len(cut) // 2 else cut
+
+def _fit(block, budget, terms):
+    if "table" in block:
+        table, omitted = compact_table_for_query(block["table"], terms, budget, block.get("omitted_rows", 0))
+        return dict(block, table=table, omitted_rows=omitted) if table["rows"] else None
+    return dict(block, text=truncate_text(block["text"], budget))
+
+def pack_context(query, blocks, max_tokens=CONTEXT_MAX_TOKENS, table_max_tokens=CONTEXT_TABLE_MAX_TOKENS,
+                 min_overlap_chars=CONTEXT_MIN_OVERLAP_CHARS, tokens_in=None):
+    """Packs ranked context `blocks` into at most `max_tokens` tokens.
+
+    Each block is a dict with `source`, `page_no`, `type` and either `text` or `table` (compact
+    form), best first. Returns (prompt texts of the packed blocks, stats), where stats has
+    `blocks_in`, `blocks_out`, `tokens_in`, `tokens_out` and `tokens_saved`. `tokens_in` is
+    what the retrieved chunks came to before tables were reassembled (pass it in); by default
+    `blocks` rendered as is.
+    """
+    terms = query_terms(query)
+    if tokens_in is None:
+        tokens_in = sum(count_tokens(render_block(block)) for block in blocks)
+    candidates = drop_repeated_sentences(merge_overlapping(blocks, min_overlap_chars), min_overlap_chars)
+
+    packed, used = [], 0
+    for block in candidates:
+        if "table" in block:
+            table, omitted = compact_table_for_query(block["table"], terms, table_max_tokens)
+            if not table["rows"]:
+                continue
+            block = dict(block, table=table, omitted_rows=omitted)
+        text = render_block(block)
+        tokens = count_tokens(text)
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used
+            block = _fit(block, remaining, terms) if remaining >= CONTEXT_MIN_BLOCK_TOKENS else None
+            if block is None:
+                continue
+            text = render_block(block)
+            tokens = count_tokens(text)
+        packed.append(text)
+        used += tokens
+        if used >= max_tokens:
+            break
+    stats = {"blocks_in": len(blocks), "blocks_out": len(packed), "tokens_in": tokens_in, "tokens_out": used,
+             "tokens_saved": max(tokens_in - used, 0)}
+    return packed, stats
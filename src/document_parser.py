@@ -1,50 +1,108 @@
-import fitz  # PyMuPDF
-from docx import Document
-from pptx import Presentation
-from gmft.auto import AutoTableDetector, AutoTableFormatter
-from gmft.pdf_bindings import PyPDFium2Document
+import collections
+import functools
 
-from src.config import DPI, MIN_PAGE_CHARS
+from src.config import (
+    DPI, MIN_PAGE_CHARS, OCR_ADAPTIVE, OCR_MIXED_PAGES, TABLE_MIN_RULING_LINES, TABLE_MIN_GRID_ROWS, TABLE_MIN_GRID_COLUMNS, TABLE_MIN_CELL_GAP
+)
+from src.ocr import ocr_page_bytes
 from src.text_utils import uniquify_columns
+from src import telemetry
 
-# Initialize detectors
-detector = AutoTableDetector()
-formatter = AutoTableFormatter()
+@functools.lru_cache(maxsize=1)
+def get_table_models():
+    """Returns the gmft (detector, formatter) pair, loading the models on first use."""
+    from gmft.auto import AutoTableDetector, AutoTableFormatter
+    return AutoTableDetector(), AutoTableFormatter()
 
 def is_page_searchable(page, min_chars=MIN_PAGE_CHARS):
     """Checks if a PDF page contains a minimum number of characters."""
     return len(page.get_text().strip()) >= min_chars
 
-def process_ocr(page, dpi=DPI):
-    """Performs OCR on a PDF page if it's not searchable."""
-    pix = page.get_pixmap(dpi=dpi)
-    ocr_pdf_bytes = pix.pdfocr_tobytes()
-    return fitz.open("pdf", ocr_pdf_bytes)
+def process_ocr_bytes(page, dpi=DPI, adaptive=OCR_ADAPTIVE):
+    """Performs OCR on a PDF page and returns the searchable single-page PDF as bytes.
 
-def extract_tables_from_pdf_source(pdf_source, page_number):
-    """Extracts tables from a given PDF source."""
-    doc = PyPDFium2Document(pdf_source)
+    Adaptive OCR (src/ocr.py) only recognizes the page's text regions; otherwise, and for
+    rotated pages, the whole page is rendered at `dpi`.
+    """
+    if adaptive and not page.rotation:
+        return ocr_page_bytes(page)
+    with telemetry.span("ocr", page=page.number, dpi=dpi):
+        pix = page.get_pixmap(dpi=dpi)
+        ocr_pdf = pix.pdfocr_tobytes()
+    telemetry.count("pages_ocr")
+    return ocr_pdf
+
+def ocr_if_needed(page, adaptive=OCR_ADAPTIVE):
+    """Returns the OCR'd single-page PDF of `page` as bytes, or None if its text layer suffices.
+
+    Pages below MIN_PAGE_CHARS are OCR'd. With adaptive OCR and OCR_MIXED_PAGES, large images
+    on pages that do have a text layer are searched for text too.
+    """
+    if not is_page_searchable(page):
+        return process_ocr_bytes(page, adaptive=adaptive)
+    if adaptive and OCR_MIXED_PAGES and not page.rotation:
+        return ocr_page_bytes(page, images_only=True)
+    return None
+
+def may_contain_tables(page, min_rulings=TABLE_MIN_RULING_LINES, min_grid_rows=TABLE_MIN_GRID_ROWS,
+                       min_grid_columns=TABLE_MIN_GRID_COLUMNS, min_cell_gap=TABLE_MIN_CELL_GAP):
+    """Cheap PyMuPDF pre-screen: True if a page has ruling lines or column-aligned text rows.
+
+    Pages for which this returns False are not sent to the gmft table detector.
+    """
+    rulings = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "l" and (abs(item[1].y - item[2].y) < 1 or abs(item[1].x - item[2].x) < 1):
+                rulings += 1
+            elif item[0] == "re":
+                rulings += 4 if min(item[1].width, item[1].height) > 1 else 1
+        if rulings >= min_rulings:
+            return True
+
+    rows = collections.defaultdict(list)
+    for x0, y0, x1, y1, *_ in page.get_text("words"):
+        rows[round(y1 / 3)].append((x0, x1))
+    grid_rows = 0
+    for words in rows.values():
+        words.sort()
+        cells = 1 + sum(1 for (_, prev_x1), (x0, _) in zip(words, words[1:]) if x0 - prev_x1 >= min_cell_gap)
+        if cells >= min_grid_columns:
+            grid_rows += 1
+            if grid_rows >= min_grid_rows:
+                return True
+    return False
+
+def open_table_document(pdf_source):
+    """Opens a PDF path or bytes with pdfium for table detection."""
+    from gmft.pdf_bindings import PyPDFium2Document
+    return PyPDFium2Document(pdf_source)
+
+def extract_tables_from_pdfium_page(doc, page_number):
+    """Extracts tables from one page of an already opened pdfium document."""
+    detector, formatter = get_table_models()
     tables = []
-    try:
+    with telemetry.span("tables", page=page_number) as attrs:
         page = doc[page_number]
         for cropped in detector.extract(page):
             formatted = formatter.extract(cropped, margin="auto", padding=None)
             df = formatted.df()
             tables.append((cropped.bbox, df))
-    finally:
-        doc.close()
+        attrs["tables"] = len(tables)
+    telemetry.count("tables_detected", len(tables))
     return tables
 
-def extract_tables_from_fitz_doc(fitz_doc, page_number):
-    """Extracts tables from a fitz document object."""
-    single_page_doc = fitz.open()
-    single_page_doc.insert_pdf(fitz_doc, from_page=page_number, to_page=page_number)
-    pdf_bytes = single_page_doc.tobytes()
-    single_page_doc.close()
-    return extract_tables_from_pdf_source(pdf_bytes, 0)
+def extract_tables_from_pdf_source(pdf_source, page_number):
+    """Extracts tables from a given PDF source."""
+    doc = open_table_document(pdf_source)
+    try:
+        return extract_tables_from_pdfium_page(doc, page_number)
+    finally:
+        doc.close()
 
 def extract_text_and_tables_from_docx(path):
     """Extracts text and tables from a .docx file."""
+    from docx import Document
     doc = Document(path)
     text = [para.text.strip() for para in doc.paragraphs if para.text.strip()]
     tables = []
@@ -55,6 +113,7 @@ def extract_text_and_tables_from_docx(path):
 
 def extract_text_and_tables_from_pptx(path):
     """Extracts text and tables from a .pptx file."""
+    from pptx import Presentation
     prs = Presentation(path)
     text, tables = [], []
     for slide in prs.slides:
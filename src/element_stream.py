@@ -0,0 +1,92 @@
+import io
+import os
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for .zst outputs
+    zstandard = None
+
+def open_stream(path, mode="rt"):
+    """Opens a JSONL file for text I/O, (de)compressing based on the `.gz` / `.zst` suffix."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("Reading or writing .zst outputs requires the 'zstandard' package.")
+        raw = open(path, mode.replace("t", "") + "b")
+        if "r" in mode:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class ElementWriter:
+    """Appends elements to a newline-delimited JSON file, one element per line."""
+
+    def __init__(self, path, append=False):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.count = 0
+        self._file = open_stream(path, "at" if append else "wt")
+
+    def write(self, element):
+        self._file.write(json.dumps(element, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_elements(path, start_line=0):
+    """Lazily yields the elements of a JSONL file, skipping the first `start_line` lines."""
+    with open_stream(path, "rt") as f:
+        for line_no, line in enumerate(f):
+            if line_no >= start_line and line.strip():
+                yield json.loads(line)
+
+class IngestCheckpoint:
+    """Remembers how many lines of each JSONL file have been ingested, so a crashed run can resume.
+
+    Offsets are tied to the file's size and mtime; a regenerated file starts again from line 0.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._state = {}
+
+    @staticmethod
+    def _signature(data_path):
+        stat = os.stat(data_path)
+        return [stat.st_size, stat.st_mtime]
+
+    def get(self, data_path):
+        """Returns the number of lines of `data_path` already ingested."""
+        entry = self._state.get(data_path)
+        if not entry or not os.path.exists(data_path) or entry["signature"] != self._signature(data_path):
+            return 0
+        return entry["lines"]
+
+    def set(self, data_path, lines):
+        """Records that the first `lines` lines of `data_path` are ingested."""
+        self._state[data_path] = {"lines": lines, "signature": self._signature(data_path)}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self._state = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
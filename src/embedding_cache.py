@@ -0,0 +1,122 @@
+import os
+import re
+import weakref
+import hashlib
+import threading
+import numpy as np
+
+from src.config import (
+    EMBEDDING_DIM, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_CAPACITY, EMBEDDING_CACHE_DTYPE
+)
+
+# Raw void bytes: an "S16" field would strip digests that happen to end in NUL.
+INDEX_DTYPE = np.dtype([("digest", "V16"), ("last_used", "<i8")])
+
+class EmbeddingCache:
+    """Fixed-capacity, memory-mapped cache of embeddings keyed by (model name, content hash).
+
+    Vectors live in a raw `<capacity> x <dim>` memmap and the slot index (16-byte content
+    digest plus a last-used tick per slot) in a `.npy` memmap next to it, so both files are
+    updated in place and reopened without deserialisation. When the cache is full the least
+    recently used slots are overwritten. The files are shared by every process using the
+    model, so a slot is only trusted if the index still holds the looked-up digest there.
+    """
+
+    def __init__(self, model_name, dim=EMBEDDING_DIM, cache_dir=EMBEDDING_CACHE_DIR,
+                 capacity=EMBEDDING_CACHE_CAPACITY, dtype=EMBEDDING_CACHE_DTYPE):
+        self.model_name = model_name
+        self.dim, self.capacity, self.dtype = dim, capacity, np.dtype(dtype)
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        base = os.path.join(cache_dir, f"{slug}-{dim}-{self.dtype.name}-{capacity}")
+        vectors_path, index_path = base + ".vectors", base + ".index.npy"
+
+        exists = os.path.exists(vectors_path) and os.path.exists(index_path)
+        if exists:
+            self.index = np.load(index_path, mmap_mode="r+")
+            if self.index.dtype != INDEX_DTYPE:
+                # Index written by an older layout; start the cache over.
+                del self.index
+                exists = False
+        self.vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r+" if exists else "w+", shape=(capacity, dim))
+        if not exists:
+            self.index = np.lib.format.open_memmap(index_path, mode="w+", dtype=INDEX_DTYPE, shape=(capacity,))
+
+        used = np.flatnonzero(self.index["last_used"] > 0)
+        self._slots = {d.tobytes(): int(i) for d, i in zip(self.index["digest"][used], used)}
+        self._clock = int(self.index["last_used"].max(initial=0))
+        # Flushes at exit without keeping the cache alive (the maps, not `self`, are referenced).
+        weakref.finalize(self, self._flush_maps, self.vectors, self.index)
+
+    def _digest(self, text):
+        return hashlib.blake2b(f"{self.model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def _allocate(self, count):
+        """Returns `count` free or least recently used slots, dropping their old entries."""
+        slots = np.argpartition(self.index["last_used"], count - 1)[:count] if count < self.capacity else np.arange(self.capacity)
+        for slot in slots:
+            if self.index["last_used"][slot] > 0:
+                self._slots.pop(self.index["digest"][slot].tobytes(), None)
+                self.evictions += 1
+        return slots
+
+    def encode(self, encoder, texts, **encode_kwargs):
+        """Encodes `texts` with `encoder`, only running the model on cache misses.
+
+        Returns a float32 array of shape (len(texts), dim) in input order. Fresh vectors are
+        returned as encoded; with a float16 cache dtype, later hits return them rounded.
+        """
+        with self._lock:
+            digests = [self._digest(text) for text in texts]
+            out = np.empty((len(texts), self.dim), dtype=np.float32)
+            missing = {}
+            self._clock += 1
+            for i, digest in enumerate(digests):
+                slot = self._slots.get(digest)
+                if slot is not None and self.index["digest"][slot].tobytes() != digest:
+                    # Another process evicted and reused the slot since it was mapped here.
+                    del self._slots[digest]
+                    slot = None
+                if slot is None:
+                    missing.setdefault(digest, []).append(i)
+                    continue
+                out[i] = self.vectors[slot].astype(np.float32)
+                self.index["last_used"][slot] = self._clock
+            missed_rows = sum(len(rows) for rows in missing.values())
+            self.hits += len(texts) - missed_rows
+            self.misses += missed_rows
+
+            if missing:
+                first_rows = [rows[0] for rows in missing.values()]
+                encoded = encoder.encode([texts[i] for i in first_rows], convert_to_numpy=True, **encode_kwargs)
+                for rows, vector in zip(missing.values(), encoded):
+                    out[rows] = np.asarray(vector, dtype=np.float32)
+                # Only cache what fits; a batch larger than the cache keeps its most recent rows.
+                keep = list(missing.items())[-self.capacity:]
+                slots = self._allocate(len(keep))
+                for slot, (digest, rows) in zip(slots, keep):
+                    self.vectors[slot] = out[rows[0]]
+                    self.index[slot] = (digest, self._clock)
+                    self._slots[digest] = int(slot)
+            return out
+
+    def flush(self):
+        """Writes pending vector and index pages to disk."""
+        with self._lock:
+            self._flush_maps(self.vectors, self.index)
+
+    @staticmethod
+    def _flush_maps(vectors, index):
+        vectors.flush()
+        index.flush()
+
+    def stats(self):
+        """Returns hit/miss/eviction counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "entries": len(self._slots), "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
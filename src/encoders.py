@@ -0,0 +1,99 @@
+"""CPU sentence-embedding backends behind the encoder used by MilvusManager.
+
+    torch  the reference SentenceTransformer in float32 PyTorch
+    int8   the same model with its Linear layers dynamically quantized to int8 (PyTorch)
+    onnx   an ONNX export of the model run by ONNX Runtime (needs `optimum[onnxruntime]`);
+           ENCODER_ONNX_FILE selects the export, by default the int8-quantized one
+
+Every backend is wrapped in a BucketedEncoder, which groups inputs of similar token length
+into batches under a padded-token budget, so short chunks are never padded to the length of
+a long one and batches of short chunks can be larger.
+"""
+import os
+import logging
+import numpy as np
+
+from src.config import (
+    EMBEDDING_MODEL, ENCODER_BACKEND, ENCODER_ONNX_FILE, ENCODER_THREADS, ENCODER_BATCH_TOKENS
+)
+
+BACKENDS = ("torch", "int8", "onnx")
+MAX_BATCH_TEXTS = 1024  # Upper bound on texts per forward pass, however short they are.
+
+logger = logging.getLogger(__name__)
+
+def encoder_name(backend=ENCODER_BACKEND, model_name=EMBEDDING_MODEL):
+    """Name identifying the vectors a backend produces, e.g. for the embedding cache."""
+    return model_name if backend == "torch" else f"{model_name}+{backend}"
+
+def load_model(backend=ENCODER_BACKEND, model_name=EMBEDDING_MODEL, threads=ENCODER_THREADS, onnx_file=ENCODER_ONNX_FILE):
+    """Loads the SentenceTransformer for `backend`, running on `threads` CPU threads (0 = all cores)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend!r} (expected one of {', '.join(BACKENDS)})")
+    from sentence_transformers import SentenceTransformer
+    threads = threads or os.cpu_count() or 1
+
+    if backend == "onnx":
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        model_kwargs = {"session_options": options, "provider": "CPUExecutionProvider"}
+        if onnx_file:
+            model_kwargs["file_name"] = onnx_file
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    import torch
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+class BucketedEncoder:
+    """Encodes with a SentenceTransformer in token-length-sorted batches.
+
+    Inputs are sorted by token count and cut into batches whose padded size (texts x longest
+    text) stays within `max_batch_tokens`. Vectors come back in input order as float32, whatever
+    precision the backend computes in, since the collections and caches expect float32.
+    """
+
+    def __init__(self, model, name=EMBEDDING_MODEL, max_batch_tokens=ENCODER_BATCH_TOKENS):
+        self.model = model
+        self.name = name
+        self.max_batch_tokens = max_batch_tokens
+        self.max_seq_length = model.max_seq_length or 512
+        self.dim = model.get_sentence_embedding_dimension()
+
+    def token_lengths(self, texts):
+        """Token counts of `texts` as the model sees them (special tokens included, truncated)."""
+        encoded = self.model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=self.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def batches(self, lengths):
+        """Yields lists of input positions, shortest texts first, each within the padded-token budget."""
+        batch = []
+        for i in np.argsort(lengths, kind="stable"):
+            # Sorted ascending, so the text being added is the longest of its batch.
+            if batch and ((len(batch) + 1) * lengths[i] > self.max_batch_tokens or len(batch) >= MAX_BATCH_TEXTS):
+                yield batch
+                batch = []
+            batch.append(int(i))
+        if batch:
+            yield batch
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, **kwargs):
+        """Returns an array of shape (len(texts), dim). `batch_size` is ignored; batches follow the token budget."""
+        texts = list(texts)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        kwargs.setdefault("show_progress_bar", False)
+        for batch in self.batches(self.token_lengths(texts)):
+            vectors = self.model.encode([texts[i] for i in batch], batch_size=len(batch), convert_to_numpy=True, **kwargs)
+            out[batch] = np.asarray(vectors, dtype=np.float32)
+        return out
+
+def load_encoder(backend=ENCODER_BACKEND, model_name=EMBEDDING_MODEL, **kwargs):
+    """Loads `backend` wrapped in a BucketedEncoder."""
+    logger.info("🤖 Loading sentence transformer model '%s' (%s backend)...", model_name, backend)
+    return BucketedEncoder(load_model(backend, model_name, **kwargs), name=encoder_name(backend, model_name))
@@ -0,0 +1,189 @@
+import os
+import json
+import hashlib
+from importlib import metadata
+
+from src.config import (
+    DPI, MIN_PAGE_CHARS, OCR_ADAPTIVE, OCR_MIXED_PAGES, OCR_DETECT_DPI, OCR_INK_THRESHOLD, OCR_TARGET_LINE_PX,
+    OCR_MIN_DPI, OCR_MAX_DPI, OCR_REGION_GAP_PT, OCR_REGION_PADDING_PT, OCR_MIN_REGION_PT, OCR_MAX_INK_DENSITY,
+    OCR_MAX_REGIONS, OCR_MIN_IMAGE_FRACTION, EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_BYTES, EXTRACTION_CACHE_VERSION,
+    EXTRACTION_CACHE_LOW_WATER, TABLE_PRESCREEN_ENABLED, TABLE_MIN_RULING_LINES, TABLE_MIN_GRID_ROWS, TABLE_MIN_GRID_COLUMNS,
+    TABLE_MIN_CELL_GAP
+)
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def extraction_settings():
+    """Returns the settings that change the output of page extraction."""
+    return {
+        "dpi": DPI, "min_page_chars": MIN_PAGE_CHARS, "cache_version": EXTRACTION_CACHE_VERSION,
+        "adaptive_ocr": OCR_ADAPTIVE and [
+            OCR_MIXED_PAGES, OCR_DETECT_DPI, OCR_INK_THRESHOLD, OCR_TARGET_LINE_PX, OCR_MIN_DPI, OCR_MAX_DPI,
+            OCR_REGION_GAP_PT, OCR_REGION_PADDING_PT, OCR_MIN_REGION_PT, OCR_MAX_INK_DENSITY, OCR_MAX_REGIONS,
+            OCR_MIN_IMAGE_FRACTION],
+        "gmft": _package_version("gmft"), "pymupdf": _package_version("PyMuPDF"),
+        "table_prescreen": TABLE_PRESCREEN_ENABLED and [
+            TABLE_MIN_RULING_LINES, TABLE_MIN_GRID_ROWS, TABLE_MIN_GRID_COLUMNS, TABLE_MIN_CELL_GAP],
+    }
+
+def page_fingerprint(doc, page_number):
+    """Hashes everything that determines what a page renders and extracts to.
+
+    This covers the page geometry, its content stream and the raw streams of the images,
+    form XObjects and fonts it references, so identical pages match across documents.
+    """
+    page = doc[page_number]
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.rect), page.rotation)).encode())
+    digest.update(page.read_contents())
+    xrefs = [img[0] for img in page.get_images(full=True)]
+    xrefs += [xobj[0] for xobj in page.get_xobjects()]
+    xrefs += [font[0] for font in page.get_fonts(full=True)]
+    for xref in xrefs:
+        if xref > 0:
+            digest.update(doc.xref_stream_raw(xref) or doc.xref_object(xref).encode())
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """On-disk LRU cache of per-page extraction results (text blocks, tables and OCR page).
+
+    Entries are keyed by the page fingerprint plus `extraction_settings()`, so changing DPI,
+    MIN_PAGE_CHARS or the detector version never serves stale results. Recency is tracked via
+    file mtimes. The total size is kept in a small index file shared by every process using the
+    cache; once it exceeds `max_bytes`, the least recently used entries are evicted down to
+    `low_water` of the cap, which is the only time the cache directory is walked.
+    """
+
+    SIZE_FILE = "size.json"
+
+    def __init__(self, cache_dir=EXTRACTION_CACHE_DIR, max_bytes=EXTRACTION_CACHE_MAX_BYTES,
+                 low_water=EXTRACTION_CACHE_LOW_WATER):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits, self.misses, self.bytes_saved = 0, 0, 0
+        self._settings = json.dumps(extraction_settings(), sort_keys=True).encode()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def page_key(self, doc, page_number):
+        """Returns the cache key of a page under the current extraction settings."""
+        return hashlib.sha256(page_fingerprint(doc, page_number).encode() + self._settings).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + ".json", base + ".pdf"
+
+    def has(self, key):
+        """True if `key` is cached (it may still be evicted before `get`)."""
+        return os.path.exists(self._paths(key)[0])
+
+    def get(self, key):
+        """Returns the cached page result for `key`, or None on a miss."""
+        json_path, pdf_path = self._paths(key)
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            result["ocr_pdf"] = None
+            if result.pop("has_ocr_pdf", False):
+                with open(pdf_path, "rb") as f:
+                    result["ocr_pdf"] = f.read()
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        for path in (json_path, pdf_path):
+            if os.path.exists(path):
+                os.utime(path)  # Mark as recently used
+                self.bytes_saved += os.path.getsize(path)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Stores a page result and evicts old entries if the cache is over its size cap."""
+        json_path, pdf_path = self._paths(key)
+        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        size = self._read_size()
+        if result["ocr_pdf"]:
+            size += self._write_atomic(pdf_path, result["ocr_pdf"])
+        entry = {k: v for k, v in result.items() if k != "ocr_pdf"}
+        entry["has_ocr_pdf"] = bool(result["ocr_pdf"])
+        size += self._write_atomic(json_path, json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            self._evict()
+        else:
+            self._write_size(size)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _read_size(self):
+        """Total cached bytes from the index file; measured by walking the cache if it is missing.
+
+        Concurrent writers may lose each other's updates, which only delays eviction; eviction
+        measures the real size again.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, self.SIZE_FILE), "r", encoding="utf-8") as f:
+                return int(json.load(f)["bytes"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            size = sum(size for _, size, _ in self._entries())
+            self._write_size(size)
+            return size
+
+    def _write_size(self, size):
+        self._write_atomic(os.path.join(self.cache_dir, self.SIZE_FILE), json.dumps({"bytes": size}).encode())
+
+    def _entries(self):
+        """Yields (mtime, size, paths) for every entry in the cache directory.
+
+        An entry is a page's .json file plus its .pdf, if any; its mtime is that of its newest file.
+        """
+        entries = {}
+        for root, _, files in os.walk(self.cache_dir):
+            if root == self.cache_dir:
+                continue  # Only the size index lives at the top level
+            for name in files:
+                base, ext = os.path.splitext(name)
+                if ext not in (".json", ".pdf"):
+                    continue  # Another process's temporary file
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                mtime, size, paths = entries.get(os.path.join(root, base), (0.0, 0, []))
+                entries[os.path.join(root, base)] = (max(mtime, stat.st_mtime), size + stat.st_size, paths + [path])
+        yield from entries.values()
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits in `low_water` of `max_bytes`."""
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, entry_size, paths in entries:
+            if size <= target:
+                break
+            for path in sorted(paths, key=lambda p: not p.endswith(".json")):  # .json first, so `has` turns false
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            size -= entry_size
+        self._write_size(size)
+
+    def stats(self):
+        """Returns hit/miss counters for this cache instance."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
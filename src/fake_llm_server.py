@@ -0,0 +1,94 @@
+"""A local stand-in for the Mistral chat completions API, for offline tests and benchmarks.
+
+Start it and point the pipeline at it:
+    python -m src.fake_llm_server --port 8765
+    MISTRAL_SERVER_URL=http://127.0.0.1:8765 MISTRAL_API_KEY=fake python main.py --query "..."
+
+Answers echo the start of the prompt's context, one word per streamed chunk, with
+configurable first-token and per-token latency so time-to-first-token can be measured.
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.llm import FakeGenerator
+
+class FakeMistralHandler(BaseHTTPRequestHandler):
+    generator = FakeGenerator()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"message": f"Unknown path {self.path}"})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = request["messages"][-1]["content"]
+        model = request.get("model", "fake")
+        completion_id = uuid.uuid4().hex
+        created = int(time.time())
+
+        if not request.get("stream"):
+            answer = self.generator.complete(prompt)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(answer.split()),
+                          "total_tokens": len(prompt.split()) + len(answer.split())},
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for token in self.generator.stream(prompt):
+            send_chunk({"role": "assistant", "content": token})
+        send_chunk({"content": ""}, finish_reason="stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+def start_fake_llm_server(host="127.0.0.1", port=0, generator=None):
+    """Starts the fake server on a background thread and returns (server, base_url)."""
+    handler = type("Handler", (FakeMistralHandler,), {"generator": generator or FakeGenerator()})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Mistral chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between tokens.")
+    args = parser.parse_args()
+
+    server, url = start_fake_llm_server(args.host, args.port, FakeGenerator(
+        first_token_delay=args.first_token_delay, token_delay=args.token_delay))
+    print(f"🤖 Fake Mistral server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,243 @@
+"""Size-aware vector index selection and search-parameter tuning.
+
+The index type follows the collection size: exact FLAT search for small collections, HNSW
+while its graph fits the memory budget, then IVF_FLAT, IVF_SQ8 and finally IVF_PQ, whichever
+is the first to fit INDEX_MEMORY_BUDGET_GB. Indexes are rebuilt when a growing collection
+crosses into a different choice. After a (re)build, `nprobe` / `ef` are tuned on a sample of
+stored vectors used as held-out queries: the smallest value whose recall@k against an
+exhaustive search reaches INDEX_TARGET_RECALL within INDEX_LATENCY_BUDGET_MS (p95) is kept.
+Tuned parameters are stored in INDEX_TUNING_PATH, so they survive restarts.
+Rebuilding drops the old index, so it is refused while a query server is running (see `serving`).
+"""
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+import numpy as np
+
+from src.config import (
+    EMBEDDING_DIM, INDEX_TARGET_RECALL, INDEX_LATENCY_BUDGET_MS, INDEX_MEMORY_BUDGET_GB, INDEX_FLAT_MAX_ROWS,
+    INDEX_HNSW_MAX_ROWS, INDEX_TUNING_QUERIES, INDEX_TUNING_PATH, INDEX_SERVING_MARKER
+)
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_PARAMS = {"FLAT": {}, "HNSW": {"ef": 64}, "IVF": {"nprobe": 16}}
+RETUNE_GROWTH = 2.0  # Search parameters are re-tuned once a collection grows by this factor.
+
+def _family(index_type):
+    return "IVF" if index_type.startswith("IVF") else index_type
+
+def _nlist(num_rows):
+    """Number of IVF lists: a power of two near 4 * sqrt(rows), between 128 and 65536."""
+    return int(min(65536, max(128, 2 ** round(np.log2(4 * np.sqrt(max(num_rows, 1)))))))
+
+def _pq_segments(dim):
+    """Largest divisor of `dim` that gives PQ sub-vectors of at least 8 dimensions."""
+    return max(m for m in range(1, dim // 8 + 1) if dim % m == 0)
+
+def estimate_memory(index_type, num_rows, dim=EMBEDDING_DIM, params=None):
+    """Rough resident size of an index in bytes (vectors plus index structures)."""
+    params = params or {}
+    if index_type == "HNSW":
+        return num_rows * (dim * 4 + params.get("M", 16) * 2 * 8)
+    if index_type == "IVF_SQ8":
+        return num_rows * dim + params.get("nlist", 0) * dim * 4
+    if index_type == "IVF_PQ":
+        return num_rows * params.get("m", _pq_segments(dim)) + params.get("nlist", 0) * dim * 4
+    return num_rows * dim * 4 + params.get("nlist", 0) * dim * 4
+
+def choose_index(num_rows, dim=EMBEDDING_DIM, target_recall=INDEX_TARGET_RECALL, memory_budget_gb=INDEX_MEMORY_BUDGET_GB):
+    """Returns Milvus index parameters suited to a collection of `num_rows` vectors."""
+    if num_rows <= INDEX_FLAT_MAX_ROWS:
+        return {"metric_type": "L2", "index_type": "FLAT", "params": {}}
+    nlist = _nlist(num_rows)
+    candidates = []
+    if num_rows <= INDEX_HNSW_MAX_ROWS:
+        candidates.append(("HNSW", {"M": 32 if target_recall >= 0.98 else 16, "efConstruction": 200}))
+    candidates += [("IVF_FLAT", {"nlist": nlist}), ("IVF_SQ8", {"nlist": nlist}),
+                   ("IVF_PQ", {"nlist": nlist, "m": _pq_segments(dim), "nbits": 8})]
+    budget = memory_budget_gb * 1024 ** 3
+    index_type, params = next(((t, p) for t, p in candidates if estimate_memory(t, num_rows, dim, p) <= budget),
+                              candidates[-1])
+    return {"metric_type": "L2", "index_type": index_type, "params": params}
+
+def _embedding_index(col):
+    """Returns the index on `col`'s embedding field (collections also index scalar fields), or None."""
+    return next((index for index in col.indexes if index.field_name == "embedding"), None)
+
+def current_index(col):
+    """Returns the index parameters of `col`'s embedding field, or None if it has no index."""
+    index = _embedding_index(col)
+    return index.params if index is not None else None
+
+@contextlib.contextmanager
+def serving(marker=INDEX_SERVING_MARKER):
+    """Marks the collections as being served while the block runs, so no process rebuilds their index.
+
+    A marker left behind by a crashed server blocks rebuilds until it is deleted.
+    """
+    os.makedirs(os.path.dirname(marker) or ".", exist_ok=True)
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+    try:
+        yield
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(marker)
+
+def _signature(index_params):
+    return json.dumps({"index_type": index_params.get("index_type"), "params": index_params.get("params", {})},
+                      sort_keys=True)
+
+class IndexManager:
+    """Builds, rebuilds and tunes the vector index of each collection."""
+
+    def __init__(self, dim=EMBEDDING_DIM, target_recall=INDEX_TARGET_RECALL, latency_budget_ms=INDEX_LATENCY_BUDGET_MS,
+                 memory_budget_gb=INDEX_MEMORY_BUDGET_GB, tuning_path=INDEX_TUNING_PATH,
+                 serving_marker=INDEX_SERVING_MARKER):
+        self.dim = dim
+        self.target_recall = target_recall
+        self.latency_budget_ms = latency_budget_ms
+        self.memory_budget_gb = memory_budget_gb
+        self.tuning_path = tuning_path
+        self.serving_marker = serving_marker
+        self._lock = threading.Lock()
+        self._tuning = {}
+        if os.path.exists(tuning_path):
+            with open(tuning_path, "r", encoding="utf-8") as f:
+                self._tuning = json.load(f)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.tuning_path) or ".", exist_ok=True)
+        tmp = self.tuning_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._tuning, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.tuning_path)
+
+    def ensure(self, col, rebuild=False):
+        """Creates `col`'s index if missing; with `rebuild`, replaces it if the size calls for another one.
+
+        A rebuild releases the collection and drops its index, so it is skipped while a query
+        server is running. Returns True if an index was built, in which case the collection must
+        be (re)loaded.
+        """
+        existing = current_index(col)
+        if existing is not None and not rebuild:
+            return False
+        wanted = choose_index(col.num_entities, self.dim, self.target_recall, self.memory_budget_gb)
+        if existing is not None and _signature(existing) == _signature(wanted):
+            return False
+        if existing is not None and os.path.exists(self.serving_marker):
+            logger.warning("⏸ '%s' has outgrown its %s index, but a query server is running ('%s'); not rebuilding "
+                           "it under live searches. Run `python main.py --tune-index` once the server has stopped.",
+                           col.name, existing.get("index_type"), self.serving_marker)
+            return False
+        with telemetry.span("build_index", collection=col.name, index_type=wanted["index_type"]):
+            if existing is not None:
+                col.release()
+                col.drop_index(index_name=_embedding_index(col).index_name)
+            col.create_index(field_name="embedding", index_params=wanted)
+        logger.info("✅ %s index %s %s for '%s' (%d vectors).", "Rebuilt" if existing else "Created",
+                    wanted["index_type"], wanted["params"], col.name, col.num_entities)
+        return True
+
+    def search_params(self, col, top_k):
+        """Returns the search parameters for `col`: tuned values if any, otherwise defaults for its index."""
+        index_params = current_index(col) or {"index_type": "FLAT"}
+        family = _family(index_params["index_type"])
+        tuned = self._tuning.get(col.name, {})
+        params = dict(tuned["search_params"]) if tuned.get("index") == _signature(index_params) \
+            else dict(DEFAULT_SEARCH_PARAMS.get(family, {}))
+        if family == "HNSW":
+            params["ef"] = max(params.get("ef", 0), top_k)  # Milvus requires ef >= limit
+        elif family == "IVF":
+            params["nprobe"] = min(params.get("nprobe", 1), index_params.get("params", {}).get("nlist", 128))
+        return {"metric_type": "L2", "params": params}
+
+    def needs_tuning(self, col):
+        index_params = current_index(col)
+        if index_params is None or _family(index_params["index_type"]) == "FLAT":
+            return False
+        tuned = self._tuning.get(col.name)
+        return (tuned is None or tuned.get("index") != _signature(index_params)
+                or col.num_entities >= RETUNE_GROWTH * max(tuned.get("rows", 0), 1))
+
+    def _sample_queries(self, col, size):
+        """Samples up to `size` stored vectors, as (ids, vectors), from across the whole collection.
+
+        Primary keys are content hashes (see `chunk_primary_key`), spread evenly over [0, 2**63),
+        so one row is drawn from each of several random key ranges expected to hold ~8 rows. This
+        does not favour the earliest-ingested documents the way the first rows of a scan do.
+        """
+        rng = np.random.default_rng(0)
+        width = max(1, min(2 ** 63, 2 ** 63 * 8 // max(col.num_entities, 1)))
+        picked = {}
+        for _ in range(size * 2):
+            if len(picked) >= size:
+                break
+            low = int(rng.integers(0, 2 ** 63 - width, endpoint=True))
+            rows = col.query(expr=f"id >= {low} and id <= {low + width - 1}", output_fields=["embedding"], limit=64)
+            if rows:
+                row = rows[int(rng.integers(len(rows)))]
+                picked[row["id"]] = list(map(float, row["embedding"]))
+        return list(picked), list(picked.values())
+
+    def tune(self, col, top_k=5, queries=None):
+        """Tunes `nprobe` (IVF) or `ef` (HNSW) of `col` and returns the chosen search parameters.
+
+        `queries` are query vectors; by default stored vectors are sampled, each held out of its
+        own results. Recall is measured against the most exhaustive setting of the same index.
+        """
+        index_params = current_index(col)
+        if index_params is None or _family(index_params["index_type"]) == "FLAT":
+            return self.search_params(col, top_k)
+        family = _family(index_params["index_type"])
+        if queries is None:
+            held_out, queries = self._sample_queries(col, INDEX_TUNING_QUERIES)
+        else:
+            held_out = [None] * len(queries)
+        if not queries:
+            return self.search_params(col, top_k)
+
+        if family == "IVF":
+            nlist = index_params["params"]["nlist"]
+            key, values = "nprobe", [v for v in (2 ** i for i in range(17)) if v < nlist] + [nlist]
+        else:
+            key, values = "ef", sorted({max(top_k, v) for v in (16, 32, 64, 128, 256, 512)}) + [max(2048, top_k)]
+
+        def run(value):
+            param = {"metric_type": "L2", "params": {key: value}}
+            ids, latencies = [], []
+            for own_id, query in zip(held_out, queries):
+                start = time.perf_counter()
+                hits = col.search([query], "embedding", param, limit=top_k + 1)[0]
+                latencies.append((time.perf_counter() - start) * 1000)
+                ids.append([hit.id for hit in hits if hit.id != own_id][:top_k])
+            return ids, float(np.percentile(latencies, 95))
+
+        with telemetry.span("tune_index", collection=col.name, queries=len(queries)):
+            reference, _ = run(values[-1])
+            trials = []
+            for value in values[:-1]:
+                ids, p95 = run(value)
+                recall = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(ids, reference)])
+                trials.append((value, float(recall), p95))
+                if recall >= self.target_recall or p95 > self.latency_budget_ms:
+                    break
+        # Cheapest value meeting the recall target within budget, else the best one within budget.
+        within_budget = [t for t in trials if t[2] <= self.latency_budget_ms] or trials[:1]
+        value, recall, p95 = next((t for t in within_budget if t[1] >= self.target_recall), within_budget[-1])
+        if recall < self.target_recall:
+            logger.warning("⚠️ '%s': %s=%d reaches recall %.3f (< %.2f) within the %.0f ms budget.",
+                           col.name, key, value, recall, self.target_recall, self.latency_budget_ms)
+        logger.info("🎯 Tuned '%s' %s: %s=%d (recall@%d %.3f, p95 %.2f ms).", col.name, index_params["index_type"],
+                    key, value, top_k, recall, p95)
+        with self._lock:
+            self._tuning[col.name] = {"index": _signature(index_params), "rows": col.num_entities,
+                                      "search_params": {key: value}, "recall": round(recall, 4), "p95_ms": round(p95, 3)}
+            self._save()
+        return self.search_params(col, top_k)
@@ -0,0 +1,88 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+from src.config import LLM_MODEL, LLM_TEMPERATURE
+
+class Generator(ABC):
+    """Interface for the answer generators used by MilvusManager.
+
+    Subclasses implement `stream`, which yields answer text pieces as they are produced;
+    `complete` returns the whole answer and may be overridden with a non-streaming call.
+    """
+
+    @abstractmethod
+    def stream(self, prompt):
+        """Yields the answer to `prompt` piece by piece."""
+
+    def complete(self, prompt):
+        return "".join(self.stream(prompt)).strip()
+
+class MistralGenerator(Generator):
+    """Generates answers with the Mistral chat API through one long-lived (pooled) client.
+
+    Set MISTRAL_SERVER_URL to target a compatible server instead of the Mistral API,
+    e.g. the offline fake in src/fake_llm_server.py.
+    """
+
+    def __init__(self, model=LLM_MODEL, temperature=LLM_TEMPERATURE, server_url=None):
+        self.model, self.temperature = model, temperature
+        self.server_url = server_url
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Creates the Mistral client on first use and reuses it (and its HTTP connection pool)."""
+        with self._lock:
+            if self._client is None:
+                from mistralai import Mistral
+
+                load_dotenv()
+                api_key = os.getenv("MISTRAL_API_KEY")
+                if not api_key: raise ValueError("MISTRAL_API_KEY not found in .env file.")
+                server_url = self.server_url or os.getenv("MISTRAL_SERVER_URL")
+                self._client = Mistral(api_key=api_key, server_url=server_url) if server_url else Mistral(api_key=api_key)
+            return self._client
+
+    def _messages(self, prompt):
+        return [{"role": "user", "content": prompt}]
+
+    def complete(self, prompt):
+        response = self.client.chat.complete(model=self.model, messages=self._messages(prompt), temperature=self.temperature)
+        return response.choices[0].message.content.strip()
+
+    def stream(self, prompt):
+        events = self.client.chat.stream(model=self.model, messages=self._messages(prompt), temperature=self.temperature)
+        for event in events:
+            delta = event.data.choices[0].delta.content if event.data.choices else None
+            if delta:
+                yield delta
+
+class FakeGenerator(Generator):
+    """Deterministic offline generator for tests and benchmarks.
+
+    Answers with `answer` (or the start of the prompt's context) one word at a time, after
+    `first_token_delay` seconds and then `token_delay` seconds per word.
+    """
+
+    def __init__(self, answer=None, first_token_delay=0.0, token_delay=0.0, max_words=40):
+        self.answer = answer
+        self.first_token_delay, self.token_delay = first_token_delay, token_delay
+        self.max_words = max_words
+        self.calls = 0
+
+    def _answer_for(self, prompt):
+        if self.answer is not None:
+            return self.answer
+        context = prompt.split("--- CONTEXT ---", 1)[-1].split("--- END CONTEXT ---", 1)[0]
+        return " ".join(context.replace("\\n", " ").split()[:self.max_words])
+
+    def stream(self, prompt):
+        self.calls += 1
+        time.sleep(self.first_token_delay)
+        for i, word in enumerate(self._answer_for(prompt).split(" ")):
+            if i: time.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
@@ -0,0 +1,486 @@
+"""Embedded, in-process vector store with a pymilvus-compatible collection API.
+
+Each collection is a directory holding:
+  vectors.bin   memory-mapped float32/float16 rows (grown geometrically)
+  columns.npz   columnar metadata: id, page_no, dictionary-coded source/type/partition, content offsets, tombstones
+  content.bin   append-only UTF-8 content, addressed by (offset, length)
+  meta.json     dimension, dtype, row count, dictionaries, partitions and index parameters
+Partitions are a dictionary-coded column: searching some partitions masks rows by code, and
+dropping one tombstones its rows. Scalar indexes are only recorded, since filters are
+vectorized scans over the in-memory columns anyway.
+Small collections are searched exactly with vectorized L2; once an IVF index is requested and
+the collection is large enough, rows are partitioned into `nlist` k-means lists and only the
+`nprobe` nearest lists are scanned. Other index types (FLAT, HNSW) are searched exactly.
+"""
+import os
+import re
+import ast
+import json
+import atexit
+import threading
+import numpy as np
+
+from src.config import LOCAL_STORE_DTYPE, LOCAL_IVF_MIN_ROWS, LOCAL_IVF_MAX_NLIST, LOCAL_IVF_MAX_TRAIN_ROWS
+
+SEARCH_BLOCK_ROWS = 65536  # Rows scored per matrix product during exact search.
+ASSIGN_BLOCK_SCORES = SEARCH_BLOCK_ROWS * 64  # (row, centroid) scores per block when assigning rows to IVF lists.
+COLUMNS = ("id", "page_no", "source", "type", "partition", "content_offset", "content_length", "deleted", "ivf_list")
+DEFAULT_PARTITION = "_default"
+EMBEDDING_INDEX_NAME = "_default_idx"
+_CLAUSE = re.compile(r"^\s*(\w+)\s*(not in|in|==|!=|>=|<=|>|<)\s*(.+?)\s*$")
+_AND = re.compile(r"\s+and\s+")
+
+class _Schema:
+    auto_id = False
+
+class _Index:
+    __slots__ = ("field_name", "params", "index_name")
+
+    def __init__(self, field_name, params, index_name):
+        self.field_name, self.params, self.index_name = field_name, params, index_name
+
+class _Partition:
+    """A partition handle like pymilvus' Partition (only `name` and `release`)."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def release(self):
+        pass
+
+def _split_and(expr):
+    """Splits `expr` at top-level 'and's, leaving those inside quoted strings or brackets alone."""
+    clauses, start, depth, quote, i = [], 0, 0, None, 0
+    while i < len(expr):
+        ch = expr[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif not depth and (match := _AND.match(expr, i)):
+            clauses.append(expr[start:i])
+            start = i = match.end()
+            continue
+        i += 1
+    return [*clauses, expr[start:]]
+
+class LocalHit:
+    """A search hit shaped like pymilvus' Hit (`id`, `distance`, `entity.get`)."""
+
+    __slots__ = ("id", "distance", "entity")
+
+    def __init__(self, id, distance, entity):
+        self.id, self.distance, self.entity = id, distance, entity
+
+class LocalCollection:
+    """A persistent collection supporting the subset of pymilvus.Collection used by MilvusManager."""
+
+    schema = _Schema()
+
+    def __init__(self, path, name, dim, description="", dtype=LOCAL_STORE_DTYPE):
+        self.path, self.name, self.description = path, name, description
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        else:
+            meta = {"dim": dim, "dtype": np.dtype(dtype).name, "count": 0, "capacity": 0, "description": description,
+                    "sources": [], "types": [], "index": None, "centroids": None}
+        self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+        self.count, self.capacity = meta["count"], meta["capacity"]
+        self.index_params = meta["index"]
+        self.scalar_indexes = meta.get("scalar_indexes", {})  # index name -> field
+        # Stores written before partitions existed hold every row in the default partition (code 0).
+        self._dicts = {"source": meta["sources"], "type": meta["types"],
+                       "partition": meta.get("partitions", [DEFAULT_PARTITION])}
+        self._partitions = set(meta.get("partition_names", [DEFAULT_PARTITION]))
+        self._codes = {field: {value: i for i, value in enumerate(values)} for field, values in self._dicts.items()}
+        self._trained_rows = meta.get("trained_rows", 0)
+
+        columns_path = os.path.join(path, "columns.npz")
+        if os.path.exists(columns_path):
+            with np.load(columns_path) as data:
+                self._columns = {name: data[name] if name in data else self._empty_columns(self.capacity)[name]
+                                 for name in COLUMNS}
+        else:
+            self._columns = self._empty_columns(self.capacity)
+        centroids_path = os.path.join(path, "centroids.npy")
+        self._centroids = np.load(centroids_path) if meta.get("centroids") and os.path.exists(centroids_path) else None
+
+        self._vectors_path = os.path.join(path, "vectors.bin")
+        self._vectors = self._map_vectors()
+        self._content_path = os.path.join(path, "content.bin")
+        open(self._content_path, "ab").close()
+        self._content_size = os.path.getsize(self._content_path)
+        self._rows_by_id = None  # Built lazily; only upserts and deletes need it
+        self._dirty = not os.path.exists(meta_path)
+
+    # ----- storage -------------------------------------------------------------------------
+
+    @staticmethod
+    def _empty_columns(capacity):
+        return {
+            "id": np.zeros(capacity, np.int64), "page_no": np.zeros(capacity, np.int64),
+            "source": np.zeros(capacity, np.int32), "type": np.zeros(capacity, np.int32),
+            "partition": np.zeros(capacity, np.int32), "content_offset": np.zeros(capacity, np.int64), "content_length": np.zeros(capacity, np.int64),
+            "deleted": np.zeros(capacity, bool), "ivf_list": np.full(capacity, -1, np.int32),
+        }
+
+    def _map_vectors(self):
+        if not self.capacity:
+            return np.zeros((0, self.dim), self.dtype)
+        return np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+
+    def _reserve(self, rows):
+        """Grows vector and column storage geometrically to fit `rows` more rows."""
+        needed = self.count + rows
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        grown = self._empty_columns(capacity)
+        for name, column in self._columns.items():
+            grown[name][:self.count] = column[:self.count]
+        self._columns, self.capacity = grown, capacity
+        self._vectors = self._map_vectors()
+
+    def _encode_value(self, field, value):
+        codes = self._codes[field]
+        if value not in codes:
+            codes[value] = len(self._dicts[field])
+            self._dicts[field].append(value)
+        return codes[value]
+
+    def _read_content(self, row):
+        length = int(self._columns["content_length"][row])
+        if not length:
+            return ""
+        with open(self._content_path, "rb") as f:
+            f.seek(int(self._columns["content_offset"][row]))
+            return f.read(length).decode("utf-8")
+
+    def _row_index(self):
+        if self._rows_by_id is None:
+            live = np.flatnonzero(~self._columns["deleted"][:self.count])
+            self._rows_by_id = dict(zip(self._columns["id"][live].tolist(), live.tolist()))
+        return self._rows_by_id
+
+    # ----- pymilvus-compatible API ------------------------------------------------------------
+
+    @property
+    def num_entities(self):
+        return int(self.count - self._columns["deleted"][:self.count].sum())
+
+    def insert(self, data, partition_name=None):
+        """Appends rows given as columns [ids, embeddings, sources, page_nos, types, contents] to a partition."""
+        ids, embeddings, sources, pages, types, contents = data
+        rows = len(ids)
+        if not rows:
+            return
+        partition_name = partition_name or DEFAULT_PARTITION
+        with self._lock:
+            if partition_name not in self._partitions:
+                raise ValueError(f"Partition {partition_name!r} does not exist in '{self.name}'")
+            self._reserve(rows)
+            start, end = self.count, self.count + rows
+            self._vectors[start:end] = np.asarray(embeddings, dtype=np.float32)
+            cols = self._columns
+            cols["id"][start:end] = ids
+            cols["page_no"][start:end] = pages
+            cols["source"][start:end] = [self._encode_value("source", s) for s in sources]
+            cols["type"][start:end] = [self._encode_value("type", t) for t in types]
+            cols["partition"][start:end] = self._encode_value("partition", partition_name)
+            encoded = [c.encode("utf-8") for c in contents]
+            lengths = np.array([len(c) for c in encoded], np.int64)
+            cols["content_offset"][start:end] = self._content_size + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            cols["content_length"][start:end] = lengths
+            with open(self._content_path, "ab") as f:
+                f.write(b"".join(encoded))
+            self._content_size += int(lengths.sum())
+            if self._centroids is not None:
+                cols["ivf_list"][start:end] = self._assign(self._vectors[start:end])
+            if self._rows_by_id is not None:
+                self._rows_by_id.update(zip(map(int, ids), range(start, end)))
+            self.count, self._dirty = end, True
+
+    def upsert(self, data, partition_name=None):
+        """Inserts rows, replacing any existing rows with the same primary keys (in any partition)."""
+        with self._lock:
+            self._delete_rows([self._row_index()[pk] for pk in map(int, data[0]) if pk in self._row_index()])
+            self.insert(data, partition_name=partition_name)
+
+    def delete(self, expr, partition_name=None):
+        """Deletes (tombstones) the rows matching a boolean expression such as 'id in [1, 2]'."""
+        with self._lock:
+            self._delete_rows(np.flatnonzero(self._filter_mask(expr, [partition_name] if partition_name else None)))
+
+    def _delete_rows(self, rows):
+        if len(rows):
+            self._columns["deleted"][rows] = True
+            self._dirty = True
+            if self._rows_by_id is not None:
+                for pk in self._columns["id"][rows].tolist():
+                    self._rows_by_id.pop(pk, None)
+
+    def flush(self):
+        """Persists vectors, metadata and the index, compacting away deleted rows first if worthwhile."""
+        with self._lock:
+            if not self._dirty:
+                return
+            deleted = int(self._columns["deleted"][:self.count].sum())
+            if deleted and deleted * 4 >= self.count:
+                self._compact()
+            self._maybe_train()
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            np.savez(os.path.join(self.path, "columns.tmp.npz"), **self._columns)
+            os.replace(os.path.join(self.path, "columns.tmp.npz"), os.path.join(self.path, "columns.npz"))
+            if self._centroids is not None:
+                np.save(os.path.join(self.path, "centroids.npy"), self._centroids)
+            meta = {"dim": self.dim, "dtype": self.dtype.name, "count": self.count, "capacity": self.capacity,
+                    "description": self.description, "sources": self._dicts["source"], "types": self._dicts["type"],
+                    "partitions": self._dicts["partition"], "partition_names": sorted(self._partitions),
+                    "index": self.index_params, "scalar_indexes": self.scalar_indexes,
+                    "centroids": self._centroids is not None, "trained_rows": self._trained_rows}
+            with open(os.path.join(self.path, "meta.tmp.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(os.path.join(self.path, "meta.tmp.json"), os.path.join(self.path, "meta.json"))
+            self._dirty = False
+
+    def _compact(self):
+        """Rewrites storage without tombstoned rows (content bytes are left in place)."""
+        live = np.flatnonzero(~self._columns["deleted"][:self.count])
+        self._vectors[:len(live)] = self._vectors[live]
+        for name, column in self._columns.items():
+            column[:len(live)] = column[live]
+        self.count = len(live)
+        self._columns["deleted"][:self.count] = False
+        self._rows_by_id = None
+
+    def load(self):
+        pass
+
+    def release(self):
+        pass
+
+    def has_index(self):
+        return self.index_params is not None
+
+    @property
+    def indexes(self):
+        """Indexes like pymilvus' `Collection.indexes` (only `field_name`, `params` and `index_name`)."""
+        indexes = [_Index("embedding", self.index_params, EMBEDDING_INDEX_NAME)] if self.index_params is not None else []
+        return indexes + [_Index(field, {"index_type": "INVERTED"}, name) for name, field in self.scalar_indexes.items()]
+
+    def create_index(self, field_name, index_params, index_name=None):
+        """Records index parameters; IVF lists are trained once the collection is large enough."""
+        with self._lock:
+            self._dirty = True
+            if field_name != "embedding":
+                self.scalar_indexes[index_name or f"{field_name}_idx"] = field_name
+                return
+            self.index_params = index_params
+            self._centroids, self._trained_rows = None, 0
+            self._columns["ivf_list"][:] = -1
+            self._maybe_train()
+
+    def drop_index(self, index_name=None):
+        with self._lock:
+            self._dirty = True
+            if index_name in self.scalar_indexes:
+                del self.scalar_indexes[index_name]
+                return
+            self.index_params, self._centroids, self._trained_rows = None, None, 0
+
+    # ----- partitions ----------------------------------------------------------------------------
+
+    @property
+    def partitions(self):
+        return [_Partition(name) for name in sorted(self._partitions)]
+
+    def has_partition(self, partition_name):
+        return partition_name in self._partitions
+
+    def partition(self, partition_name):
+        if partition_name not in self._partitions:
+            raise ValueError(f"Partition {partition_name!r} does not exist in '{self.name}'")
+        return _Partition(partition_name)
+
+    def create_partition(self, partition_name):
+        with self._lock:
+            if partition_name not in self._partitions:
+                self._partitions.add(partition_name)
+                self._encode_value("partition", partition_name)
+                self._dirty = True
+
+    def drop_partition(self, partition_name):
+        """Drops a partition and every row in it."""
+        if partition_name == DEFAULT_PARTITION:
+            raise ValueError("The default partition cannot be dropped")
+        with self._lock:
+            self._delete_rows(np.flatnonzero(self._filter_mask(None, [partition_name])))
+            self._partitions.discard(partition_name)
+            self._dirty = True
+
+    # ----- IVF index ---------------------------------------------------------------------------
+
+    def _maybe_train(self):
+        """Trains IVF centroids when the collection first passes LOCAL_IVF_MIN_ROWS or doubles in size."""
+        params = self.index_params or {}
+        if not params.get("index_type", "").startswith("IVF"):
+            return
+        live = self.num_entities
+        if live < LOCAL_IVF_MIN_ROWS or (self._centroids is not None and live < 2 * self._trained_rows):
+            return
+        nlist = min(int(params.get("params", {}).get("nlist", 128)), LOCAL_IVF_MAX_NLIST, live)
+        rows = np.flatnonzero(~self._columns["deleted"][:self.count])
+        rng = np.random.default_rng(0)
+        sample_size = min(len(rows), nlist * 39, max(nlist, LOCAL_IVF_MAX_TRAIN_ROWS))
+        sample = np.asarray(self._vectors[np.sort(rng.choice(rows, sample_size, replace=False))], np.float32)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(10):  # Lloyd iterations
+            assignment = self._nearest(sample, centroids)
+            counts = np.bincount(assignment, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        self._centroids, self._trained_rows = centroids, live
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, self.count)
+            self._columns["ivf_list"][start:end] = self._assign(self._vectors[start:end])
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        """Index of the nearest centroid of each vector, scoring ASSIGN_BLOCK_SCORES pairs at a time."""
+        norms = (centroids ** 2).sum(axis=1)[None, :]
+        block = max(1, ASSIGN_BLOCK_SCORES // len(centroids))
+        nearest = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            scores = norms - 2 * vectors[start:start + block] @ centroids.T
+            nearest[start:start + block] = scores.argmin(axis=1)
+        return nearest
+
+    def _assign(self, vectors):
+        return self._nearest(np.asarray(vectors, np.float32), self._centroids).astype(np.int32)
+
+    # ----- filtering and search ------------------------------------------------------------------
+
+    def _filter_mask(self, expr=None, partition_names=None):
+        """Returns a boolean mask of live rows in `partition_names` (None = all) matching `expr`
+        ('and'-joined field comparisons)."""
+        mask = ~self._columns["deleted"][:self.count]
+        if partition_names is not None:
+            codes = [self._codes["partition"][name] for name in partition_names if name in self._partitions]
+            mask &= np.isin(self._columns["partition"][:self.count], codes)
+        if not expr:
+            return mask
+        for clause in _split_and(expr.strip()):
+            match = _CLAUSE.match(clause)
+            if not match:
+                raise ValueError(f"Unsupported filter expression: {clause!r}")
+            field, op, raw = match.groups()
+            value = ast.literal_eval(raw)
+            column = self._columns[field][:self.count]
+            if field in self._codes:  # Dictionary-coded string column
+                lookup = lambda v: self._codes[field].get(v, -1)
+                value = [lookup(v) for v in value] if op in ("in", "not in") else lookup(value)
+            if op == "in":
+                mask &= np.isin(column, value)
+            elif op == "not in":
+                mask &= ~np.isin(column, value)
+            else:
+                mask &= {"==": np.equal, "!=": np.not_equal, ">=": np.greater_equal, "<=": np.less_equal,
+                         ">": np.greater, "<": np.less}[op](column, value)
+        return mask
+
+    def _entity(self, row, output_fields):
+        cols = self._columns
+        values = {"id": int(cols["id"][row]), "page_no": int(cols["page_no"][row]),
+                  "source": self._dicts["source"][cols["source"][row]], "type": self._dicts["type"][cols["type"][row]]}
+        entity = {field: values[field] for field in output_fields if field in values}
+        if "content" in output_fields:
+            entity["content"] = self._read_content(row)
+        if "embedding" in output_fields:
+            entity["embedding"] = np.asarray(self._vectors[row], np.float32).tolist()
+        return entity
+
+    def query(self, expr, output_fields=None, limit=None, partition_names=None, **kwargs):
+        """Returns the rows matching `expr` as dicts holding "id" and `output_fields`."""
+        output_fields = ["id", *(output_fields or [])]
+        with self._lock:
+            rows = np.flatnonzero(self._filter_mask(expr, partition_names))[:limit]
+            return [self._entity(row, output_fields) for row in rows]
+
+    def search(self, data, anns_field, param, limit=10, output_fields=None, expr=None, partition_names=None, **kwargs):
+        """L2 search returning, per query vector, a list of LocalHit sorted by distance."""
+        queries = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        output_fields = output_fields or []
+        with self._lock:
+            mask = self._filter_mask(expr, partition_names)
+            nprobe = int((param or {}).get("params", {}).get("nprobe", 10))
+            results = []
+            for query in queries:
+                candidates = mask
+                if self._centroids is not None:
+                    probe = np.argsort(((self._centroids - query) ** 2).sum(axis=1))[:nprobe]
+                    candidates = mask & np.isin(self._columns["ivf_list"][:self.count], probe)
+                rows, distances = self._top_k(query, np.flatnonzero(candidates), limit)
+                results.append([LocalHit(int(self._columns["id"][r]), float(d), self._entity(r, output_fields))
+                                for r, d in zip(rows, distances)])
+            return results
+
+    def _top_k(self, query, rows, limit):
+        """Exact top-k by squared L2 distance over `rows`, scored in blocks to bound memory."""
+        best_rows, best_dist = np.empty(0, np.int64), np.empty(0, np.float32)
+        query_norm = float(query @ query)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            vectors = np.asarray(self._vectors[block], np.float32)
+            dist = (vectors ** 2).sum(axis=1) - 2 * vectors @ query + query_norm
+            best_rows, best_dist = np.concatenate([best_rows, block]), np.concatenate([best_dist, dist])
+            if len(best_dist) > limit:
+                keep = np.argpartition(best_dist, limit)[:limit]
+                best_rows, best_dist = best_rows[keep], best_dist[keep]
+        order = np.argsort(best_dist)
+        return best_rows[order], np.maximum(best_dist[order], 0.0)
+
+class LocalVectorStore:
+    """A directory of LocalCollections, standing in for a Milvus server."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._collections = {}
+        os.makedirs(root, exist_ok=True)
+        atexit.register(self.flush)
+
+    def list_collections(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.exists(os.path.join(self.root, name, "meta.json")))
+
+    def get_or_create(self, name, dim, description=""):
+        if name not in self._collections:
+            collection = LocalCollection(os.path.join(self.root, name), name, dim, description)
+            if not os.path.exists(os.path.join(self.root, name, "meta.json")):
+                collection.flush()
+            self._collections[name] = collection
+        return self._collections[name]
+
+    def flush(self):
+        """Persists every open collection (also run at interpreter exit)."""
+        for collection in self._collections.values():
+            collection.flush()
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+
+from src.config import MANIFEST_PATH
+
+def file_sha256(path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_name(path, root=None):
+    """Returns the source name of the document at `path`: its path relative to `root`, with "/"
+    separators, so same-named files in different folders stay apart (just the file name without a root)."""
+    name = os.path.relpath(path, root) if root else os.path.basename(path)
+    return name.replace(os.sep, "/")
+
+class DocumentManifest:
+    """Tracks, per source document, its content hash and the primary keys of its ingested chunks.
+
+    Stored as JSON: {source: {"path": ..., "content_hash": ..., "ids": {"text": [...], "table": [...]}}}.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._documents = json.load(f)
+        except FileNotFoundError:
+            self._documents = {}
+
+    def sources(self):
+        return set(self._documents)
+
+    def content_hash(self, source):
+        return self._documents.get(source, {}).get("content_hash")
+
+    def ids(self, source, data_type):
+        """Returns the primary keys of `source`'s chunks in the `data_type` collection."""
+        return set(self._documents.get(source, {}).get("ids", {}).get(data_type, []))
+
+    def set(self, source, ids_by_type, content_hash=None, path=None):
+        """Records the chunks currently stored for `source`."""
+        self._documents[source] = {
+            "path": path, "content_hash": content_hash,
+            "ids": {data_type: sorted(ids) for data_type, ids in ids_by_type.items()},
+        }
+
+    def forget(self, data_type):
+        """Drops all recorded `data_type` keys, e.g. after that collection was recreated empty.
+
+        Content hashes are cleared too, so the next sync re-processes every document.
+        """
+        for document in self._documents.values():
+            document["ids"].pop(data_type, None)
+            document["content_hash"] = None
+
+    def remove(self, source):
+        self._documents.pop(source, None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._documents, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
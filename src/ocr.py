@@ -0,0 +1,241 @@
+"""Adaptive OCR: only the text-bearing regions of a page are recognized, each at a DPI fitted to its glyphs.
+
+The page is first rendered in grayscale at OCR_DETECT_DPI. Ink under valid words of the
+page's own text layer is masked out, and the rest is cut into regions at blank gaps of
+OCR_REGION_GAP_PT (a recursive XY-cut). Specks and picture-like regions (mostly ink) are
+dropped. Each region is rendered at the DPI that makes its median text line
+OCR_TARGET_LINE_PX tall (within OCR_MIN_DPI..OCR_MAX_DPI), and the regions are OCR'd
+concurrently on OCR_WORKERS processes. The result is a single-page PDF of the page's size,
+as whole-page OCR produces: the original page (minus unreadable text-layer words) with each
+region's OCR output, image plus invisible text, laid over it.
+"""
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from src.config import (
+    DPI, OCR_DETECT_DPI, OCR_INK_THRESHOLD, OCR_TARGET_LINE_PX, OCR_MIN_DPI, OCR_MAX_DPI, OCR_REGION_GAP_PT,
+    OCR_REGION_PADDING_PT, OCR_MIN_REGION_PT, OCR_MAX_INK_DENSITY, OCR_MAX_REGIONS, OCR_MIN_IMAGE_FRACTION, OCR_WORKERS
+)
+from src import telemetry
+
+_PUNCTUATION = frozenset(".,;:!?'\"()[]{}-–—/\\%&+*=<>@#$€£°·•…’‘“”")
+_pool = None
+_pool_lock = threading.Lock()
+
+def is_valid_word(word):
+    """True for text-layer words that read as text rather than unmapped glyph codes."""
+    if not word or "\ufffd" in word:
+        return False
+    return sum(ch.isalnum() or ch in _PUNCTUATION for ch in word) >= 0.8 * len(word)
+
+def text_layer_words(page):
+    """Splits the words of the page's text layer into (valid, invalid) lists of Rects."""
+    valid, invalid = [], []
+    for x0, y0, x1, y1, word, *_ in page.get_text("words"):
+        (valid if is_valid_word(word) else invalid).append(fitz.Rect(x0, y0, x1, y1))
+    return valid, invalid
+
+def _to_px(rect, scale, shape):
+    height, width = shape
+    return (max(0, int(rect.x0 * scale)), max(0, int(rect.y0 * scale)),
+            min(width, int(np.ceil(rect.x1 * scale))), min(height, int(np.ceil(rect.y1 * scale))))
+
+def _spans(profile, min_gap):
+    """Returns the (start, end) runs of a 1-D ink profile separated by at least `min_gap` empty entries."""
+    inked = np.flatnonzero(profile)
+    if inked.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(inked) > min_gap)
+    starts = np.r_[inked[0], inked[breaks + 1]]
+    ends = np.r_[inked[breaks], inked[-1]] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def _xy_cut(ink, min_gap):
+    """Cuts an ink mask at blank bands of rows, then columns, recursively; returns (x0, y0, x1, y1) boxes."""
+    boxes, stack = [], [(0, 0, ink.shape[1], ink.shape[0])]
+    while stack:
+        x0, y0, x1, y1 = stack.pop()
+        box = ink[y0:y1, x0:x1]
+        rows = _spans(box.any(axis=1), min_gap)
+        if len(rows) > 1:
+            stack += [(x0, y0 + a, x1, y0 + b) for a, b in rows]
+            continue
+        if not rows:
+            continue
+        (a, b), = rows
+        columns = _spans(box[a:b].any(axis=0), min_gap)
+        if len(columns) > 1:
+            stack += [(x0 + c, y0 + a, x0 + d, y0 + b) for c, d in columns]
+            continue
+        (c, d), = columns
+        boxes.append((x0 + c, y0 + a, x0 + d, y0 + b))
+    return sorted(boxes, key=lambda box: (box[1], box[0]))
+
+def region_dpi(line_height_pt):
+    """DPI that renders a text line of `line_height_pt` points OCR_TARGET_LINE_PX pixels tall."""
+    if not line_height_pt:
+        return int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, DPI)))
+    dpi = round(OCR_TARGET_LINE_PX * 72 / line_height_pt / 25) * 25
+    return int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, dpi)))
+
+def _area(boxes):
+    return (boxes[..., 2] - boxes[..., 0]).clip(0) * (boxes[..., 3] - boxes[..., 1]).clip(0)
+
+def _merge_regions(regions, max_regions=OCR_MAX_REGIONS):
+    """Merges the two regions whose union adds the least area until at most `max_regions` remain.
+
+    The growth of every pair is computed once, and after a merge only the merged region's row
+    and the rows whose best partner it absorbed are updated, so noisy pages with hundreds of
+    regions cost O(n^2) rather than a full pairwise search per merge.
+    """
+    regions = list(regions)
+    if len(regions) <= max_regions:
+        return regions
+    boxes = np.array([tuple(rect) for rect, _ in regions], dtype=np.float64)
+    dpis = [dpi for _, dpi in regions]
+    alive = np.ones(len(regions), dtype=bool)
+
+    def growth_row(i):
+        union = np.concatenate([np.minimum(boxes[i, :2], boxes[:, :2]), np.maximum(boxes[i, 2:], boxes[:, 2:])], axis=1)
+        row = _area(union) - _area(boxes[i]) - _area(boxes)
+        row[i] = np.inf
+        row[~alive] = np.inf
+        return row
+
+    growth = np.stack([growth_row(i) for i in range(len(regions))])
+    best, partner = growth.min(axis=1), growth.argmin(axis=1)
+    for _ in range(len(regions) - max_regions):
+        i = int(best.argmin())
+        j = int(partner[i])
+        boxes[i, :2], boxes[i, 2:] = np.minimum(boxes[i, :2], boxes[j, :2]), np.maximum(boxes[i, 2:], boxes[j, 2:])
+        dpis[i] = max(dpis[i], dpis[j])
+        alive[j] = False
+        growth[j, :] = growth[:, j] = best[j] = np.inf
+        growth[i, :] = growth[:, i] = growth_row(i)
+        best[i], partner[i] = growth[i].min(), growth[i].argmin()
+        for r in np.flatnonzero(alive & ((partner == i) | (partner == j))):
+            if r != i:
+                best[r], partner[r] = growth[r].min(), growth[r].argmin()
+        closer = alive & (growth[:, i] < best)
+        best[closer], partner[closer] = growth[closer, i], i
+    return [(fitz.Rect(*boxes[i]), dpis[i]) for i in np.flatnonzero(alive)]
+
+def find_text_regions(page, covered=(), within=None, detect_dpi=OCR_DETECT_DPI):
+    """Returns [(Rect, dpi)] for the regions of `page` holding ink that the `covered` Rects do not explain.
+
+    With `within` (a list of Rects), only ink inside those areas is considered.
+    """
+    pix = page.get_pixmap(dpi=detect_dpi, colorspace=fitz.csGRAY)
+    gray = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    ink = gray < OCR_INK_THRESHOLD
+    scale = detect_dpi / 72
+    if within is not None:
+        allowed = np.zeros_like(ink)
+        for rect in within:
+            x0, y0, x1, y1 = _to_px(rect, scale, ink.shape)
+            allowed[y0:y1, x0:x1] = True
+        ink &= allowed
+    for rect in covered:
+        x0, y0, x1, y1 = _to_px(rect + (-1, -1, 1, 1), scale, ink.shape)
+        ink[y0:y1, x0:x1] = False
+
+    regions = []
+    for x0, y0, x1, y1 in _xy_cut(ink, max(1, int(OCR_REGION_GAP_PT * scale))):
+        box = ink[y0:y1, x0:x1]
+        if max(x1 - x0, y1 - y0) < OCR_MIN_REGION_PT * scale or box.mean() > OCR_MAX_INK_DENSITY:
+            continue  # A speck, or a picture rather than text
+        lines = [b - a for a, b in _spans(box.any(axis=1), 1) if b - a >= 2]
+        rect = fitz.Rect(x0 / scale, y0 / scale, x1 / scale, y1 / scale) + (
+            -OCR_REGION_PADDING_PT, -OCR_REGION_PADDING_PT, OCR_REGION_PADDING_PT, OCR_REGION_PADDING_PT)
+        regions.append((rect & page.rect, region_dpi(float(np.median(lines)) / scale if lines else None)))
+    return _merge_regions(regions)
+
+def _ocr_pixmap(pix, dpi):
+    with telemetry.span("ocr_region", dpi=dpi, megapixels=round(pix.width * pix.height / 1e6, 3)):
+        return pix.pdfocr_tobytes()
+
+def _ocr_png(png, dpi, correlation_id):
+    """Runs in an OCR worker process; returns the region's OCR page and the worker's metrics."""
+    with telemetry.correlation(correlation_id):
+        pix = fitz.Pixmap(png)
+        pix.set_dpi(dpi, dpi)
+        return _ocr_pixmap(pix, dpi), telemetry.snapshot(reset=True)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _pool
+
+def ocr_regions(page, regions):
+    """OCRs each (Rect, dpi) region of `page` and returns their single-page PDFs in the same order.
+
+    Regions are rendered here and recognized on the OCR process pool. Inside a worker process
+    (parallel page or document parsing) they are recognized in turn instead.
+    """
+    pixmaps = [page.get_pixmap(dpi=dpi, clip=rect) for rect, dpi in regions]
+    telemetry.count("ocr_regions", len(regions))
+    if len(regions) < 2 or OCR_WORKERS <= 1 or multiprocessing.parent_process() is not None:
+        return [_ocr_pixmap(pix, dpi) for pix, (_, dpi) in zip(pixmaps, regions)]
+    correlation_id = telemetry.current_correlation_id()
+    futures = [_get_pool().submit(_ocr_png, pix.tobytes("png"), dpi, correlation_id)
+               for pix, (_, dpi) in zip(pixmaps, regions)]
+    results = []
+    for future in futures:
+        pdf, metrics = future.result()
+        telemetry.merge(metrics)
+        results.append(pdf)
+    return results
+
+def _compose(page, overlays, invalid_words):
+    """Returns the page with each (Rect, OCR PDF) overlay placed on it, as single-page PDF bytes."""
+    out = fitz.open()
+    target = out.new_page(width=page.rect.width, height=page.rect.height)
+    if invalid_words:
+        with fitz.open() as copy:
+            copy.insert_pdf(page.parent, from_page=page.number, to_page=page.number)
+            for rect in invalid_words:
+                copy[0].add_redact_annot(rect)
+            copy[0].apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+            target.show_pdf_page(target.rect, copy, 0)
+    else:
+        target.show_pdf_page(target.rect, page.parent, page.number)
+    for rect, pdf in overlays:
+        with fitz.open("pdf", pdf) as region_doc:
+            target.show_pdf_page(rect, region_doc, 0)
+    try:
+        return out.tobytes(garbage=3, deflate=True)
+    finally:
+        out.close()
+
+def ocr_page_bytes(page, images_only=False):
+    """OCRs the text regions of `page` that its text layer does not cover; returns a single-page PDF as bytes.
+
+    With `images_only`, for pages that do have a text layer, only images of at least
+    OCR_MIN_IMAGE_FRACTION of the page are searched, regions overlapping text-layer words are
+    left alone (their text would be extracted twice), and None is returned if no region remains.
+    """
+    within = None
+    if images_only:
+        min_area = OCR_MIN_IMAGE_FRACTION * page.rect.get_area()
+        within = [fitz.Rect(info["bbox"]) & page.rect for info in page.get_image_info()]
+        within = [rect for rect in within if rect.get_area() >= min_area]
+        if not within:
+            return None
+    valid, invalid = text_layer_words(page)
+    with telemetry.span("ocr", page=page.number, adaptive=True, images_only=images_only) as attrs:
+        regions = find_text_regions(page, covered=valid, within=within)
+        if images_only:
+            regions = [(rect, dpi) for rect, dpi in regions if not any(rect.intersects(word) for word in valid)]
+        attrs["regions"] = len(regions)
+        if images_only and not regions:
+            return None
+        pdfs = ocr_regions(page, regions)
+        result = _compose(page, [(rect, pdf) for (rect, _), pdf in zip(regions, pdfs)], invalid)
+    telemetry.count("pages_ocr")
+    return result
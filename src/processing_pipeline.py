@@ -1,142 +1,337 @@
 import os
 import json
+import time
+import logging
+import itertools
+import contextlib
+import collections
 import fitz
+from concurrent.futures import ProcessPoolExecutor
 from src.config import (
-    CHUNK_SIZE, CHUNK_OVERLAP, OCR_OUTPUT_PDF, DPI,
-    TEXT_OUTPUT_JSON, TABLES_OUTPUT_JSON
+    CHUNK_SIZE, CHUNK_OVERLAP, OUTPUT_DIR, OCR_OUTPUT_PDF, PDF_WORKERS, EXTRACTION_CACHE_ENABLED, TABLE_PRESCREEN_ENABLED,
+    TEXT_OUTPUT_JSON, TABLES_OUTPUT_JSON, OUTPUT_FORMAT, TEXT_OUTPUT_JSONL, TABLES_OUTPUT_JSONL, INGEST_CHECKPOINT
 )
 from src.document_parser import (
-    is_page_searchable, process_ocr, extract_tables_from_fitz_doc,
+    ocr_if_needed, may_contain_tables, open_table_document,
+    extract_tables_from_pdf_source, extract_tables_from_pdfium_page,
     extract_text_and_tables_from_docx, extract_text_and_tables_from_pptx
 )
-from src.text_utils import chunking_workflow, uniquify_columns
+from src.element_stream import ElementWriter, IngestCheckpoint
+from src.extraction_cache import ExtractionCache
+from src.text_utils import StreamingChunker, chunking_workflow, uniquify_columns
+from src.table_utils import compact_table, split_table
+from src import telemetry
 
-def create_elements_with_metadata(chunks, tables, input_file, text_positions=None, table_positions=None):
-    """Combines text chunks and tables into a single list of elements with metadata."""
+logger = logging.getLogger(__name__)
+
+def create_elements_with_metadata(chunks, tables, input_file, text_positions=None, table_positions=None, source=None):
+    """Combines text chunks and tables into a single list of elements with metadata.
+
+    Tables are stored in the compact columnar form and split into row groups of at most
+    TABLE_CHUNK_TOKENS, one element per group. Text chunks and table groups are numbered
+    (`chunk_id`) separately. Tables without a page (docx, pptx) are given the `chunk_id` of
+    their first group as `page_number`, so all groups of a table share one, as on PDF pages.
+    `source` names the document (default: the file name).
+    """
     elements = []
-    base_name = os.path.basename(input_file)
+    base_name = source or os.path.basename(input_file)
     # Add text chunks with position if available
     for i, chunk in enumerate(chunks, 1):
-        metadata = chunk.get("metadata", {})
-        metadata.update({
-            "source_document": base_name, "chunk_id": i, 
-            "position": text_positions[i-1] if text_positions and i-1 < len(text_positions) else None})
-        elements.append({"type": "text","content": chunk['text'],"metadata": metadata,"token_count": chunk['token_count']})
+        position = text_positions[i-1] if text_positions and i-1 < len(text_positions) else None
+        elements.append(text_element(chunk, base_name, i, position))
 
     # Add tables with position if available
-    for j, table in enumerate(tables, start=i+1):
+    groups = 0
+    for j, table in enumerate(tables, start=1):
         if isinstance(table, dict) and "metadata" in table:
             # PDF table with metadata
             meta = table["metadata"].copy()
-            meta.update({"source_document": base_name,"chunk_id": j})
             content = table.get("content", table)
+            table_id = f"p{meta.get('page_number')}-t{meta.get('table_index_on_page', j)}"
         else:
-            meta = {
-                "source_document": base_name,"chunk_id": j, 
-                "position": table_positions[j - (i+1)] if table_positions and (j - (i+1)) < len(table_positions) else j}
+            meta = {"position": table_positions[j-1] if table_positions and j-1 < len(table_positions) else j,
+                    "page_number": groups + 1}
             content = table
-        elements.append({"type": "table","content": content,"metadata": meta})
+            table_id = f"t{j}"
+        for group in split_table(compact_table(content), table_id=table_id):
+            groups += 1
+            elements.append({"type": "table","content": group,
+                             "metadata": {**meta, "source_document": base_name, "chunk_id": groups}})
 
     return elements
 
-def process_pdf_pages(input_pdf):
-    """Processes each page of a PDF, performs OCR if needed, and extracts text and tables."""
-    src = fitz.open(input_pdf)
-    ocr_doc = fitz.open()
-    tables, text_blocks = [], []
-    text_positions, table_positions = [], []
-    filename = os.path.basename(input_pdf)
-
-    for i, page in enumerate(src):
-        print(f"   📄 Processing Page {i + 1}/{len(src)}")
-        searchable = is_page_searchable(page)
-        temp_doc = None  # To manage OCR temp doc lifetime
-        if not searchable:
-            print(f"      🔎 Searchable: ❌ No, requires OCR")
-            temp_doc = process_ocr(page, dpi=DPI)
-            blocks_page = temp_doc[0]
-            page_tables = extract_tables_from_fitz_doc(temp_doc, 0)
-            ocr_doc.insert_pdf(temp_doc)
+def text_element(chunk, source, chunk_id, position=None):
+    """Returns the output element of a text chunk."""
+    metadata = chunk.get("metadata", {})
+    metadata.update({"source_document": source, "chunk_id": chunk_id, "position": position})
+    return {"type": "text", "content": chunk["text"], "metadata": metadata, "token_count": chunk["token_count"]}
+
+# gmft time of every page this process ran detection on, used to estimate time saved by the pre-screen.
+_table_timings = []
+
+def extract_page(src, page_number, tables_doc):
+    """Runs OCR (if needed) and table extraction on a single PDF page.
+
+    `tables_doc` is the source PDF opened once with `open_table_document`; OCR'd pages are
+    handed to pdfium straight from the OCR bytes, so no page is re-serialized for gmft.
+    """
+    page = src[page_number]
+    logger.info("📄 Processing page %d/%d", page_number + 1, len(src))
+    temp_doc = None  # To manage OCR temp doc lifetime
+    ocr_pdf = ocr_if_needed(page)
+    if ocr_pdf:
+        logger.debug("🔎 Page %d needed OCR", page_number + 1)
+        temp_doc = fitz.open("pdf", ocr_pdf)
+        blocks_page = temp_doc[0]
+    else:
+        blocks_page = page
+
+    page_tables, table_seconds = [], None
+    if not TABLE_PRESCREEN_ENABLED or may_contain_tables(blocks_page):
+        start = time.perf_counter()
+        if ocr_pdf:
+            page_tables = extract_tables_from_pdf_source(ocr_pdf, 0)
         else:
-            print(f"      🔎 Searchable: ✅ Yes")
-            blocks_page = page
-            page_tables = extract_tables_from_fitz_doc(src, i)
-
-        for idx, (bbox, df) in enumerate(page_tables, 1):
-            df.columns = uniquify_columns(df.columns.astype(str))
-            tables.append({
-                "type": "table",
-                "content": df.to_dict(orient="records"),
-                "metadata": {"page_number": i + 1,"columns": df.columns.tolist(),
-                    "table_index_on_page": idx,"position": bbox[1], "source_document": filename}})
-            table_positions.append(bbox[1])  # Save y-position
-
-        table_boxes = [box for box, _ in page_tables]
-        for block in blocks_page.get_text("blocks"):
-            if len(block) >= 5:
-                x0, y0, x1, y1, text = block[:5]
-                rect = fitz.Rect(x0, y0, x1, y1)
-                if not any(fitz.Rect(*box).intersects(rect) for box in table_boxes) and text.strip():
-                    text_blocks.append((i, y0, text.strip()))
-                    text_positions.append(y0)  # Save y-position
-
-    text_blocks.sort(key=lambda x: (x[0], x[1]))
-    full_text = "\n".join(text for _, _, text in text_blocks)
-    chunks = chunking_workflow(full_text, CHUNK_SIZE, CHUNK_OVERLAP)
-    chunk_positions = text_positions[:len(chunks)]
-    elements = create_elements_with_metadata(
-        chunks, [t for t in tables], input_pdf, text_positions=chunk_positions, table_positions=table_positions
-    )
-    return src, ocr_doc, elements
-
-
-def save_processed_output(elements, ocr_doc):
-    """Saves extracted text chunks and tables to JSON files."""
-    texts = [e for e in elements if e['type'] == 'text']
-    tables = [e for e in elements if e['type'] == 'table']
-
-    os.makedirs(os.path.dirname(TEXT_OUTPUT_JSON), exist_ok=True)
-
-    if texts:
-        with open(TEXT_OUTPUT_JSON, "w", encoding="utf-8") as f:
-            json.dump({"text_chunks": texts}, f, indent=2, ensure_ascii=False)
-    if tables:
-        with open(TABLES_OUTPUT_JSON, "w", encoding="utf-8") as f:
-            json.dump({"tables": tables}, f, indent=2, ensure_ascii=False)
-            
-    if ocr_doc and len(ocr_doc) > 0:
-        ocr_doc.save(OCR_OUTPUT_PDF)
+            page_tables = extract_tables_from_pdfium_page(tables_doc, page_number)
+        table_seconds = time.perf_counter() - start
+        _table_timings.append(table_seconds)
+    else:
+        saved = sum(_table_timings) / len(_table_timings) if _table_timings else 0.0
+        logger.debug("⏭ No table candidates on page %d, skipped gmft (~%.2fs saved)", page_number + 1, saved)
 
-def smart_file_processing(input_file, ocr_output_pdf="ocr_output.pdf"):
-    """Main function to process a file based on its extension."""
-    if not os.path.exists(input_file):
-        print(f"❌ File not found: {input_file}")
+    tables = []
+    for bbox, df in page_tables:
+        df.columns = uniquify_columns(df.columns.astype(str))
+        tables.append({"bbox": tuple(bbox), "content": compact_table(df)})
+
+    table_boxes = [table["bbox"] for table in tables]
+    text_blocks = []
+    for block in blocks_page.get_text("blocks"):
+        if len(block) >= 5:
+            x0, y0, x1, y1, text = block[:5]
+            rect = fitz.Rect(x0, y0, x1, y1)
+            if not any(fitz.Rect(*box).intersects(rect) for box in table_boxes) and text.strip():
+                text_blocks.append((y0, text.strip()))
+
+    if temp_doc: temp_doc.close()
+    return {"tables": tables, "text_blocks": text_blocks, "ocr_pdf": ocr_pdf, "table_seconds": table_seconds}
+
+# Per-process state for the page worker pool; each worker opens the PDF once.
+_worker_src, _worker_tables_doc = None, None
+
+def _init_page_worker(input_pdf, correlation_id="-"):
+    """Opens the source PDF once in each worker process."""
+    global _worker_src, _worker_tables_doc
+    telemetry.set_correlation_id(correlation_id)
+    _worker_src = fitz.open(input_pdf)
+    _worker_tables_doc = open_table_document(input_pdf)
+
+def _extract_page_in_worker(page_number):
+    """Returns the page result and the worker's metrics recorded since its previous page."""
+    return extract_page(_worker_src, page_number, _worker_tables_doc), telemetry.snapshot(reset=True)
+
+def _extract_missing(src, input_pdf, pages, workers):
+    """Yields the extraction results of `pages` in order, working at most 2 * `workers` pages ahead."""
+    if not pages:
         return
-    
+    if workers <= 1:
+        tables_doc = open_table_document(input_pdf)
+        try:
+            for i in pages:
+                yield extract_page(src, i, tables_doc)
+        finally:
+            tables_doc.close()
+        return
+    logger.info("⚙️ Extracting %d pages with %d worker processes", len(pages), workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                             initargs=(input_pdf, telemetry.current_correlation_id())) as pool:
+        queued, in_flight = iter(pages), collections.deque()
+        for i in itertools.islice(queued, 2 * workers):
+            in_flight.append(pool.submit(_extract_page_in_worker, i))
+        while in_flight:
+            result, metrics = in_flight.popleft().result()
+            telemetry.merge(metrics)
+            for i in itertools.islice(queued, 1):
+                in_flight.append(pool.submit(_extract_page_in_worker, i))
+            yield result
+
+def extract_pages(src, input_pdf, workers=PDF_WORKERS, cache=None):
+    """Yields the extraction result of every page of `src` in page order, as soon as it is ready.
+
+    Pages found in `cache` are not extracted again; the others are extracted here or, when
+    `workers` > 1, on a process pool. Results come in page order, so the output does not
+    depend on the worker count or on cache hits.
+    """
+    keys = [cache.page_key(src, i) for i in range(len(src))] if cache else [None] * len(src)
+    missing = [i for i, key in enumerate(keys) if key is None or not cache.has(key)]
+    extracted = _extract_missing(src, input_pdf, missing, min(workers or 1, len(missing)))
+    missing, timings, skipped = set(missing), [], 0
+    for i, key in enumerate(keys):
+        result = None if i in missing else cache.get(key)
+        if result is None:
+            # A cached page may have been evicted since the lookup above; it is extracted here.
+            if i in missing:
+                result = next(extracted)
+            else:
+                with contextlib.closing(_extract_missing(src, input_pdf, [i], 1)) as single:
+                    result = next(single)
+            if cache: cache.put(key, result)
+            if result["table_seconds"] is None:
+                skipped += 1
+            else:
+                timings.append(result["table_seconds"])
+        yield result
+
+    if timings and skipped:
+        saved = skipped * sum(timings) / len(timings)
+        logger.info("⏱ Table pre-screen skipped gmft on %d/%d pages (~%.1fs saved)", skipped, skipped + len(timings), saved)
+
+def iter_pdf_elements(input_pdf, workers=PDF_WORKERS, use_cache=EXTRACTION_CACHE_ENABLED, ocr_doc=None, source=None):
+    """Yields the elements of a PDF page by page, each as soon as its page is extracted.
+
+    A page's tables come with the page; text chunks come as soon as their token window is
+    complete (see StreamingChunker), so nothing waits for the rest of the document and
+    memory does not grow with it. OCR'd pages are appended to `ocr_doc` if one is given.
+    `source` names the document (default: the file name).
+    """
+    cache = ExtractionCache() if use_cache else None
+    filename = source or os.path.basename(input_pdf)
+    chunker = StreamingChunker(CHUNK_SIZE, CHUNK_OVERLAP)
+    counts = {"text": 0, "table": 0}
+
+    def text_elements(chunks):
+        for chunk, (page, y0) in chunks:
+            counts["text"] += 1
+            chunk["metadata"]["page_number"] = page + 1
+            yield text_element(chunk, filename, counts["text"], y0)
+
+    with fitz.open(input_pdf) as src:
+        for i, page_result in enumerate(extract_pages(src, input_pdf, workers, cache)):
+            for idx, table in enumerate(page_result["tables"], 1):
+                meta = {"page_number": i + 1, "table_index_on_page": idx, "position": table["bbox"][1],
+                        "source_document": filename}
+                for group in split_table(table["content"], table_id=f"p{i + 1}-t{idx}"):
+                    counts["table"] += 1
+                    yield {"type": "table", "content": group, "metadata": {**meta, "chunk_id": counts["table"]}}
+
+            with telemetry.span("chunking", page=i):
+                chunks = [chunk for y0, text in sorted(page_result["text_blocks"]) for chunk in chunker.add(text, (i, y0))]
+            yield from text_elements(chunks)
+
+            if page_result["ocr_pdf"] and ocr_doc is not None:
+                with fitz.open("pdf", page_result["ocr_pdf"]) as temp_doc:
+                    ocr_doc.insert_pdf(temp_doc)
+    yield from text_elements(chunker.finish())
+
+    if cache:
+        stats = cache.stats()
+        logger.info("🗄 Extraction cache: %d hits, %d misses, %.1f MB reused",
+                    stats["hits"], stats["misses"], stats["bytes_saved"] / 1024 ** 2)
+
+def output_paths(output_dir=OUTPUT_DIR):
+    """Returns the intermediate output file paths inside `output_dir`."""
+    if output_dir == OUTPUT_DIR:
+        return {"text_json": TEXT_OUTPUT_JSON, "tables_json": TABLES_OUTPUT_JSON, "text_jsonl": TEXT_OUTPUT_JSONL,
+                "tables_jsonl": TABLES_OUTPUT_JSONL, "ocr_pdf": OCR_OUTPUT_PDF}
+    return {
+        "text_json": os.path.join(output_dir, os.path.basename(TEXT_OUTPUT_JSON)),
+        "tables_json": os.path.join(output_dir, os.path.basename(TABLES_OUTPUT_JSON)),
+        "text_jsonl": os.path.join(output_dir, os.path.basename(TEXT_OUTPUT_JSONL)),
+        "tables_jsonl": os.path.join(output_dir, os.path.basename(TABLES_OUTPUT_JSONL)),
+        "ocr_pdf": os.path.join(output_dir, os.path.basename(OCR_OUTPUT_PDF)),
+    }
+
+def save_processed_output(elements, ocr_doc, output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT):
+    """Saves extracted text chunks and tables as JSONL streams or JSON files (see OUTPUT_FORMAT).
+
+    `elements` may be a lazy iterator; with JSONL each element is written as soon as it is
+    produced. `ocr_doc` is saved once `elements` is exhausted. Returns the number of elements.
+    """
+    paths = output_paths(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+
+    if output_format == "jsonl":
+        if output_dir == OUTPUT_DIR:
+            IngestCheckpoint(INGEST_CHECKPOINT).clear()
+        with ElementWriter(paths["text_jsonl"]) as texts, ElementWriter(paths["tables_jsonl"]) as tables:
+            for element in elements:
+                (texts if element["type"] == "text" else tables).write(element)
+                count += 1
+    else:
+        by_type = {"text": [], "table": []}
+        for element in elements:
+            by_type[element["type"]].append(element)
+            count += 1
+        if by_type["text"]:
+            with open(paths["text_json"], "w", encoding="utf-8") as f:
+                json.dump({"text_chunks": by_type["text"]}, f, indent=2, ensure_ascii=False)
+        if by_type["table"]:
+            with open(paths["tables_json"], "w", encoding="utf-8") as f:
+                json.dump({"tables": by_type["table"]}, f, indent=2, ensure_ascii=False)
+
+    if ocr_doc and len(ocr_doc) > 0:
+        ocr_doc.save(paths["ocr_pdf"])
+    return count
+
+def iter_file_elements(input_file, workers=PDF_WORKERS, ocr_doc=None, source=None):
+    """Yields the elements of a file based on its extension, page by page for PDFs.
+
+    `source` names the document in the elements (default: the file name). Time spent
+    producing them is recorded as the "parse" stage. Raises ValueError for an unsupported
+    file type.
+    """
+    source = source or os.path.basename(input_file)
     ext = os.path.splitext(input_file)[1].lower()
-    print(f"📁 Processing file: {input_file}")
-    
-    src, ocr_doc, elements = None, None, []
-    
+    if ext not in (".pdf", ".docx", ".pptx"):
+        raise ValueError(f"Unsupported file type: {ext}")
+    logger.info("📁 Processing file: %s", input_file)
     if ext == ".pdf":
-        src, ocr_doc, elements = process_pdf_pages(input_file)
-    elif ext == ".docx":
-        texts, tables = extract_text_and_tables_from_docx(input_file)
-        full_text = "\\n".join(texts)
-        chunks = chunking_workflow(full_text, CHUNK_SIZE, CHUNK_OVERLAP)
-        elements = create_elements_with_metadata(chunks, tables, input_file)
-    elif ext == ".pptx":
-        texts, tables = extract_text_and_tables_from_pptx(input_file)
-        full_text = "\\n".join(texts)
-        chunks = chunking_workflow(full_text, CHUNK_SIZE, CHUNK_OVERLAP)
-        elements = create_elements_with_metadata(chunks, tables, input_file)
+        elements = iter_pdf_elements(input_file, workers=workers, ocr_doc=ocr_doc, source=source)
     else:
-        print(f"❌ Unsupported file type: {ext}")
+        elements = _office_elements(input_file, ext, source)
+    busy, start = 0.0, time.perf_counter()
+    for element in elements:
+        busy += time.perf_counter() - start
+        yield element
+        start = time.perf_counter()
+    busy += time.perf_counter() - start
+    telemetry.observe("parse", busy, source=source)
+
+def _office_elements(input_file, ext, source):
+    extract = extract_text_and_tables_from_docx if ext == ".docx" else extract_text_and_tables_from_pptx
+    texts, tables = extract(input_file)
+    chunks = chunking_workflow("\\n".join(texts), CHUNK_SIZE, CHUNK_OVERLAP)
+    return create_elements_with_metadata(chunks, tables, input_file, source=source)
+
+def process_file(input_file, workers=PDF_WORKERS, keep_ocr=True, source=None):
+    """Opens a file for parsing without writing any output.
+
+    `source` names the document in its elements (default: the file name; see
+    `manifest.source_name`). Returns (elements, ocr_doc), or None if the file is missing or unsupported. `elements`
+    is a lazy iterator, parsing as it is consumed, and `ocr_doc` holds the OCR'd pages
+    consumed so far (None for non-PDF files or without `keep_ocr`). The caller owns
+    `ocr_doc` and must close it.
+    """
+    if not os.path.exists(input_file):
+        logger.error("❌ File not found: %s", input_file)
+        return None
+    if not input_file.lower().endswith((".pdf", ".docx", ".pptx")):
+        logger.error("❌ Unsupported file type: %s", os.path.splitext(input_file)[1].lower())
+        return None
+    ocr_doc = fitz.open() if keep_ocr and input_file.lower().endswith(".pdf") else None
+    return iter_file_elements(input_file, workers, ocr_doc, source), ocr_doc
+
+def smart_file_processing(input_file, ocr_output_pdf="ocr_output.pdf", workers=PDF_WORKERS):
+    """Main function to process a file based on its extension."""
+    result = process_file(input_file, workers=workers)
+    if result is None:
         return
+    elements, ocr_doc = result
+
+    with telemetry.correlation(prefix="doc-", inherit=True), telemetry.span("save_output"):
+        save_processed_output(elements, ocr_doc)
 
-    save_processed_output(elements, ocr_doc)
-    
-    if src: src.close()
     if ocr_doc: ocr_doc.close()
 
-    print(f"\n✅ Processing done! Output saved to '{os.path.dirname(TEXT_OUTPUT_JSON)}/' directory.")
\ No newline at end of file
+    logger.info("✅ Processing done! Output saved to '%s/' directory.", os.path.dirname(TEXT_OUTPUT_JSON))
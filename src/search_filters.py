@@ -0,0 +1,68 @@
+"""Retrieval filters and the per-document partitions they are served from.
+
+Filters are a dict with any of:
+    sources    a document name or list of names (the `source` field)
+    page_min   first page, inclusive (the `page_no` field)
+    page_max   last page, inclusive
+    types      "text", "table" or a list of them; selects the collections searched
+Each source document is stored in its own partition (see PARTITION_BY_SOURCE), so a search
+restricted to some sources only scans their partitions.
+"""
+import json
+import hashlib
+
+DEFAULT_PARTITION = "_default"
+DATA_TYPES = ("text", "table")
+
+def partition_name(source):
+    """Name of the partition holding `source`'s chunks (Milvus allows only letters, digits and '_')."""
+    return "doc_" + hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+def normalize_filters(filters):
+    """Validates `filters` and returns them in canonical form, or None if they filter nothing.
+
+    Raises ValueError for unknown keys or values of the wrong type.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(filters) - {"sources", "page_min", "page_max", "types"}
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+    normalized = {}
+    if filters.get("sources"):
+        sources = _as_list(filters["sources"])
+        if not all(isinstance(source, str) and source for source in sources):
+            raise ValueError("'sources' must be a document name or a list of them")
+        normalized["sources"] = sorted(set(sources))
+    for key in ("page_min", "page_max"):
+        if filters.get(key) is not None:
+            if not isinstance(filters[key], int) or isinstance(filters[key], bool):
+                raise ValueError(f"'{key}' must be an integer")
+            normalized[key] = filters[key]
+    if filters.get("types"):
+        types = _as_list(filters["types"])
+        if not set(types) <= set(DATA_TYPES):
+            raise ValueError(f"'types' must be among {', '.join(DATA_TYPES)}")
+        normalized["types"] = sorted(set(types))
+    return normalized or None
+
+def filter_expression(filters):
+    """Returns the Milvus boolean expression for the field conditions of `filters` ("" for none)."""
+    filters = filters or {}
+    clauses = []
+    if "sources" in filters:
+        clauses.append(f"source in {json.dumps(filters['sources'], ensure_ascii=False)}")
+    if "page_min" in filters:
+        clauses.append(f"page_no >= {int(filters['page_min'])}")
+    if "page_max" in filters:
+        clauses.append(f"page_no <= {int(filters['page_max'])}")
+    return " and ".join(clauses)
+
+def filters_key(filters):
+    """A hashable key identifying `filters`, e.g. to batch queries that share them."""
+    return json.dumps(filters, sort_keys=True) if filters else ""
@@ -0,0 +1,384 @@
+"""A long-running query service that keeps the encoder and collections warm.
+
+Concurrent queries are gathered into micro-batches that share one encoder call and one
+multi-vector search per collection. Endpoints (JSON over HTTP/1.1, TCP or Unix socket):
+    GET  /health     liveness plus load and batching statistics
+    GET  /metrics    stage timings and counters in the Prometheus text format
+    POST /retrieve   {"query": "..."} or {"queries": [...]}, optional "top_k"
+    POST /answer     {"query": "..."}, optional "top_k" and "stream": true for server-sent events
+Both POST endpoints take optional "filters", e.g. {"sources": ["a.pdf"], "page_min": 3,
+"page_max": 7, "types": ["table"]} (see src/search_filters.py).
+
+Start it with:
+    python main.py --serve [--host 127.0.0.1 --port 8000 | --socket /tmp/rag.sock]
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import (
+    SERVER_HOST, SERVER_PORT, SERVER_BATCH_WINDOW, SERVER_MAX_BATCH, SERVER_MAX_CONCURRENCY, SERVER_MAX_PENDING,
+    SERVER_GENERATION_WORKERS
+)
+from src.search_filters import normalize_filters, filters_key
+from src import telemetry
+
+MAX_BODY_BYTES = 1 << 20
+logger = logging.getLogger(__name__)
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class MicroBatcher:
+    """Coalesces concurrent retrievals into batched `retrieve_with_vectors` calls.
+
+    An idle batcher waits up to `window` seconds after the first query for others to arrive;
+    while a batch is running, newly arriving queries queue up and form the next batch, so
+    batches grow with load. Queries of a batch with different filters are retrieved in one
+    call per distinct set of filters.
+    """
+
+    def __init__(self, manager, window=SERVER_BATCH_WINDOW, max_batch=SERVER_MAX_BATCH):
+        self.manager = manager
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-batch")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def retrieve(self, query, top_k=5, filters=None):
+        """Returns (query_vec, hits) for `query`, restricted by normalized `filters`, once its batch has run."""
+        future = asyncio.get_running_loop().create_future()
+        future.correlation_id = telemetry.current_correlation_id()
+        await self._queue.put((query, top_k, filters, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            batch = [item for item in batch if not item[3].done()]  # Drop requests whose clients went away
+            if not batch:
+                continue
+            groups = {}
+            for item in batch:
+                groups.setdefault(filters_key(item[2]), []).append(item)
+            for group in groups.values():
+                await self._retrieve_group(loop, group)
+
+    async def _retrieve_group(self, loop, batch):
+        """Runs one batched retrieval for queries sharing the same filters and resolves their futures."""
+        queries = [query for query, _, _, _ in batch]
+        top_k = max(k for _, k, _, _ in batch)
+        filters = batch[0][2]
+        logger.debug("Retrieving a batch of %d for %s", len(batch), ", ".join(f.correlation_id for *_, f in batch))
+        try:
+            with telemetry.correlation(prefix="batch-"):
+                query_vecs, results = await loop.run_in_executor(
+                    self._executor, contextvars.copy_context().run, self.manager.retrieve_with_vectors,
+                    queries, top_k, filters)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done(): future.set_exception(e)
+            return
+        self.batches += 1
+        self.queries += len(batch)
+        telemetry.count("retrieval_batches")
+        telemetry.count("batched_queries", len(batch))
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, k, _, future), query_vec, hits in zip(batch, query_vecs, results):
+            if not future.done(): future.set_result((query_vec, hits[:k]))
+
+class QueryServer:
+    """Serves retrieval and RAG answers from one warm MilvusManager.
+
+    At most `max_concurrency` requests are processed at once; up to `max_pending` in total
+    may be processing or waiting, and further requests are rejected with 503 so clients back off.
+    """
+
+    def __init__(self, manager, max_concurrency=SERVER_MAX_CONCURRENCY, max_pending=SERVER_MAX_PENDING,
+                 generation_workers=SERVER_GENERATION_WORKERS, batch_window=SERVER_BATCH_WINDOW,
+                 max_batch=SERVER_MAX_BATCH):
+        self.manager = manager
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.generation_workers = generation_workers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.pending = 0
+        self.rejected = 0
+        self.served = 0
+        self.started = time.time()
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, socket_path=None):
+        """Warms up the manager and serves until cancelled."""
+        from src.index_manager import serving
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.manager.warm_up)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._generation_pool = ThreadPoolExecutor(max_workers=self.generation_workers, thread_name_prefix="generation")
+        self.batcher = MicroBatcher(self.manager, window=self.batch_window, max_batch=self.max_batch)
+        self.batcher.start()
+        if socket_path:
+            server = await asyncio.start_unix_server(self._handle_connection, path=socket_path)
+            logger.info("🚀 Query server listening on unix:%s", socket_path)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+            logger.info("🚀 Query server listening on http://%s:%d", host, server.sockets[0].getsockname()[1])
+        try:
+            with serving():  # Keeps other processes from rebuilding the indexes being searched
+                async with server:
+                    await server.serve_forever()
+        finally:
+            await self.batcher.close()
+            self._generation_pool.shutdown(wait=False)
+
+    # ----- HTTP plumbing -------------------------------------------------------------------
+
+    @staticmethod
+    async def _read_request(reader):
+        """Reads one HTTP/1.1 request; returns (method, path, headers, body) or None at EOF."""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, path, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0].rstrip("/") or "/", headers, body
+
+    @staticmethod
+    def _write_head(writer, status, content_type, extra=()):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}", *extra]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _write_body(self, writer, status, body, content_type, keep_alive=True):
+        extra = [f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            extra.append("Retry-After: 1")
+        self._write_head(writer, status, content_type, extra)
+        writer.write(body)
+        await writer.drain()
+
+    async def _write_json(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await self._write_body(writer, status, body, "application/json", keep_alive)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._write_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if not await self._dispatch(writer, method, path, body, keep_alive):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method, path, body, keep_alive):
+        """Routes one request; returns whether the connection may be reused."""
+        if method == "GET" and path == "/health":
+            await self._write_json(writer, 200, self.health(), keep_alive)
+            return keep_alive
+        if method == "GET" and path == "/metrics":
+            body = telemetry.render_prometheus().encode("utf-8")
+            await self._write_body(writer, 200, body, "text/plain; version=0.0.4", keep_alive)
+            return keep_alive
+        routes = {"/retrieve": self._retrieve, "/answer": self._answer}
+        if method != "POST" or path not in routes:
+            await self._write_json(writer, 404, {"error": f"Unknown endpoint {method} {path}"}, keep_alive)
+            return keep_alive
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            telemetry.count("requests_rejected")
+            await self._write_json(writer, 503, {"error": "Server busy, retry later"}, keep_alive)
+            return keep_alive
+
+        self.pending += 1
+        try:
+            with telemetry.correlation(prefix="req-"), telemetry.span(f"http_{path.strip('/')}") as attrs:
+                async with self._semaphore:
+                    try:
+                        request = json.loads(body or b"{}")
+                        if not isinstance(request, dict):
+                            raise HTTPError(400, "Request body must be a JSON object")
+                        reused = await routes[path](writer, request, keep_alive)
+                    except HTTPError as e:
+                        attrs["status"] = e.status
+                        await self._write_json(writer, e.status, {"error": str(e)}, keep_alive)
+                        return keep_alive
+                    except json.JSONDecodeError as e:
+                        attrs["status"] = 400
+                        await self._write_json(writer, 400, {"error": f"Invalid JSON: {e}"}, keep_alive)
+                        return keep_alive
+                    except (ConnectionError, asyncio.CancelledError):
+                        raise
+                    except Exception as e:
+                        logger.exception("❌ %s failed", path)
+                        attrs["status"] = 500
+                        await self._write_json(writer, 500, {"error": str(e)}, keep_alive=False)
+                        return False
+                attrs["status"] = 200
+            self.served += 1
+            return reused
+        finally:
+            self.pending -= 1
+
+    # ----- endpoints -----------------------------------------------------------------------
+
+    def health(self):
+        batcher = self.batcher
+        return {
+            "status": "ok", "uptime_seconds": round(time.time() - self.started, 1),
+            "pending": self.pending, "served": self.served, "rejected": self.rejected,
+            "batches": batcher.batches, "largest_batch": batcher.largest_batch,
+            "mean_batch": round(batcher.queries / batcher.batches, 2) if batcher.batches else 0.0,
+        }
+
+    @staticmethod
+    def _query_and_top_k(request):
+        query = request.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "'query' must be a non-empty string")
+        return query, QueryServer._top_k(request)
+
+    @staticmethod
+    def _top_k(request):
+        top_k = request.get("top_k", 5)
+        if not isinstance(top_k, int) or not 1 <= top_k <= 100:
+            raise HTTPError(400, "'top_k' must be an integer between 1 and 100")
+        return top_k
+
+    @staticmethod
+    def _filters(request):
+        try:
+            return normalize_filters(request.get("filters"))
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid 'filters': {e}")
+
+    async def _retrieve(self, writer, request, keep_alive):
+        format_chunks = self.manager._format_chunks
+        filters = self._filters(request)
+        if "queries" in request:
+            queries, top_k = request["queries"], self._top_k(request)
+            if not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+                raise HTTPError(400, "'queries' must be a list of non-empty strings")
+            results = await asyncio.gather(*(self.batcher.retrieve(q, top_k, filters) for q in queries))
+            payload = {"results": [format_chunks(hits) for _, hits in results]}
+        else:
+            query, top_k = self._query_and_top_k(request)
+            _, hits = await self.batcher.retrieve(query, top_k, filters)
+            payload = {"chunks": format_chunks(hits)}
+        await self._write_json(writer, 200, payload, keep_alive)
+        return keep_alive
+
+    async def _generate(self, fn, *args):
+        """Runs `fn(*args)` on the generation pool under the request's correlation ID."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._generation_pool, contextvars.copy_context().run, fn, *args)
+
+    async def _answer(self, writer, request, keep_alive):
+        query, top_k = self._query_and_top_k(request)
+        retrieved = await self.batcher.retrieve(query, top_k, self._filters(request))
+        loop = asyncio.get_running_loop()
+        if not request.get("stream"):
+            answer, chunks = await self._generate(self.manager.rag_answer, query, retrieved)
+            await self._write_json(writer, 200, {"answer": answer, "chunks": chunks}, keep_alive)
+            return keep_alive
+
+        tokens, chunks = await self._generate(self.manager.rag_answer_stream, query, retrieved)
+        self._write_head(writer, 200, "text/event-stream", ["Cache-Control: no-cache", "Connection: close"])
+        writer.write(f"data: {json.dumps({'chunks': chunks}, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def pump():
+            try:
+                for token in tokens:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, token)
+            finally:
+                # Closing the generator ends the LLM stream and skips caching a partial answer.
+                close = getattr(tokens, "close", None)
+                if close: close()
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        pumping = asyncio.ensure_future(self._generate(pump))
+        try:
+            while (token := await queue.get()) is not None:
+                writer.write(f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await writer.drain()
+        finally:
+            cancelled.set()
+        try:
+            await pumping
+        except Exception as e:
+            writer.write(f"data: {json.dumps({'error': str(e)})}\n\n".encode("utf-8"))
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+        return False
+
+def run_server(manager, host=SERVER_HOST, port=SERVER_PORT, socket_path=None):
+    """Runs a QueryServer for `manager` until interrupted."""
+    try:
+        asyncio.run(QueryServer(manager).serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        logger.info("👋 Query server stopped.")
@@ -0,0 +1,50 @@
+import os
+import logging
+
+from src.config import PDF_WORKERS, SUPPORTED_EXTENSIONS
+from src.manifest import DocumentManifest, file_sha256, source_name
+from src.processing_pipeline import process_file
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+def find_documents(directory):
+    """Returns the supported documents under `directory`, sorted by path."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(SUPPORTED_EXTENSIONS))
+    return sorted(paths)
+
+def sync_directory(directory, milvus_manager, workers=PDF_WORKERS):
+    """Reconciles the vector store with the documents in `directory`.
+
+    Unchanged documents (same content hash as in the manifest) are skipped without parsing,
+    new or changed ones are re-processed and only their new chunks embedded, and documents
+    that disappeared from the directory are deleted. Documents are named by their path
+    relative to `directory`, so same-named files in different subfolders are kept apart.
+    """
+    # Connecting may drop manifest entries of recreated collections, so it comes before loading it.
+    milvus_manager.connect()
+    manifest = DocumentManifest()
+    present = set()
+    for path in find_documents(directory):
+        source = source_name(path, directory)
+        present.add(source)
+        content_hash = file_sha256(path)
+        if manifest.content_hash(source) == content_hash:
+            logger.info("⏭ Unchanged: %s", source)
+            continue
+
+        with telemetry.correlation(prefix="doc-"):
+            result = process_file(path, workers=workers, keep_ocr=False, source=source)
+            if result is None:
+                continue
+            elements, _ = result
+            # Pages are parsed as the manager consumes them, so embedding overlaps parsing.
+            milvus_manager.sync_document(source, elements, manifest, content_hash=content_hash, path=path)
+
+    for source in sorted(manifest.sources() - present):
+        logger.info("🗑 Removing '%s' (no longer in '%s')", source, directory)
+        milvus_manager.delete_document(source, manifest)
+
+    milvus_manager.print_status()
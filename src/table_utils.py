@@ -0,0 +1,80 @@
+"""Compact columnar tables: the header once, every row as a plain array.
+
+A table is `{"columns": [...], "rows": [[...], ...]}`. Tables larger than TABLE_CHUNK_TOKENS
+are split into row groups that each repeat the header and also carry `table_id` and
+`part` ([index, count], 1-based), so the full table can be put back together at answer time.
+"""
+import json
+import math
+
+from src.config import TABLE_CHUNK_TOKENS
+from src.text_utils import count_tokens
+
+def _cell(value):
+    """Normalizes a cell to a JSON scalar; missing values become empty strings."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value if isinstance(value, (str, int, float, bool)) else str(value)
+
+def compact_table(table):
+    """Converts a DataFrame, a list of records or a list of rows (header first) to the compact form."""
+    if isinstance(table, dict) and "rows" in table:
+        return table
+    if hasattr(table, "columns") and hasattr(table, "values"):  # pandas DataFrame
+        columns, rows = list(table.columns), table.values.tolist()
+    elif table and isinstance(table[0], dict):
+        columns = list(dict.fromkeys(key for record in table for key in record))
+        rows = [[record.get(column) for column in columns] for record in table]
+    else:
+        rows = [list(row) for row in table or []]
+        columns, rows = (rows[0], rows[1:]) if rows else ([], [])
+    return {"columns": [str(c) for c in columns], "rows": [[_cell(v) for v in row] for row in rows]}
+
+def dumps_table(table):
+    """Serializes a compact table (or row group) as stored in the vector store, without whitespace."""
+    return json.dumps(table, ensure_ascii=False, separators=(",", ":"))
+
+def loads_table(content):
+    """Parses stored table content, including the older list-of-records JSON; None if it is not a table."""
+    try:
+        data = json.loads(content) if isinstance(content, str) else content
+    except ValueError:
+        return None
+    if isinstance(data, list):
+        return compact_table(data)
+    return data if isinstance(data, dict) and "rows" in data else None
+
+def render_table(table):
+    """Renders a compact table as pipe-separated lines, header first, for prompts and display."""
+    lines = [" | ".join(table["columns"])]
+    lines += [" | ".join(str(value) for value in row) for row in table["rows"]]
+    return "\n".join(lines)
+
+def split_table(table, max_tokens=TABLE_CHUNK_TOKENS, table_id=None):
+    """Splits a compact table into row groups of at most about `max_tokens` tokens each.
+
+    A table that fits is returned unchanged as the only group. A row that is larger than the
+    budget on its own still becomes a (single-row) group.
+    """
+    header_tokens = count_tokens(dumps_table({"columns": table["columns"], "rows": []}))
+    groups, current, used = [], [], header_tokens
+    for row in table["rows"]:
+        row_tokens = count_tokens(dumps_table(row)) + 1
+        if current and used + row_tokens > max_tokens:
+            groups.append(current)
+            current, used = [], header_tokens
+        current.append(row)
+        used += row_tokens
+    groups.append(current)
+    if len(groups) == 1:
+        return [table]
+    return [{"table_id": table_id, "part": [i, len(groups)], "columns": table["columns"], "rows": rows}
+            for i, rows in enumerate(groups, 1)]
+
+def reassemble_table(parts):
+    """Joins row groups of one table, in any order; returns None unless every group is present."""
+    by_index = {part["part"][0]: part for part in parts}
+    count = parts[0]["part"][1] if parts else 0
+    if not count or sorted(by_index) != list(range(1, count + 1)):
+        return None
+    return {"columns": by_index[1]["columns"], "rows": [row for i in range(1, count + 1) for row in by_index[i]["rows"]]}
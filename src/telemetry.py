@@ -0,0 +1,291 @@
+"""Timing spans, counters, correlation IDs, metric exporters and a sampling profiler.
+
+Instrumented code wraps each pipeline stage in `span(stage)`; every span feeds the
+`rag_stage_seconds` histogram, is logged at DEBUG, and is appended as one JSON line to
+TELEMETRY_JSONL when set. `correlation(...)` tags everything that happens inside it (log
+records, spans) with a per-document or per-query ID. Metrics are exposed in Prometheus text
+format by `render_prometheus()`, the query server's /metrics endpoint, or
+`start_metrics_server(port)` for CLI runs. Worker processes hand their metrics back with
+`snapshot()` and the parent folds them in with `merge()`.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import functools
+import contextlib
+import contextvars
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.config import LOG_LEVEL, TELEMETRY_JSONL, PROFILE_INTERVAL
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, float("inf"))
+LOG_FORMAT = "%(asctime)s %(levelname)-7s [%(correlation_id)s] %(name)s: %(message)s"
+
+_correlation_id = contextvars.ContextVar("correlation_id", default="-")
+logger = logging.getLogger(__name__)
+
+# ----- correlation IDs and logging ---------------------------------------------------------------
+
+def current_correlation_id():
+    return _correlation_id.get()
+
+def set_correlation_id(correlation_id):
+    """Sets the correlation ID for the rest of the current context, e.g. in a worker process."""
+    _correlation_id.set(correlation_id)
+
+@contextlib.contextmanager
+def correlation(correlation_id=None, prefix="", inherit=False):
+    """Runs the block under `correlation_id` (a new short random ID if None) and yields it.
+
+    With `inherit`, an ID that is already active is kept, so a document processed as part of
+    a larger operation keeps that operation's ID.
+    """
+    if inherit and _correlation_id.get() != "-":
+        correlation_id = _correlation_id.get()
+    correlation_id = correlation_id or f"{prefix}{uuid.uuid4().hex[:12]}"
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+def submit(executor, fn, *args, **kwargs):
+    """Submits `fn` to a thread pool so that it runs with the caller's correlation ID."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+class _CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get()
+        return True
+
+def configure_logging(level=LOG_LEVEL):
+    """Sends log records, tagged with the current correlation ID, to stderr at `level`."""
+    handler = logging.StreamHandler()
+    handler.addFilter(_CorrelationFilter())
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt="%H:%M:%S"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+# ----- metrics registry --------------------------------------------------------------------------
+
+class _Registry:
+    """Thread-safe counters and per-stage duration histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = collections.Counter()
+            self.stages = {}  # stage -> {"count", "sum", "errors", "buckets": [...]}
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(BUCKETS)}
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["errors"] += int(error)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+                    break
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            data = {"counters": dict(self.counters),
+                    "stages": {stage: dict(stats, buckets=list(stats["buckets"])) for stage, stats in self.stages.items()}}
+            if reset:
+                self.counters, self.stages = collections.Counter(), {}
+        return data
+
+    def merge(self, data):
+        with self._lock:
+            self.counters.update(data["counters"])
+            for stage, other in data["stages"].items():
+                stats = self.stages.setdefault(stage, {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(BUCKETS)})
+                for key in ("count", "sum", "errors"):
+                    stats[key] += other[key]
+                stats["buckets"] = [a + b for a, b in zip(stats["buckets"], other["buckets"])]
+
+_registry = _Registry()
+_jsonl_lock = threading.Lock()
+_jsonl_path = TELEMETRY_JSONL
+
+def configure(jsonl_path=None):
+    """Sets (or with "" disables) the JSON-lines span export file."""
+    global _jsonl_path
+    _jsonl_path = jsonl_path or ""
+    if _jsonl_path:
+        os.environ["TELEMETRY_JSONL"] = _jsonl_path  # Inherited by worker processes
+
+def _export(event):
+    if not _jsonl_path:
+        return
+    line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    with _jsonl_lock, open(_jsonl_path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+def observe(stage, seconds, error=None, **attrs):
+    """Records one completed `stage` that took `seconds`, with free-form `attrs` for the event log."""
+    _registry.observe(stage, seconds, error=error is not None)
+    logger.debug("%s took %.4fs %s", stage, seconds, attrs or "")
+    event = {"ts": round(time.time(), 6), "pid": os.getpid(), "stage": stage, "seconds": round(seconds, 6),
+             "correlation_id": _correlation_id.get(), **attrs}
+    if error is not None:
+        event["error"] = error
+    _export(event)
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    """Times the enclosed block as `stage`. Yields `attrs`, so the block can add details."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        observe(stage, time.perf_counter() - start, error=type(e).__name__, **attrs)
+        raise
+    observe(stage, time.perf_counter() - start, **attrs)
+
+def traced(stage):
+    """Decorator form of `span`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, value=1):
+    """Increments the counter `name` (exported as rag_<name>_total)."""
+    _registry.count(name, value)
+
+def snapshot(reset=False):
+    """Returns this process's metrics as plain data (optionally clearing them), e.g. to send to a parent."""
+    return _registry.snapshot(reset=reset)
+
+def merge(data):
+    """Adds metrics from `snapshot()` of another process into this one."""
+    if data:
+        _registry.merge(data)
+
+def summary():
+    """Returns per-stage (stage, count, total seconds, mean seconds, errors), slowest first."""
+    stages = _registry.snapshot()["stages"]
+    rows = [(stage, s["count"], s["sum"], s["sum"] / s["count"] if s["count"] else 0.0, s["errors"])
+            for stage, s in stages.items()]
+    return sorted(rows, key=lambda row: -row[2])
+
+def log_summary(level=logging.INFO):
+    """Logs where the time of this run went, one line per stage."""
+    rows = summary()
+    if not rows:
+        return
+    total = sum(row[2] for row in rows)
+    logger.log(level, "⏱ Time by stage (nested stages overlap):")
+    for stage, n, seconds, mean, errors in rows:
+        logger.log(level, "  %-16s %6d calls %9.3fs total %8.4fs mean %5.1f%%%s", stage, n, seconds, mean,
+                   100 * seconds / total if total else 0.0, f" ({errors} errors)" if errors else "")
+
+def render_prometheus():
+    """Renders all metrics in the Prometheus text exposition format."""
+    data = _registry.snapshot()
+    lines = ["# HELP rag_stage_seconds Duration of pipeline stages.", "# TYPE rag_stage_seconds histogram"]
+    for stage, stats in sorted(data["stages"].items()):
+        cumulative = 0
+        for bound, n in zip(BUCKETS, stats["buckets"]):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+        lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+    lines += ["# HELP rag_stage_errors_total Stages that raised.", "# TYPE rag_stage_errors_total counter"]
+    lines += [f'rag_stage_errors_total{{stage="{stage}"}} {stats["errors"]}' for stage, stats in sorted(data["stages"].items())]
+    for name, value in sorted(data["counters"].items()):
+        lines += [f"# TYPE rag_{name}_total counter", f"rag_{name}_total {value:g}"]
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200 if self.path.rstrip("/") in ("", "/metrics") else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics on a background thread for the lifetime of the process."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    logger.info("📈 Metrics at http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+# ----- sampling profiler -------------------------------------------------------------------------
+
+class SamplingProfiler:
+    """Samples every thread's Python stack every `interval` seconds from a background thread.
+
+    Stacks are aggregated in collapsed form ("outer;inner;leaf count"), ready for flamegraph.pl
+    or speedscope. Only this process is sampled; the cost is one stack walk per thread per tick.
+    """
+
+    def __init__(self, path, interval=PROFILE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+        logger.info("🔬 Wrote %d profile samples to '%s'", sum(self.samples.values()), self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
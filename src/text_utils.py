@@ -1,7 +1,11 @@
 import ftfy
+import bisect
 import tiktoken
+import functools
 import collections
 
+from src import telemetry
+
 def process_text_utf8(text):
     """Cleans and standardizes text to UTF-8."""
     if not isinstance(text, str):
@@ -12,40 +16,132 @@ def process_text_utf8(text):
     text = text.replace('\n', ' ').replace('\"', '')
     return text.strip()
 
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(name="cl100k_base"):
+    """Returns a shared tiktoken encoding; loading one is far more expensive than using it."""
+    return tiktoken.get_encoding(name)
+
 def count_tokens(text):
     """Counts the number of tokens in a text string."""
-    tokenizer = tiktoken.get_encoding("cl100k_base")
-    return len(tokenizer.encode(text))
+    return len(get_tokenizer().encode(text))
 
-def custom_chunking(text, chunk_size, overlap):
-    """Splits text into chunks based on token count."""
-    tokenizer = tiktoken.get_encoding("cl100k_base")
-    token_ids = tokenizer.encode(text)
+def _chunks_from_tokens(text, token_ids, chunk_size, overlap):
+    """Builds chunk dicts with token counts and character spans from one tokenization of `text`."""
+    if chunk_size <= overlap:
+        raise ValueError("chunk_size must be larger than overlap.")
+    if len(token_ids) <= chunk_size:
+        return [{"text": text, "metadata": {}, "token_count": len(token_ids), "char_span": (0, len(text))}]
+
+    _, offsets = get_tokenizer().decode_with_offsets(token_ids)
+    offsets.append(len(text))
     chunks = []
     start = 0
     while start < len(token_ids):
         end = min(start + chunk_size, len(token_ids))
-        chunk_token_ids = token_ids[start:end]
-        chunks.append(tokenizer.decode(chunk_token_ids))
+        char_start, char_end = offsets[start], offsets[end]
+        chunks.append({"text": text[char_start:char_end], "metadata": {}, "token_count": end - start,
+                       "char_span": (char_start, char_end)})
         start += chunk_size - overlap
     return chunks
 
-def chunking_workflow(text, max_tokens, overlap):
-    """Processes, cleans, and chunks text, returning structured data."""
-    clean_text = process_text_utf8(text)
+def custom_chunking(text, chunk_size, overlap):
+    """Splits text into chunks based on token count."""
+    return [chunk["text"] for chunk in chunk_clean_text(text, chunk_size, overlap)]
+
+@telemetry.traced("chunking")
+def chunk_clean_text(clean_text, chunk_size, overlap):
+    """Chunks already cleaned text, tokenizing it exactly once.
+
+    Each chunk carries its text, token count and `char_span`, the (start, end) character
+    offsets of the chunk within `clean_text`.
+    """
     if not clean_text:
         return []
-    
-    token_count = count_tokens(clean_text)
-    if token_count <= max_tokens:
-        return [{"text": clean_text, "metadata": {}, "token_count": token_count}]
-    
-    chunks = custom_chunking(clean_text, chunk_size=max_tokens, overlap=overlap)
+    return _chunks_from_tokens(clean_text, get_tokenizer().encode(clean_text), chunk_size, overlap)
+
+def chunking_workflow(text, max_tokens, overlap):
+    """Processes, cleans, and chunks text, returning structured data."""
+    return chunk_clean_text(process_text_utf8(text), max_tokens, overlap)
+
+@telemetry.traced("chunking")
+def chunking_workflow_batch(texts, max_tokens, overlap, num_threads=8):
+    """Cleans and chunks many documents at once, tokenizing them in parallel threads."""
+    clean_texts = [process_text_utf8(text) for text in texts]
+    token_batches = get_tokenizer().encode_batch(clean_texts, num_threads=num_threads)
     return [
-        {"text": chunk, "metadata": {}, "token_count": count_tokens(chunk)}
-        for chunk in chunks
+        _chunks_from_tokens(clean_text, token_ids, max_tokens, overlap) if clean_text else []
+        for clean_text, token_ids in zip(clean_texts, token_batches)
     ]
 
+class StreamingChunker:
+    """Chunks text that arrives block by block, emitting each chunk as soon as it is complete.
+
+    Blocks are cleaned and joined with single spaces, and the chunks are exactly those
+    `chunk_clean_text` makes of the whole joined text: a token never spans the space between
+    two stripped blocks, so tokenizing block by block gives the same tokens. A chunk is
+    emitted once a token after it exists, and only the text of unfinished chunks is kept.
+    Each block carries a `tag` (e.g. its page and position); a chunk is returned as
+    (chunk dict, tag of the block it starts in).
+    """
+
+    def __init__(self, chunk_size, overlap):
+        if chunk_size <= overlap:
+            raise ValueError("chunk_size must be larger than overlap.")
+        self.chunk_size, self.step = chunk_size, chunk_size - overlap
+        self._tokens, self._offsets = [], []  # Token IDs from token `_base` on, and their character offsets
+        self._base = 0
+        self._text, self._text_base = "", 0  # Joined text from character `_text_base` on
+        self._length = 0
+        self._block_starts, self._tags = [], []
+
+    def add(self, text, tag=None):
+        """Adds one block of raw text; returns the chunks it completes."""
+        clean = process_text_utf8(text)
+        if not clean:
+            return []
+        piece = " " + clean if self._length else clean
+        token_ids = get_tokenizer().encode(piece)
+        _, offsets = get_tokenizer().decode_with_offsets(token_ids)
+        self._tokens += token_ids
+        self._offsets += [self._length + offset for offset in offsets]
+        self._block_starts.append(self._length + len(piece) - len(clean))
+        self._tags.append(tag)
+        self._text += piece
+        self._length += len(piece)
+        return self._emit(final=False)
+
+    def finish(self):
+        """Returns the remaining chunks once every block has been added."""
+        return self._emit(final=True)
+
+    def _emit(self, final):
+        chunks = []
+        total = self._base + len(self._tokens)
+        while self._base < total and (final or self._base + self.chunk_size < total):
+            start, end = self._base, min(self._base + self.chunk_size, total)
+            char_start = self._offsets[0]
+            char_end = self._offsets[end - start] if end < total else self._length
+            text = self._text[char_start - self._text_base:char_end - self._text_base]
+            # A chunk's first token may be the space before a block; its first character decides.
+            first_char = char_start + len(text) - len(text.lstrip())
+            tag = self._tags[bisect.bisect_right(self._block_starts, first_char) - 1]
+            chunks.append(({"text": text, "metadata": {}, "token_count": end - start,
+                            "char_span": (char_start, char_end)}, tag))
+            if start == 0 and end == total:
+                break  # The whole text fits in one chunk
+            self._advance(self.step)
+        return chunks
+
+    def _advance(self, tokens):
+        """Drops the first `tokens` tokens and the text and blocks no later chunk can start in."""
+        del self._tokens[:tokens], self._offsets[:tokens]
+        self._base += tokens
+        keep_from = self._offsets[0] if self._offsets else self._length
+        self._text = self._text[keep_from - self._text_base:]
+        self._text_base = keep_from
+        first = max(bisect.bisect_right(self._block_starts, keep_from) - 1, 0)
+        del self._block_starts[:first], self._tags[:first]
+
 def uniquify_columns(cols):
     """Makes column names in a DataFrame unique by appending numbers."""
     counts = collections.Counter()
@@ -1,34 +1,235 @@
 import os
 import json
+import time
+import queue
+import logging
+import hashlib
+import threading
+import collections
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from tqdm import tqdm
-from dotenv import load_dotenv
-from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, list_collections
-from sentence_transformers import SentenceTransformer
-from mistralai import Mistral
 from src.config import (
-    MILVUS_HOST, MILVUS_PORT, TEXT_COLLECTION_NAME, TABLE_COLLECTION_NAME,
-    EMBEDDING_DIM, TEXT_OUTPUT_JSON, TABLES_OUTPUT_JSON
+    VECTOR_BACKEND, LOCAL_STORE_DIR, MILVUS_HOST, MILVUS_PORT, TEXT_COLLECTION_NAME, TABLE_COLLECTION_NAME,
+    EMBEDDING_MODEL, EMBEDDING_DIM, ENCODER_BACKEND, TEXT_OUTPUT_JSON, TABLES_OUTPUT_JSON, EMBED_BATCH_SIZE, INSERT_BATCH_SIZE,
+    EMBEDDING_CACHE_ENABLED, ANSWER_CACHE_ENABLED, OUTPUT_FORMAT, TEXT_OUTPUT_JSONL, TABLES_OUTPUT_JSONL, INGEST_CHECKPOINT,
+    TABLE_REASSEMBLE_MAX_TOKENS, CONTEXT_PACKING_ENABLED, PARTITION_BY_SOURCE, MAX_PARTITIONS, SCALAR_INDEX_FIELDS
 )
+from src.answer_cache import AnswerCache
+from src.context_packing import pack_context, render_block
+from src.element_stream import iter_elements, IngestCheckpoint
+from src.embedding_cache import EmbeddingCache
+from src.index_manager import IndexManager
+from src.llm import MistralGenerator
+from src.manifest import DocumentManifest
+from src.search_filters import DEFAULT_PARTITION, DATA_TYPES, partition_name, normalize_filters, filter_expression
+from src.table_utils import compact_table, dumps_table, loads_table, render_table, reassemble_table
+from src.text_utils import count_tokens
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+def chunk_primary_key(source, data_type, content, occurrence=1):
+    """Derives a stable 63-bit primary key for a chunk from its source, type and content.
+
+    `occurrence` distinguishes identical chunks repeated within the same document.
+    """
+    key = f"{source}\0{data_type}\0{occurrence}\0{content}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") & ((1 << 63) - 1)
+
+def _split_by_type(elements, data_types):
+    """Splits one pass over `elements` into a lazy stream per type.
+
+    Reading one stream holds back the elements of the other types it passes over, until
+    their stream is read.
+    """
+    elements = iter(elements)
+    buffers = {data_type: collections.deque() for data_type in data_types}
+
+    def stream(data_type):
+        buffer = buffers[data_type]
+        while True:
+            while buffer:
+                yield buffer.popleft()
+            element = next(elements, None)
+            if element is None:
+                return
+            buffers[element["type"]].append(element)
+
+    return {data_type: stream(data_type) for data_type in data_types}
+
+def _batched(iterable, size):
+    """Yields lists of up to `size` items from `iterable`."""
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+class BackgroundWriter:
+    """Runs collection writes on one background thread behind a bounded queue.
+
+    `submit` blocks while `depth` writes are queued, which applies back-pressure to the
+    embedding stage. An error raised by a write is re-raised by the next `submit` or `close`.
+    """
+
+    def __init__(self, depth=1):
+        self.depth = depth
+        self.rows_written, self.busy_seconds, self.max_queued = 0, 0.0, 0
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="milvus-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            context, fn, args, rows, callback = item
+            try:
+                if self._error is None:
+                    start = time.perf_counter()
+                    if fn: context.run(fn, *args)
+                    if callback: context.run(callback)
+                    self.busy_seconds += time.perf_counter() - start
+                    self.rows_written += rows
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+        self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, fn, *args, rows=0, callback=None):
+        """Queues `fn(*args)`, then `callback()`, blocking while the queue is full.
+
+        Both run with the submitter's context variables, so telemetry keeps its correlation ID.
+        """
+        self._raise_error()
+        self._queue.put((contextvars.copy_context(), fn, args, rows, callback))
+        self.max_queued = max(self.max_queued, self._queue.qsize())
+
+    def call(self, callback):
+        """Queues `callback()` to run once every write submitted before it has completed."""
+        self.submit(None, callback=callback)
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Waits for every queued write."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Waits for every queued write and stops the thread."""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+NO_CONTEXT_ANSWER = "I could not find relevant information to answer your question."
 
 class MilvusManager:
-    def __init__(self):
-        print("🔌 Connecting to Milvus...")
-        connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
-        print("✅ Connected to Milvus.")
-
-        print("🤖 Loading sentence transformer model...")
-        self.encoder = SentenceTransformer("all-MiniLM-L6-v2")
-        print("✅ Model loaded.")
-        
-        self.text_col = self._get_or_create_collection(TEXT_COLLECTION_NAME, "Text document chunks")
-        self.table_col = self._get_or_create_collection(TABLE_COLLECTION_NAME, "Table document chunks")
-        self._create_indexes_if_needed()
+    def __init__(self, generator=None, backend=VECTOR_BACKEND, encoder=None):
+        """Creates a manager; the encoder and the vector store connection are opened on first use.
+
+        `encoder` replaces the sentence transformer (anything with a compatible `encode`); its
+        embeddings are not cached.
+        """
+        if backend not in ("milvus", "local"):
+            raise ValueError(f"Unknown vector backend: {backend!r} (expected 'milvus' or 'local')")
+        self.backend = backend
+        self.store = None
+        self.embedding_cache = None
+        self.generator = generator or MistralGenerator()
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+        self.indexes = IndexManager()
+        self._encoder = encoder
+        self._collections = None
+        self._encoder_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._loaded = set()
+        self._partition_names = {}  # collection name -> names of its partitions
+        self._partition_lock = threading.Lock()
+        self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="milvus-search")
+
+    @property
+    def encoder(self):
+        """The sentence transformer (ENCODER_BACKEND), loaded on first access."""
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    from src.encoders import load_encoder, encoder_name
+                    with telemetry.span("load_encoder", model=EMBEDDING_MODEL, backend=ENCODER_BACKEND):
+                        # Each backend's vectors are cached separately; they differ slightly.
+                        self.embedding_cache = EmbeddingCache(encoder_name()) if EMBEDDING_CACHE_ENABLED else None
+                        self._encoder = load_encoder()
+                    logger.info("✅ Model loaded.")
+        return self._encoder
+
+    @property
+    def text_col(self):
+        return self.connect()["text"]
+
+    @property
+    def table_col(self):
+        return self.connect()["table"]
+
+    def connect(self):
+        """Connects to the vector store and opens both collections on first call; returns them by data type."""
+        if self._collections is not None:
+            return self._collections
+        with self._connect_lock:
+            if self._collections is not None:
+                return self._collections
+            with telemetry.span("connect", backend=self.backend):
+                if self.backend == "local":
+                    from src.local_store import LocalVectorStore
+                    self.store = LocalVectorStore(LOCAL_STORE_DIR)
+                    logger.info("📦 Using the embedded vector store in '%s'.", LOCAL_STORE_DIR)
+                else:
+                    from pymilvus import connections
+                    logger.info("🔌 Connecting to Milvus...")
+                    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+                    logger.info("✅ Connected to Milvus.")
+
+                existing = set(self._list_collections())
+                opened = {
+                    "text": self._get_or_create_collection(TEXT_COLLECTION_NAME, "Text document chunks"),
+                    "table": self._get_or_create_collection(TABLE_COLLECTION_NAME, "Table document chunks"),
+                }
+                self._create_indexes_if_needed(opened.values())
+                self._ensure_loaded(opened.values())
+            self._forget_missing_collections([data_type for data_type, col in opened.items() if col.name not in existing])
+            self._collections = opened
+        return self._collections
+
+    def warm_up(self):
+        """Loads the encoder while connecting to the vector store in the background."""
+        if self._encoder is not None and self._collections is not None:
+            return
+        connecting = self._search_pool.submit(self.connect)
+        self.encoder
+        connecting.result()
+
+    def _list_collections(self):
+        if self.store:
+            return self.store.list_collections()
+        from pymilvus import list_collections
+        return list_collections()
 
     def _get_or_create_collection(self, name, description):
         """Loads a collection or creates it if it doesn't exist."""
-        if name not in list_collections():
+        if self.store:
+            exists = name in self.store.list_collections()
+            collection = self.store.get_or_create(name, EMBEDDING_DIM, description)
+            logger.info("📁 Collection '%s' already exists." if exists else "✅ Collection '%s' created.", name)
+            return collection
+
+        from pymilvus import FieldSchema, CollectionSchema, DataType, Collection
+        if name not in self._list_collections():
             fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
                 FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
                 FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=512),
                 FieldSchema(name="page_no", dtype=DataType.INT64),
@@ -37,118 +238,577 @@ class MilvusManager:
             ]
             schema = CollectionSchema(fields=fields, description=description)
             collection = Collection(name, schema)
-            print(f"✅ Collection '{name}' created.")
+            logger.info("✅ Collection '%s' created.", name)
         else:
             collection = Collection(name=name)
-            print(f"📁 Collection '{name}' already exists.")
+            logger.info("📁 Collection '%s' already exists.", name)
+            if collection.schema.auto_id:
+                logger.warning("⚠️ '%s' uses auto-generated IDs; drop it to enable incremental, idempotent ingestion.", name)
         return collection
 
-    def _embed_and_insert(self, collection, data, data_type):
-        """Embeds content and inserts it into a Milvus collection."""
-        if not data: return
-        
-        embeddings, sources, pages, types, contents = [], [], [], [], []
-        print(f"📦 Preparing '{data_type}' data for insertion...")
+    def _encode(self, texts):
+        """Encodes a list of texts into a float32 array, reusing cached embeddings where possible."""
+        encoder = self.encoder
+        with telemetry.span("encode", texts=len(texts)):
+            if self.embedding_cache:
+                return self.embedding_cache.encode(encoder, texts, batch_size=EMBED_BATCH_SIZE)
+            return encoder.encode(texts, batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True)
+
+    def _collection_for(self, data_type):
+        return {"text": self.text_col, "table": self.table_col}[data_type]
+
+    def _forget_missing_collections(self, data_types):
+        """Drops manifest entries for collections that were just (re)created and are therefore empty."""
+        if not data_types: return
+        manifest = DocumentManifest()
+        for data_type in data_types:
+            manifest.forget(data_type)
+        manifest.save()
+
+    def _stored_ids(self, manifest, source, data_type):
+        """Returns the manifest's primary keys for `source`, if they can be trusted for this collection."""
+        if self._collection_for(data_type).schema.auto_id:
+            return set()
+        return manifest.ids(source, data_type)
+
+    def _partitions(self, col, refresh=False):
+        """Returns the (cached) set of partition names of `col`."""
+        with self._partition_lock:
+            if refresh or col.name not in self._partition_names:
+                self._partition_names[col.name] = {partition.name for partition in col.partitions}
+            return self._partition_names[col.name]
+
+    def _partition_for(self, col, source):
+        """Returns the partition `source`'s rows go to in `col`, creating it on first use.
+
+        Sources beyond MAX_PARTITIONS, or all of them without PARTITION_BY_SOURCE, share the default partition.
+        """
+        if not PARTITION_BY_SOURCE:
+            return DEFAULT_PARTITION
+        name = partition_name(source)
+        known = self._partitions(col)
+        with self._partition_lock:
+            if name not in known:
+                if len(known) >= MAX_PARTITIONS:
+                    logger.warning("⚠️ '%s' has %d partitions; '%s' goes to the default partition.", col.name,
+                                   len(known), source)
+                    return DEFAULT_PARTITION
+                col.create_partition(name)
+                known.add(name)
+        return name
+
+    def _search_partitions(self, col, sources):
+        """Partitions to search for `sources` (None = all): theirs plus the default one, which holds
+        documents ingested before partitioning or beyond MAX_PARTITIONS."""
+        if not sources or not PARTITION_BY_SOURCE:
+            return None
+        names = {partition_name(source) for source in sources}
+        known = self._partitions(col)
+        if not names <= known:
+            known = self._partitions(col, refresh=True)  # Another process may have added them
+        return [DEFAULT_PARTITION, *sorted(names & known)]
 
-        for i, chunk in enumerate(tqdm(data, desc=f"Embedding {data_type}s")):
-            content_str = json.dumps(chunk['content']) if isinstance(chunk['content'], (list, dict)) else chunk['content']
+    def _prepare_rows(self, data, data_type, is_stored=None, seen=None):
+        """Yields (line_no, pk, source, page_no, content) rows for every new, non-empty chunk.
+
+        `line_no` counts the input items consumed so far, which is what a resumed run skips.
+        Every chunk's primary key is recorded in `seen[source]`; chunks for which
+        `is_stored(source, pk)` is true are already in the collection and not yielded.
+        """
+        occurrences = collections.Counter()
+        for i, chunk in enumerate(data):
+            if data_type == "table" and isinstance(chunk['content'], (list, dict)):
+                content_str = dumps_table(compact_table(chunk['content']))
+            else:
+                content_str = json.dumps(chunk['content']) if isinstance(chunk['content'], (list, dict)) else chunk['content']
             if not content_str.strip(): continue
 
             metadata = chunk.get("metadata", {})
             source = metadata.get("source_document", "unknown")
             page_no = int(metadata.get("page_number", metadata.get("chunk_id", i)))
+            occurrences[(source, content_str)] += 1
+            pk = chunk_primary_key(source, data_type, content_str, occurrences[(source, content_str)])
+            if seen is not None:
+                seen.setdefault(source, set()).add(pk)
+            if is_stored and is_stored(source, pk): continue
+            yield i + 1, pk, source, page_no, content_str
 
-            emb = self.encoder.encode(content_str)
-            embeddings.append(emb.tolist())
-            sources.append(source)
-            pages.append(page_no)
-            types.append(data_type)
-            contents.append(content_str)
+    def _embed_and_insert(self, collection, data, data_type, on_progress=None, is_stored=None, seen=None, writer=None):
+        """Embeds content in batches and streams it into a Milvus collection.
 
-        if not embeddings:
-            print(f"⚠️ No valid '{data_type}' data found to insert.")
-            return
+        `data` may be any iterable, including a lazy JSONL reader. Each batch of
+        INSERT_BATCH_SIZE rows is encoded in one call (the encoder batches it by token length
+        and cached chunks are skipped) and handed to a
+        BackgroundWriter while the next batch is encoded, so memory stays bounded.
+        `on_progress(lines)` is called after each write completes. When a shared `writer` is
+        passed, writes may still be pending on return and flushing is left to the caller.
+        Returns the number of rows written.
+        """
+        if not data: return 0
+
+        # Collections created before deterministic keys were introduced still use auto_id.
+        explicit_ids = not collection.schema.auto_id
+        write_columns = collection.upsert if explicit_ids else collection.insert
+
+        def write(columns):
+            # Rows go to their source's partition; sources are the fourth column from the end.
+            rows_by_partition = collections.defaultdict(list)
+            for i, source in enumerate(columns[-4]):
+                rows_by_partition[self._partition_for(collection, source)].append(i)
+            with telemetry.span("insert", collection=collection.name, rows=len(columns[0]),
+                                partitions=len(rows_by_partition)):
+                for partition, rows in rows_by_partition.items():
+                    part = columns if len(rows) == len(columns[0]) else [[column[i] for i in rows] for column in columns]
+                    write_columns(part, partition_name=partition)
+            telemetry.count("rows_written", len(columns[0]))
+        own_writer = writer is None
+        writer = writer or BackgroundWriter(depth=1)
+
+        logger.info("📦 Embedding '%s' data in batches of %d...", data_type, INSERT_BATCH_SIZE)
+        total = 0
+        try:
+            with tqdm(desc=f"Embedding {data_type}s", unit="chunk") as progress:
+                for batch in _batched(self._prepare_rows(data, data_type, is_stored, seen), INSERT_BATCH_SIZE):
+                    lines, ids, sources, pages, contents = (list(col) for col in zip(*batch))
+                    embeddings = self._encode(contents)
+                    columns = [list(embeddings), sources, pages, [data_type] * len(batch), contents]
+                    callback = (lambda line=lines[-1]: on_progress(line)) if on_progress else None
+                    writer.submit(write, [ids] + columns if explicit_ids else columns, rows=len(batch), callback=callback)
+                    total += len(batch)
+                    progress.update(len(batch))
+        finally:
+            if own_writer: writer.close()
+
+        if not total:
+            logger.info("⚠️ No new '%s' data to insert.", data_type)
+            return 0
+
+        if own_writer:
+            self._flush(collection)
+            logger.info("✅ %d '%s' vectors upserted and flushed into '%s'.", total, data_type, collection.name)
+        return total
+
+    def _delete_ids(self, collection, ids):
+        """Deletes entities by primary key in bounded batches."""
+        for batch in _batched(sorted(ids), INSERT_BATCH_SIZE):
+            with telemetry.span("delete", collection=collection.name, rows=len(batch)):
+                collection.delete(f"id in {batch}")
+            telemetry.count("rows_deleted", len(batch))
+
+    def _flush(self, collection):
+        with telemetry.span("flush", collection=collection.name):
+            collection.flush()
+
+    def flush(self):
+        """Flushes both collections, making every completed write durable and visible.
 
-        print(f"🚀 Inserting {len(embeddings)} '{data_type}' vectors into '{collection.name}'...")
-        collection.insert([embeddings, sources, pages, types, contents])
-        collection.flush()
-        print(f"✅ Data successfully inserted and flushed into '{collection.name}'.")
+        Indexes are then rebuilt if a collection has outgrown its index type, and search
+        parameters re-tuned after a rebuild or substantial growth.
+        """
+        for data_type in ("text", "table"):
+            self._flush(self._collection_for(data_type))
+        self._maintain_indexes()
 
-    def ingest_data(self):
-        """Loads processed data from JSON files and ingests into Milvus."""
+    def _maintain_indexes(self, force_tuning=False, queries=None):
+        for col in self.connect().values():
+            if self.indexes.ensure(col, rebuild=True):
+                self._loaded.discard(col.name)
+                self._ensure_loaded([col])
+            if force_tuning or self.indexes.needs_tuning(col):
+                self.indexes.tune(col, queries=queries)
+
+    def tune_indexes(self, queries=None):
+        """Rebuilds outgrown indexes and re-tunes nprobe/ef now, optionally on sample query strings."""
+        vectors = [vec.tolist() for vec in self._encode(list(queries))] if queries else None
+        self._maintain_indexes(force_tuning=True, queries=vectors)
+
+    def _ingest(self, streams, manifest, reconcile=True, on_progress=None, sources=(), content_hash=None, path=None,
+                writer=None):
+        """Embeds and upserts the new chunks in `streams` ({data_type: elements}) and updates the manifest.
+
+        Chunks already recorded for their source are not embedded again. With `reconcile`,
+        chunks recorded for a source that no longer produces them are deleted; otherwise the
+        new keys are merged into the manifest (used when resuming a partial run). With a shared
+        `writer`, deletions and the manifest update run on it after this document's writes.
+        Returns the number of rows written.
+        """
+        seen = {data_type: {} for data_type in streams}
+        total = 0
+        for data_type, data in streams.items():
+            stored = {}
+            def is_stored(source, pk, data_type=data_type, stored=stored):
+                if source not in stored:
+                    stored[source] = self._stored_ids(manifest, source, data_type)
+                return pk in stored[source]
+            total += self._embed_and_insert(self._collection_for(data_type), data, data_type,
+                                            on_progress=(on_progress or {}).get(data_type), is_stored=is_stored,
+                                            seen=seen[data_type], writer=writer)
+
+        def update_manifest():
+            for source in set(sources).union(*(seen[data_type] for data_type in streams)):
+                ids_by_type = {}
+                for data_type in streams:
+                    new_ids = seen[data_type].get(source, set())
+                    old_ids = self._stored_ids(manifest, source, data_type)
+                    if reconcile:
+                        stale = old_ids - new_ids
+                        if stale:
+                            logger.info("🧹 Deleting %d superseded '%s' chunks of '%s'.", len(stale), data_type, source)
+                            self._delete_ids(self._collection_for(data_type), stale)
+                        ids_by_type[data_type] = new_ids
+                    else:
+                        ids_by_type[data_type] = new_ids | old_ids
+                manifest.set(source, ids_by_type, content_hash=content_hash, path=path)
+            manifest.save()
+
+        if writer:
+            writer.call(update_manifest)
+        else:
+            update_manifest()
+        return total
+
+    def _load_json_outputs(self):
+        """Loads the text chunks and tables written with OUTPUT_FORMAT = "json"."""
+        with open(TEXT_OUTPUT_JSON, "r", encoding="utf-8") as f:
+            text_data = json.load(f)["text_chunks"]
+        with open(TABLES_OUTPUT_JSON, "r", encoding="utf-8") as f:
+            table_data = json.load(f)["tables"]
+        return text_data, table_data
+
+    def ingest_data(self, resume=False):
+        """Loads processed data and ingests it into Milvus.
+
+        JSONL outputs are read lazily, so memory does not grow with the document. Only chunks
+        that are not already stored are embedded, and chunks from superseded versions of a
+        document are deleted. With `resume=True`, lines recorded in the ingest checkpoint by a
+        previous run are skipped.
+        """
+        checkpoint = IngestCheckpoint(INGEST_CHECKPOINT)
+        on_progress = {}
         try:
-            with open(TEXT_OUTPUT_JSON, "r", encoding="utf-8") as f:
-                text_data = json.load(f)["text_chunks"]
-            with open(TABLES_OUTPUT_JSON, "r", encoding="utf-8") as f:
-                table_data = json.load(f)["tables"]
+            if OUTPUT_FORMAT == "jsonl":
+                paths = {"text": TEXT_OUTPUT_JSONL, "table": TABLES_OUTPUT_JSONL}
+                for path in paths.values():
+                    if not os.path.exists(path): raise FileNotFoundError(path)
+                start = {path: checkpoint.get(path) if resume else 0 for path in paths.values()}
+                for path, lines in start.items():
+                    if lines: logger.info("⏩ Resuming '%s' from line %d.", path, lines)
+                streams = {data_type: iter_elements(path, start_line=start[path]) for data_type, path in paths.items()}
+                on_progress = {
+                    data_type: (lambda lines, path=path: checkpoint.set(path, start[path] + lines))
+                    for data_type, path in paths.items()
+                }
+            else:
+                text_data, table_data = self._load_json_outputs()
+                streams = {"text": text_data, "table": table_data}
         except (FileNotFoundError, KeyError) as e:
-            print(f"❌ Error loading data: {e}. Run processing first.")
+            logger.error("❌ Error loading data: %s. Run processing first.", e)
             return
 
-        self._embed_and_insert(self.text_col, text_data, "text")
-        self._embed_and_insert(self.table_col, table_data, "table")
+        with telemetry.correlation(prefix="ingest-", inherit=True), telemetry.span("ingest"):
+            self.connect()  # May drop manifest entries of recreated collections; load the manifest after it.
+            self._ingest(streams, DocumentManifest(), reconcile=not resume, on_progress=on_progress)
+
+        if self.embedding_cache:
+            self.embedding_cache.flush()
+            stats = self.embedding_cache.stats()
+            logger.info("🗄 Embedding cache: %d hits, %d misses (%.0f%% hit rate)",
+                        stats["hits"], stats["misses"], 100 * stats["hit_rate"])
         self.print_status()
 
-    def _create_indexes_if_needed(self):
-        """Creates indexes for collections if they don't exist."""
-        print("\\n🏗 Creating indexes for collections (if they don't exist)...")
-        index_params = {"metric_type": "L2", "index_type": "IVF_FLAT", "params": {"nlist": 128}}
-        for col in [self.text_col, self.table_col]:
-            if not col.has_index():
-                col.create_index(field_name="embedding", index_params=index_params)
-                print(f"✅ Index created for '{col.name}'.")
+    def ingest_output(self, source, text_path, tables_path, manifest, writer, content_hash=None, path=None):
+        """Ingests one document's JSONL outputs through a shared writer (used by batch ingestion).
+
+        Returns the number of rows written.
+        """
+        streams = {"text": iter_elements(text_path), "table": iter_elements(tables_path)}
+        with telemetry.correlation(prefix="doc-", inherit=True), telemetry.span("ingest", source=source):
+            return self._ingest(streams, manifest, sources=[source], content_hash=content_hash, path=path, writer=writer)
+
+    def sync_document(self, source, elements, manifest, content_hash=None, path=None):
+        """Brings the stored chunks of one document in line with its freshly processed `elements`.
+
+        `elements` may be a lazy iterator that parses as it is read (see `process_file`): text
+        chunks are then embedded while later pages are parsed, and the (far fewer) tables
+        met on the way wait for the table pass.
+        """
+        streams = _split_by_type(elements, DATA_TYPES)
+        with telemetry.correlation(prefix="doc-", inherit=True), telemetry.span("ingest", source=source):
+            self._ingest(streams, manifest, sources=[source], content_hash=content_hash, path=path)
+
+    def delete_document(self, source, manifest):
+        """Deletes every stored chunk of `source` and drops it from the manifest.
+
+        A document with its own partition is deleted by dropping the partition; older documents
+        in the default partition are deleted by primary key.
+        """
+        for data_type in DATA_TYPES:
+            col = self._collection_for(data_type)
+            if not self._drop_source_partition(col, source):
+                self._delete_ids(col, self._stored_ids(manifest, source, data_type))
+        manifest.remove(source)
+        manifest.save()
+
+    def _drop_source_partition(self, col, source):
+        """Drops `source`'s partition of `col`; returns False if it has none."""
+        name = partition_name(source)
+        if not PARTITION_BY_SOURCE or name not in self._partitions(col, refresh=True):
+            return False
+        with telemetry.span("drop_partition", collection=col.name):
+            col.partition(name).release()
+            col.drop_partition(name)
+            # Chunks ingested before the document had a partition
+            col.delete(f"source == {json.dumps(source, ensure_ascii=False)}", partition_name=DEFAULT_PARTITION)
+        with self._partition_lock:
+            self._partition_names.get(col.name, set()).discard(name)
+        telemetry.count("partitions_dropped")
+        logger.info("🗑 Dropped partition '%s' of '%s' ('%s').", name, col.name, source)
+        return True
+
+    def _create_indexes_if_needed(self, cols):
+        """Creates indexes, sized to each collection, for collections that don't have one."""
+        logger.debug("🏗 Creating indexes for collections (if they don't exist)...")
+        for col in cols:
+            if self.indexes.ensure(col):
+                self._loaded.discard(col.name)
             else:
-                print(f"✅ Index already exists for '{col.name}'.")
-
-    def retrieve(self, query, top_k=5):
-        """Searches collections and returns re-ranked results."""
-        query_vec = self.encoder.encode(query).tolist()
-        self.text_col.load()
-        self.table_col.load()
-        search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-        
-        text_results = self.text_col.search([query_vec], "embedding", search_params, limit=top_k, output_fields=["source", "page_no", "type", "content"])
-        table_results = self.table_col.search([query_vec], "embedding", search_params, limit=top_k, output_fields=["source", "page_no", "type", "content"])
-        
-        combined = { (res.entity.get("source"), res.entity.get("page_no")): res for res_list in [text_results, table_results] for res in res_list[0] }
-        return sorted(list(combined.values()), key=lambda x: x.distance)
-
-    def rag_answer(self, query):
-        """Performs the full RAG pipeline: retrieve, prompt, and generate."""
-        retrieved_hits = self.retrieve(query, top_k=5)
-        if not retrieved_hits:
-            return "I could not find relevant information to answer your question.", []
+                logger.debug("✅ Index already exists for '%s'.", col.name)
+            self._create_scalar_indexes(col)
+
+    def _create_scalar_indexes(self, col):
+        """Creates INVERTED indexes on the SCALAR_INDEX_FIELDS that filters test, so filtered searches stay cheap."""
+        existing = {index.field_name for index in col.indexes}
+        for field in SCALAR_INDEX_FIELDS:
+            if field in existing:
+                continue
+            try:
+                with telemetry.span("create_scalar_index", collection=col.name, field=field):
+                    col.create_index(field_name=field, index_params={"index_type": "INVERTED"}, index_name=f"{field}_idx")
+                self._loaded.discard(col.name)
+                logger.info("🏗 Created scalar index on '%s.%s'.", col.name, field)
+            except Exception as e:
+                logger.warning("⚠️ Could not index '%s.%s' (%s); filters on it will scan.", col.name, field, e)
+
+    def _ensure_loaded(self, cols=None):
+        """Loads collections into memory once; they are only reloaded after their index changes."""
+        for col in cols or self.connect().values():
+            if col.name not in self._loaded:
+                col.load()
+                self._loaded.add(col.name)
+
+    def _search(self, query_vecs, top_k, filters=None):
+        """Searches the collections concurrently with one multi-vector request each.
+
+        `filters` (see src/search_filters.py) restrict the collections searched by type, the
+        partitions searched by source, and the hits by a boolean expression on `source` and `page_no`.
+        Returns one re-ranked hit list per query vector.
+        """
+        self._ensure_loaded()
+        vectors = [vec.tolist() for vec in query_vecs]
+        filters = filters or {}
+        expr = filter_expression(filters) or None
+
+        def search(col):
+            partitions = self._search_partitions(col, filters.get("sources"))
+            with telemetry.span("search", collection=col.name, queries=len(vectors), filtered=bool(filters)):
+                return col.search(vectors, "embedding", self.indexes.search_params(col, top_k), limit=top_k,
+                                  expr=expr, partition_names=partitions,
+                                  output_fields=["source", "page_no", "type", "content"])
+
+        cols = [self._collection_for(data_type) for data_type in filters.get("types", DATA_TYPES)]
+        futures = [telemetry.submit(self._search_pool, search, col) for col in cols]
+        col_results = [future.result() for future in futures]
 
-        context_block = "\\n\\n---\\n\\n".join([hit.entity.get("content", "") for hit in retrieved_hits])
-        prompt = (
+        results = []
+        for hit_lists in zip(*col_results):
+            combined = {}
+            for res in sorted([hit for hits in hit_lists for hit in hits], key=lambda x: x.distance):
+                combined.setdefault(self._hit_key(res), res)
+            results.append(list(combined.values()))
+        return results
+
+    @staticmethod
+    def _hit_key(hit):
+        """Key under which search hits are deduplicated: each chunk on its own, except that the row
+        groups of one table collapse into the closest one (they are reassembled for the prompt)."""
+        if hit.entity.get("type") == "table":
+            table = loads_table(hit.entity.get("content", ""))
+            if table and "part" in table:
+                return ("table", hit.entity.get("source"), hit.entity.get("page_no"), table["table_id"])
+        return (hit.entity.get("type"), hit.id)
+
+    def retrieve(self, query, top_k=5, filters=None):
+        """Searches collections and returns re-ranked results, optionally restricted by `filters`."""
+        return self.retrieve_many([query], top_k=top_k, filters=filters)[0]
+
+    def retrieve_many(self, queries, top_k=5, filters=None):
+        """Retrieves results for several queries with one encoder call and one search per collection."""
+        return self.retrieve_with_vectors(queries, top_k=top_k, filters=filters)[1]
+
+    def retrieve_with_vectors(self, queries, top_k=5, filters=None):
+        """Like `retrieve_many`, but returns (query_vecs, hit lists) so callers can reuse the embeddings."""
+        if not queries: return [], []
+        filters = normalize_filters(filters)
+        self.warm_up()
+        telemetry.count("queries", len(queries))
+        with telemetry.span("retrieve", queries=len(queries), filtered=bool(filters)):
+            query_vecs = self._encode(list(queries))
+            return list(query_vecs), self._search(query_vecs, top_k, filters)
+
+    def list_sources(self):
+        """Names of the ingested documents, for building source filters."""
+        return sorted(DocumentManifest().sources())
+
+    def _table_parts(self, source, page_no, table_id):
+        """Returns every stored row group of `table_id` on page `page_no` of `source`."""
+        rows = self.table_col.query(f"source == {json.dumps(source)} and page_no == {int(page_no)}",
+                                    output_fields=["content"])
+        return [part for part in (loads_table(row["content"]) for row in rows)
+                if part and part.get("table_id") == table_id]
+
+    @staticmethod
+    def _hit_block(hit):
+        """Returns the context block of one hit as stored: a dict with `text`, or `table` for a table (group)."""
+        content = hit.entity.get("content", "")
+        block = {"source": hit.entity.get("source"), "page_no": hit.entity.get("page_no", 0),
+                 "type": hit.entity.get("type")}
+        table = loads_table(content) if hit.entity.get("type") == "table" else None
+        return dict(block, text=content) if table is None else dict(block, table=table)
+
+    def _context_blocks(self, hits):
+        """Returns the context blocks for `hits`, best first: dicts with `text` or a compact `table`.
+
+        A hit that is one row group of a larger table is replaced by the whole table when it
+        fits TABLE_REASSEMBLE_MAX_TOKENS, and later groups of a table already included are dropped.
+        """
+        blocks, included = [], set()
+        for hit in hits:
+            block = self._hit_block(hit)
+            table = block.pop("table", None)
+            if table is None:
+                blocks.append(block)
+                continue
+            if "part" in table:
+                key = (hit.entity.get("source"), hit.entity.get("page_no"), table["table_id"])
+                if key in included:
+                    continue
+                with telemetry.span("reassemble_table"):
+                    full = reassemble_table(self._table_parts(*key))
+                if full is not None and count_tokens(render_table(full)) <= TABLE_REASSEMBLE_MAX_TOKENS:
+                    included.add(key)
+                    table = full
+            blocks.append(dict(block, table={"columns": table["columns"], "rows": table["rows"]}))
+        return blocks
+
+    def _pack_context(self, query, hits):
+        """Returns the prompt texts for `hits`, packed into CONTEXT_MAX_TOKENS (see src/context_packing.py)."""
+        blocks = self._context_blocks(hits)
+        if not CONTEXT_PACKING_ENABLED:
+            return [render_block(block) for block in blocks]
+        with telemetry.span("pack_context") as attrs:
+            # Savings are measured against the chunks as retrieved, before tables were reassembled.
+            tokens_in = sum(count_tokens(render_block(self._hit_block(hit))) for hit in hits)
+            texts, stats = pack_context(query, blocks, tokens_in=tokens_in)
+            attrs.update(stats)
+        telemetry.count("context_tokens", stats["tokens_out"])
+        telemetry.count("context_tokens_saved", stats["tokens_saved"])
+        logger.info("📦 Context packed from %d to %d tokens (%d saved), %d of %d blocks.", stats["tokens_in"],
+                    stats["tokens_out"], stats["tokens_saved"], stats["blocks_out"], stats["blocks_in"])
+        return texts
+
+    def _build_prompt(self, query, hits):
+        """Builds the grounded prompt from the retrieved hits."""
+        context_block = "\\n\\n---\\n\\n".join(self._pack_context(query, hits))
+        return (
             "You are an expert AI assistant. Use only the provided context to answer the user's question. "
             "If the context doesn't contain the answer, state that you cannot answer. "
             f"--- CONTEXT ---\\n{context_block}\\n\\n--- END CONTEXT ---\\n\\n"
             f"Question: {query}\\nAnswer:"
         )
-        
-        load_dotenv()
-        api_key = os.getenv("MISTRAL_API_KEY")
-        if not api_key: raise ValueError("MISTRAL_API_KEY not found in .env file.")
-        
-        client = Mistral(api_key=api_key)
-        print("🤖 Generating answer with Mistral AI...")
-        response = client.chat.complete(model="mistral-small-latest", messages=[{"role": "user", "content": prompt}], temperature=0.1)
-        print("✅ Answer generated.")
-        
-        retrieved_chunks = [{
+
+    @staticmethod
+    def _format_chunks(hits):
+        """Converts search hits into the chunk dicts returned to callers."""
+        return [{
             "content": hit.entity.get("content", ""), "source": hit.entity.get("source", "unknown"),
             "page_no": hit.entity.get("page_no", 0), "similarity_score": 1 - hit.distance,
-            "type": hit.entity.get("type", "unknown")} for hit in retrieved_hits]
-        
-        return response.choices[0].message.content.strip(), retrieved_chunks
+            "type": hit.entity.get("type", "unknown")} for hit in hits]
+
+    def _prepare_answer(self, query, retrieved=None, filters=None):
+        """Retrieves context for `query`, restricted by `filters`, and checks the answer cache.
+
+        `retrieved` is an optional (query_vec, hits) pair from an earlier, e.g. batched, retrieval.
+        Returns (query_vec, hits, retrieved_chunks, context_ids, cached_answer).
+        """
+        if retrieved is None:
+            query_vecs, hits = self.retrieve_with_vectors([query], top_k=5, filters=filters)
+            query_vec, retrieved_hits = query_vecs[0], hits[0]
+        else:
+            query_vec, retrieved_hits = retrieved
+        retrieved_chunks = self._format_chunks(retrieved_hits)
+        context_ids = [hit.id for hit in retrieved_hits]
+        cached = None
+        if retrieved_hits and self.answer_cache:
+            cached = self.answer_cache.get(query, query_vec, context_ids)
+            if cached is not None:
+                telemetry.count("answer_cache_hits")
+                logger.info("⚡ Answer served from cache.")
+        return query_vec, retrieved_hits, retrieved_chunks, context_ids, cached
+
+    def rag_answer(self, query, retrieved=None, filters=None):
+        """Performs the full RAG pipeline: retrieve, prompt, and generate.
+
+        Answers are cached per (query, retrieved chunk IDs); repeated or near-identical
+        questions over unchanged context skip the LLM call. Pass `retrieved` as a
+        (query_vec, hits) pair to skip retrieval, or `filters` to restrict it.
+        """
+        with telemetry.correlation(prefix="q-", inherit=True):
+            query_vec, retrieved_hits, retrieved_chunks, context_ids, cached = self._prepare_answer(
+                query, retrieved, filters)
+            if not retrieved_hits:
+                return NO_CONTEXT_ANSWER, []
+            if cached is not None:
+                return cached, retrieved_chunks
+
+            logger.info("🤖 Generating answer with Mistral AI...")
+            with telemetry.span("llm"):
+                answer = self.generator.complete(self._build_prompt(query, retrieved_hits))
+            logger.info("✅ Answer generated.")
+
+            if self.answer_cache:
+                self.answer_cache.put(query, query_vec, context_ids, answer)
+            return answer, retrieved_chunks
+
+    def rag_answer_stream(self, query, retrieved=None, filters=None):
+        """Streaming variant of `rag_answer`.
+
+        Returns (tokens, retrieved_chunks) right after retrieval; `tokens` yields the answer
+        text as the LLM produces it.
+        """
+        with telemetry.correlation(prefix="q-", inherit=True) as correlation_id:
+            query_vec, retrieved_hits, retrieved_chunks, context_ids, cached = self._prepare_answer(
+                query, retrieved, filters)
+        if not retrieved_hits:
+            return iter([NO_CONTEXT_ANSWER]), []
+        if cached is not None:
+            return iter([cached]), retrieved_chunks
+
+        def tokens():
+            parts = []
+            with telemetry.correlation(correlation_id), telemetry.span("llm", stream=True):
+                start = time.perf_counter()
+                for token in self.generator.stream(self._build_prompt(query, retrieved_hits)):
+                    if not parts:
+                        telemetry.observe("llm_first_token", time.perf_counter() - start)
+                    parts.append(token)
+                    yield token
+            if self.answer_cache:
+                self.answer_cache.put(query, query_vec, context_ids, "".join(parts).strip())
+
+        return tokens(), retrieved_chunks
 
     def print_status(self):
-        """Prints the number of entities in each collection."""
-        self.text_col.flush()
-        self.table_col.flush()
-        print("\\n" + "="*50)
-        print("📊 Collection Status:")
-        print(f"  - Entities in '{self.text_col.name}': {self.text_col.num_entities}")
-        print(f"  - Entities in '{self.table_col.name}': {self.table_col.num_entities}")
-        print("="*50)
\ No newline at end of file
+        """Logs the number of entities in each collection."""
+        self.flush()
+        logger.info("📊 Collection status: '%s' has %d entities, '%s' has %d entities.",
+                    self.text_col.name, self.text_col.num_entities, self.table_col.name, self.table_col.num_entities)
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""The Mistral generator against the offline fake server (src/fake_llm_server.py)."""
+import json
+import urllib.request
+
+import pytest
+
+from src.fake_llm_server import start_fake_llm_server
+from src.llm import FakeGenerator, MistralGenerator
+
+PROMPT = "--- CONTEXT ---\nPixtral 12B pairs a 400M vision encoder with a 12B decoder.\n--- END CONTEXT ---\nQuestion: ?"
+ANSWER = "Pixtral 12B pairs a 400M vision encoder with a 12B decoder."
+
+@pytest.fixture
+def fake_server():
+    server, url = start_fake_llm_server(generator=FakeGenerator(token_delay=0.001))
+    yield url
+    server.shutdown()
+    server.server_close()
+
+def _post(url, payload):
+    request = urllib.request.Request(f"{url}/v1/chat/completions", data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=10)
+
+def test_completion_response(fake_server):
+    with _post(fake_server, {"model": "fake", "messages": [{"role": "user", "content": PROMPT}]}) as response:
+        body = json.load(response)
+    assert body["object"] == "chat.completion"
+    assert body["choices"][0]["message"]["content"] == ANSWER
+
+def test_streamed_response(fake_server):
+    payload = {"model": "fake", "stream": True, "messages": [{"role": "user", "content": PROMPT}]}
+    with _post(fake_server, payload) as response:
+        events = [line[len(b"data: "):].decode("utf-8").strip() for line in response if line.startswith(b"data: ")]
+    assert events[-1] == "[DONE]"
+    deltas = [json.loads(event)["choices"][0]["delta"].get("content", "") for event in events[:-1]]
+    assert len(deltas) > 2
+    assert "".join(deltas) == ANSWER
+
+def test_mistral_generator_complete_and_stream(fake_server, monkeypatch):
+    pytest.importorskip("mistralai")
+    monkeypatch.setenv("MISTRAL_API_KEY", "fake")
+    generator = MistralGenerator(server_url=fake_server)
+    assert generator.complete(PROMPT) == ANSWER
+    tokens = list(generator.stream(PROMPT))
+    assert len(tokens) > 2
+    assert "".join(tokens) == ANSWER
@@ -0,0 +1,110 @@
+"""Ingestion and retrieval against the embedded vector store (src/local_store.py), fully offline."""
+import pandas as pd
+import pytest
+
+from benchmark.run_benchmark import HashingEncoder
+from src.llm import FakeGenerator
+from src.manifest import DocumentManifest
+from src.processing_pipeline import create_elements_with_metadata
+from src.table_utils import loads_table
+from src.vector_db import MilvusManager
+
+PARAGRAPHS = {
+    "a/report.pdf": ["Pixtral 12B pairs a vision encoder with a multimodal decoder.",
+                     "The vision encoder was trained from scratch on image and text pairs.",
+                     "Pixtral processes images at their native resolution and aspect ratio."],
+    "b/report.pdf": ["Mistral Large handles long documents in a single context window.",
+                     "Function calling lets the model return structured arguments.",
+                     "The release notes list the supported languages."],
+}
+BENCHMARKS = pd.DataFrame({
+    "benchmark": [f"benchmark-{i}" for i in range(120)],
+    "score": [f"{50 + i % 40}.{i % 10}" for i in range(120)],
+    "notes": ["measured with greedy decoding on the public test split"] * 120,
+})
+
+class CountingEncoder(HashingEncoder):
+    """Records how many texts were embedded."""
+
+    def __init__(self):
+        super().__init__()
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return super().encode(texts, **kwargs)
+
+def _elements(source, paragraphs, tables=()):
+    chunks = [{"text": text, "token_count": len(text.split())} for text in paragraphs]
+    return create_elements_with_metadata(chunks, list(tables), source, source=source)
+
+def _sources(hits):
+    return {hit.entity.get("source") for hit in hits}
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The store, caches and manifest live under relative paths
+    manager = MilvusManager(generator=FakeGenerator(), backend="local", encoder=CountingEncoder())
+    manifest = DocumentManifest()
+    table = {"content": BENCHMARKS, "metadata": {"page_number": 3, "table_index_on_page": 1}}
+    manager.sync_document("a/report.pdf", _elements("a/report.pdf", PARAGRAPHS["a/report.pdf"], [table]), manifest)
+    manager.sync_document("b/report.pdf", _elements("b/report.pdf", PARAGRAPHS["b/report.pdf"]), manifest)
+    manager.flush()
+    return manager
+
+def test_ingest_and_retrieve(manager):
+    hits = manager.retrieve("Pixtral vision encoder", top_k=3)
+    assert hits and hits[0].entity.get("source") == "a/report.pdf"
+    assert manager.list_sources() == ["a/report.pdf", "b/report.pdf"]
+
+def test_filters(manager):
+    assert _sources(manager.retrieve("Pixtral vision encoder", top_k=5, filters={"sources": "b/report.pdf"})) == {"b/report.pdf"}
+    tables = manager.retrieve("benchmark score", top_k=5, filters={"types": "table"})
+    assert tables and {hit.entity.get("type") for hit in tables} == {"table"}
+    pages = manager.retrieve("benchmark score", top_k=5, filters={"page_min": 3, "page_max": 3})
+    assert pages and {hit.entity.get("page_no") for hit in pages} == {3}
+
+def test_delete_document(manager):
+    manager.delete_document("a/report.pdf", DocumentManifest())
+    manager.flush()
+    assert manager.list_sources() == ["b/report.pdf"]
+    for col in (manager.text_col, manager.table_col):
+        assert not col.query('source == "a/report.pdf"', output_fields=["source"])
+    assert _sources(manager.retrieve("Pixtral vision encoder", top_k=5)) == {"b/report.pdf"}
+
+def test_resync_only_embeds_changed_chunks(manager):
+    paragraphs = PARAGRAPHS["b/report.pdf"][:2] + ["The release notes now cover tokenizer changes."]
+    before = manager.encoder.encoded
+    manager.sync_document("b/report.pdf", _elements("b/report.pdf", paragraphs), DocumentManifest())
+    manager.flush()
+    assert manager.encoder.encoded - before == 1
+    stored = {row["content"] for row in manager.text_col.query('source == "b/report.pdf"', output_fields=["content"])}
+    assert stored == set(paragraphs)
+
+def test_chunks_from_one_page_are_all_retrieved(manager):
+    paragraphs = ["Pixtral tiles each image into patches of sixteen pixels.",
+                  "Pixtral separates image rows with a break token."]
+    chunks = [{"text": text, "token_count": len(text.split()), "metadata": {"page_number": 2}} for text in paragraphs]
+    manager.sync_document("d/dense.pdf", create_elements_with_metadata(chunks, [], "d/dense.pdf", source="d/dense.pdf"),
+                          DocumentManifest())
+    manager.flush()
+    hits = manager.retrieve("Pixtral image", top_k=5, filters={"sources": "d/dense.pdf"})
+    assert sorted(hit.entity.get("content") for hit in hits) == sorted(paragraphs)
+    assert {hit.entity.get("page_no") for hit in hits} == {2}
+
+def test_table_row_groups_are_reassembled(manager):
+    groups = manager.table_col.query('source == "a/report.pdf"', output_fields=["content"])
+    assert len(groups) > 1
+    hits = manager.retrieve("benchmark-7 score", top_k=5, filters={"types": "table"})
+    blocks = manager._context_blocks(hits)
+    assert len(blocks) == 1
+    assert blocks[0]["table"]["rows"] == loads_table(BENCHMARKS.to_dict(orient="records"))["rows"]
+
+def test_office_table_row_groups_are_reassembled(manager):
+    # docx/pptx tables have no page; their row groups must still be found together.
+    manager.sync_document("c/slides.pptx", _elements("c/slides.pptx", [], [BENCHMARKS]), DocumentManifest())
+    manager.flush()
+    hits = manager.retrieve("benchmark-7 score", top_k=5, filters={"sources": "c/slides.pptx"})
+    blocks = manager._context_blocks(hits)
+    assert len(blocks) == 1
+    assert len(blocks[0]["table"]["rows"]) == len(BENCHMARKS)
@@ -0,0 +1,22 @@
+"""Adaptive OCR helpers (src/ocr.py) that need no OCR engine."""
+import fitz
+
+from src.ocr import _merge_regions, ocr_page_bytes
+
+def test_merge_regions_keeps_every_region_covered():
+    regions = [(fitz.Rect(x, y, x + 5, y + 5), 150 + x % 3 * 50) for x in range(0, 300, 20) for y in range(0, 200, 20)]
+    merged = _merge_regions(regions, max_regions=8)
+    assert len(merged) == 8
+    for rect, dpi in regions:
+        assert any(rect in box and dpi <= box_dpi for box, box_dpi in merged)
+
+def test_mixed_page_without_images_is_not_rendered(monkeypatch):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Pixtral pairs a vision encoder with a multimodal decoder.")
+
+    def render(*args, **kwargs):
+        raise AssertionError("page was rendered")
+
+    monkeypatch.setattr(fitz.Page, "get_pixmap", render)
+    assert ocr_page_bytes(page, images_only=True) is None
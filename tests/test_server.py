@@ -0,0 +1,28 @@
+"""HTTP request parsing of the query server (src/server.py)."""
+import asyncio
+
+import pytest
+
+from src.server import MAX_BODY_BYTES, HTTPError, QueryServer
+
+def _read(raw):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await QueryServer._read_request(reader)
+    return asyncio.run(read())
+
+def _post(content_length, body=b""):
+    return b"POST /retrieve HTTP/1.1\r\nContent-Length: " + content_length + b"\r\n\r\n" + body
+
+def test_reads_body():
+    assert _read(_post(b"2", b"{}")) == ("POST", "/retrieve", {"content-length": "2"}, b"{}")
+
+@pytest.mark.parametrize("content_length, status", [
+    (b"abc", 400), (b"-5", 400), (str(MAX_BODY_BYTES + 1).encode(), 413),
+])
+def test_rejects_bad_content_length(content_length, status):
+    with pytest.raises(HTTPError) as error:
+        _read(_post(content_length))
+    assert error.value.status == status
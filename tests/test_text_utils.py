@@ -0,0 +1,9 @@
+"""Streaming chunking (src/text_utils.py)."""
+from src.text_utils import StreamingChunker, count_tokens
+
+def test_chunk_starting_at_a_block_boundary_gets_that_blocks_tag():
+    first, second = "Pixtral pairs a vision encoder with a decoder.", "The encoder was trained from scratch."
+    # The second chunk starts with the token " The", whose space still lies in the first block.
+    chunker = StreamingChunker(count_tokens(first), 0)
+    chunks = chunker.add(first, (0, 10.0)) + chunker.add(second, (1, 20.0)) + chunker.finish()
+    assert [(chunk["text"].strip(), tag) for chunk, tag in chunks] == [(first, (0, 10.0)), (second, (1, 20.0))]